@@ -0,0 +1,132 @@
+"""
+Micro-batching of sentence-embedding requests.
+
+Each /analyze request encodes one or two short titles, and a forward pass on
+two titles costs almost as much as one on thirty. The request threads would
+also contend for torch's thread pool. `EmbeddingBatcher` therefore queues
+the texts of all threads. A single inference thread collects them for up to
+`max_wait_ms` (or until `max_batch` texts are waiting), encodes the batch in
+one call, and hands each caller its rows through a future:
+
+    batcher = EmbeddingBatcher(model_encode, max_batch=64, max_wait_ms=3)
+    emb = batcher.encode(['SONY WH-1000XM4', 'Sony WH-1000XM4 Headphones'])
+
+A caller waits at most `max_wait_ms` for its batch to form, plus the batch in
+progress and its own forward pass; `encode` also takes a timeout. Texts
+repeated within a batch are encoded once.
+
+The inference thread doesn't survive a fork, so with gunicorn's preload mode
+every batcher starts a new one in each worker after forking
+(`os.register_at_fork`), before any request thread exists.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Live batchers, restarted in forked children
+_batchers = weakref.WeakSet()
+
+
+class EmbeddingBatcher:
+    """Encodes texts from many threads in shared batches on one inference thread."""
+
+    def __init__(self, encode, max_batch=64, max_wait_ms=3.0, name='embedding'):
+        """
+        Args:
+            encode (callable): Batch encoder, list of texts -> (n, dim) array.
+            max_batch (int): Texts per forward pass; a batch is started as
+                             soon as this many are waiting.
+            max_wait_ms (float): Longest time the first text of a batch waits
+                                 for others.
+            name (str): Prefix of the counters and timings in /stats.
+        """
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._start()
+        _batchers.add(self)
+
+    def _start(self):
+        # Called again in a forked child, where the inference thread doesn't exist
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name=f'{self.name}-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """
+        Queues texts for encoding.
+
+        Returns:
+            Future: Resolves to an array of shape (len(texts), dim).
+        """
+        future = Future()
+        with self._cond:
+            self._queue.append((list(texts), future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def encode(self, texts, timeout=None):
+        """Encodes texts in the next batch and waits for the result."""
+        return self.submit(texts).result(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.perf_counter() + self.max_wait
+            while sum(len(texts) for texts, _, _ in self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, size = [], 0
+            while self._queue and (not batch or size + len(self._queue[0][0]) <= self.max_batch):
+                item = self._queue.popleft()
+                batch.append(item)
+                size += len(item[0])
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            unique = {}
+            for texts, _, _ in batch:
+                for text in texts:
+                    unique.setdefault(text, len(unique))
+            start = time.perf_counter()
+            try:
+                embeddings = np.asarray(self._encode(list(unique)) if unique else np.zeros((0, 0)))
+            except Exception as e:
+                logger.error(f'Batch encoding of {len(unique)} texts failed: {e}')
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            end = time.perf_counter()
+            for texts, future, queued in batch:
+                future.set_result(embeddings[[unique[text] for text in texts]])
+                metrics.observe(f'{self.name}.queue_wait', start - queued)
+            metrics.observe(f'{self.name}.forward', end - start)
+            metrics.incr(f'{self.name}.batches')
+            metrics.incr(f'{self.name}.requests', len(batch))
+            metrics.incr(f'{self.name}.texts', len(unique))
+
+
+def _after_fork():
+    for batcher in list(_batchers):
+        batcher._start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
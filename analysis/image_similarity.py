@@ -1,8 +1,50 @@
-import requests
+import logging
+
 from PIL import Image
 import imagehash
 from io import BytesIO
 
+from scraping import transport
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_image_hash(img_url):
+    """
+    Downloads an image and computes its perceptual hash (pHash).
+
+    Args:
+        img_url (str): The URL of the image.
+
+    Returns:
+        imagehash.ImageHash: The perceptual hash, or None if the URL is missing
+                             or the image can't be downloaded or decoded.
+    """
+    if not img_url:
+        return None
+    try:
+        resp = transport.get(img_url, timeout=10)
+        img = Image.open(BytesIO(resp.content)).convert('RGB')
+        return imagehash.phash(img)
+    except Exception as e:
+        logger.warning(f'Image download error: {e}')
+        return None
+
+
+def hash_similarity(hash1, hash2):
+    """
+    Similarity of two perceptual hashes, between 0 and 1 (1 = identical).
+
+    Returns 0.5 if either hash is missing.
+    """
+    if hash1 is None or hash2 is None:
+        return 0.5
+    # Calculate similarity based on hash difference
+    max_hash = len(hash1.hash) ** 2
+    dist = hash1 - hash2
+    return 1 - (dist / max_hash)
+
+
 def compute_image_similarity(img1_url, img2_url):
     """
     Computes the perceptual hash similarity between two images from URLs.
@@ -21,20 +63,7 @@ def compute_image_similarity(img1_url, img2_url):
     try:
         if not img1_url or not img2_url:
             return 0.5
-        resp1 = requests.get(img1_url, timeout=10)
-        resp2 = requests.get(img2_url, timeout=10)
-        img1 = Image.open(BytesIO(resp1.content)).convert('RGB')
-        img2 = Image.open(BytesIO(resp2.content)).convert('RGB')
-
-        # Compute perceptual hash for both images
-        hash1 = imagehash.phash(img1)
-        hash2 = imagehash.phash(img2)
-
-        # Calculate similarity based on hash difference
-        max_hash = len(hash1.hash) ** 2
-        dist = hash1 - hash2
-        sim = 1 - (dist / max_hash)
-        return sim
+        return hash_similarity(fetch_image_hash(img1_url), fetch_image_hash(img2_url))
     except Exception as e:
-        print(f'Image similarity error: {e}')
-        return 0.5 
\ No newline at end of file
+        logger.error(f'Image similarity error: {e}')
+        return 0.5
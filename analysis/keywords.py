@@ -0,0 +1,189 @@
+"""
+Keyword lexicons compiled into a single matcher.
+
+Each category is a text file in KEYWORD_LEXICON_DIR (data/lexicons/), one
+term per line, with '#' comments. The file name is the category:
+
+    data/lexicons/replica.txt      replica, first copy, 高仿, подделка, ...
+    data/lexicons/original.txt     original, authentic, 正品, असली, ...
+    data/lexicons/genuine.txt      genuine, 100%, warranty, garantía, ...
+
+All terms of all categories are merged into one trie and compiled into a
+single regular expression (each trie node becomes an alternation of its
+children's characters). A text is therefore scanned once, in C. The work at
+each position is bounded by the length of the longest term, not the number
+of terms, so the scan stays linear in the text as the lexicons grow:
+
+    keywords.counts('Replica watch, first copy', 'AAA quality, 1:1 copy')
+    # {'genuine': 0, 'original': 0, 'replica': 3}
+
+Text and terms are NFKC-normalised and case-folded, and runs of whitespace
+count as one space. In scripts that separate words with spaces (Latin,
+Cyrillic, Greek, Devanagari, ...), a term only matches whole words, so 'copy'
+doesn't match 'copyright'. A trailing '*' makes a term a prefix instead
+('подделк*' matches подделка, подделки, ...). Terms in Chinese, Japanese,
+Korean, Thai and Arabic, where words run together or take attached
+particles, match anywhere. Matches don't overlap, and the longest term at a
+position wins: 'not original' is a replica term, so it doesn't also count as
+'original'.
+"""
+import os
+import re
+import unicodedata
+
+DEFAULT_LEXICON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'lexicons')
+
+# Classifier features and the lexicon category each one flags
+FEATURE_CATEGORIES = {
+    'keyword_original': 'original',
+    'keyword_replica': 'replica',
+    'keyword_genuine': 'genuine',
+}
+
+def normalize(text):
+    """NFKC-normalised, case-folded text with whitespace runs as single spaces."""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return ' '.join(text.casefold().split())
+
+
+# Scripts whose terms match inside words (by Unicode character name prefix)
+_UNSPACED_SCRIPTS = ('CJK', 'HIRAGANA', 'KATAKANA', 'HALFWIDTH KATAKANA', 'HANGUL', 'THAI', 'LAO', 'KHMER',
+                     'MYANMAR', 'ARABIC')
+
+
+def _is_mark(char):
+    return unicodedata.category(char).startswith('M')
+
+
+# Word characters for the boundary checks: \w misses combining marks such as
+# Latin diacritics and Devanagari vowel signs and virama, which belong to the
+# word. The Indic blocks (Devanagari to Sinhala) count whole, except the dandas.
+_WORD = r'[\w\u0300-\u036f\u0483-\u0489\u0900-\u0963\u0966-\u0dff]'
+
+
+def _needs_boundary(char):
+    """Whether a term starting or ending with `char` must do so at a word boundary."""
+    if not (char.isalnum() or _is_mark(char)):
+        return False
+    return not unicodedata.name(char, '').startswith(_UNSPACED_SCRIPTS)
+
+
+def read_lexicon(path):
+    """The terms of a lexicon file (comments and blank lines skipped)."""
+    with open(path, encoding='utf-8') as f:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+
+
+def _trie_pattern(node):
+    """Regex for a trie node: its children's branches, then the end of a term at this node."""
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != '']
+    if '' in node:
+        # Terminal last, so that longer terms win; the value is the term's end condition
+        branches.append(node[''])
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:' + '|'.join(branches) + ')'
+
+
+class KeywordMatcher:
+    """Counts lexicon terms per category in one pass over the text."""
+
+    def __init__(self, lexicons):
+        """
+        Args:
+            lexicons (dict): Category -> iterable of terms.
+        """
+        self.categories = sorted(lexicons)
+        # Normalised term -> categories it belongs to, and the terms ending in '*'
+        self.terms = {}
+        prefixes = set()
+        for category, terms in lexicons.items():
+            for term in terms:
+                term = normalize(term).strip()
+                if term.endswith('*'):
+                    term = term[:-1].rstrip()
+                    prefixes.add(term)
+                if term:
+                    self.terms.setdefault(term, set()).add(category)
+        self.prefixes = prefixes
+        self.pattern = self._compile(self.terms, prefixes)
+
+    @classmethod
+    def from_dir(cls, path=DEFAULT_LEXICON_DIR):
+        """A matcher for every *.txt lexicon in a directory (none if it's missing)."""
+        lexicons = {}
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.txt'):
+                    lexicons[name[:-4]] = read_lexicon(os.path.join(path, name))
+        return cls(lexicons)
+
+    @staticmethod
+    def _compile(terms, prefixes=()):
+        if not terms:
+            return None
+        # One trie for terms that must start at a word boundary, one for the rest
+        tries = ({}, {})
+        for term in terms:
+            node = tries[_needs_boundary(term[0])]
+            for char in term:
+                node = node.setdefault(char, {})
+            node[''] = f'(?!{_WORD})' if _needs_boundary(term[-1]) and term not in prefixes else ''
+        parts = []
+        if tries[True]:
+            parts.append(f'(?<!{_WORD})' + _trie_pattern(tries[True]))
+        if tries[False]:
+            parts.append(_trie_pattern(tries[False]))
+        return re.compile('|'.join(parts))
+
+    def matches(self, *texts):
+        """
+        The terms found in the texts, in order (repeats included). For a
+        prefix term, the match is the prefix, without the rest of the word.
+        """
+        if self.pattern is None:
+            return []
+        # Joined by a newline, so that no term spans two texts
+        text = '\n'.join(normalize(t) for t in texts if t)
+        return self.pattern.findall(text)
+
+    def counts(self, *texts):
+        """
+        Counts matches per category in one scan of all the texts.
+
+        Returns:
+            dict: Category -> number of matches (every category is present).
+        """
+        counts = dict.fromkeys(self.categories, 0)
+        for term in self.matches(*texts):
+            for category in self.terms[term]:
+                counts[category] += 1
+        return counts
+
+    def flags(self, *texts):
+        """Category -> whether any of its terms occurs in the texts."""
+        return {category: count > 0 for category, count in self.counts(*texts).items()}
+
+
+def _default_matcher():
+    from config import Config
+    return KeywordMatcher.from_dir(Config.KEYWORD_LEXICON_DIR)
+
+
+keywords = _default_matcher()
+
+
+def keyword_features(title, description):
+    """
+    The classifier's keyword features of a product.
+
+    Returns:
+        dict: The FEATURE_CATEGORIES features (1 if any term of the category
+              occurs in the title or description, else 0) and `keyword_counts`.
+    """
+    counts = keywords.counts(title, description)
+    features = {feature: int(counts.get(category, 0) > 0) for feature, category in FEATURE_CATEGORIES.items()}
+    features['keyword_counts'] = counts
+    return features
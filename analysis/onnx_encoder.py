@@ -0,0 +1,151 @@
+"""
+ONNX Runtime backend for the all-MiniLM-L6-v2 sentence embedding model.
+
+The encoder only needs `onnxruntime`, `tokenizers` and `numpy` at runtime, so
+workers using it never import torch. Exporting the model (and optionally
+quantizing it to int8) still needs torch and sentence-transformers, but that
+is a one-off step:
+
+    python -m analysis.onnx_encoder --out models/minilm-onnx --quantize
+"""
+import argparse
+import os
+from typing import List, Sequence
+
+import numpy as np
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+FP32_FILE = 'model.onnx'
+INT8_FILE = 'model.int8.onnx'
+TOKENIZER_FILE = 'tokenizer.json'
+# all-MiniLM-L6-v2 truncates inputs to 256 word pieces
+MAX_SEQ_LENGTH = 256
+
+
+class OnnxSentenceEncoder:
+    """
+    Sentence encoder running an exported MiniLM model through ONNX Runtime.
+
+    Produces the same mean-pooled, L2-normalised embeddings as
+    `SentenceTransformer('all-MiniLM-L6-v2').encode`.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, num_threads: int = 0):
+        """
+        Args:
+            model_dir (str): Directory written by `export_model`.
+            quantized (bool): Use the int8 model if it was exported.
+            num_threads (int): Intra-op threads for onnxruntime, 0 for its default.
+        """
+        from tokenizers import Tokenizer
+
+        model_file = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if quantized and not os.path.exists(model_file):
+            # Only the fp32 model was exported
+            model_file = os.path.join(model_dir, FP32_FILE)
+        self.model_file = model_file
+        self.reset_session(num_threads)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+    def reset_session(self, num_threads: int = 0) -> None:
+        """(Re)creates the inference session, e.g. in a freshly forked worker."""
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.model_file, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Encodes texts into normalised embeddings.
+
+        Args:
+            texts (Sequence[str]): Texts to encode.
+            batch_size (int): Number of texts tokenized and run per forward pass.
+
+        Returns:
+            np.ndarray: A float32 array of shape (len(texts), 384).
+        """
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feed = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in self.input_names:
+                feed['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            token_embeddings = self.session.run(None, feed)[0]
+
+            # Mean pooling over non-padding tokens, then L2 normalisation
+            mask = attention_mask[:, :, None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            chunks.append(pooled / np.clip(norms, 1e-12, None))
+        if not chunks:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.vstack(chunks).astype(np.float32)
+
+
+def export_model(out_dir: str, quantize: bool = True, model_name: str = MODEL_NAME) -> List[str]:
+    """
+    Exports the SentenceTransformer transformer to ONNX, optionally with an
+    int8 dynamically-quantized copy.
+
+    Args:
+        out_dir (str): Output directory.
+        quantize (bool): Also write an int8 model.
+        model_name (str): SentenceTransformer model to export.
+
+    Returns:
+        list: Paths of the written model files.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(out_dir)
+
+    dummy = tokenizer(['an example product title'], return_tensors='pt')
+    input_names = ['input_ids', 'attention_mask', 'token_type_ids']
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (dummy['input_ids'], dummy['attention_mask'], dummy['token_type_ids']),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,  # first opset with a LayerNormalization op
+        )
+    written = [fp32_path]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.join(out_dir, INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        written.append(int8_path)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the sentence embedding model to ONNX.')
+    parser.add_argument('--out', default=os.path.join('models', 'minilm-onnx'), help='output directory')
+    parser.add_argument('--quantize', action='store_true', help='also write an int8 quantized model')
+    parser.add_argument('--model', default=MODEL_NAME, help='SentenceTransformer model name')
+    args = parser.parse_args()
+    for path in export_model(args.out, quantize=args.quantize, model_name=args.model):
+        print(f'Wrote {path}')
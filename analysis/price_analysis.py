@@ -1,5 +1,9 @@
+import logging
+
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 def compute_price_deviation(product_price, reference_prices):
     """
     Computes the percentage deviation of product price from reference prices.
@@ -27,5 +31,5 @@ def compute_price_deviation(product_price, reference_prices):
         return min(deviation, 2.0)  # Cap at 200% deviation
         
     except (ValueError, TypeError) as e:
-        print(f"Error in price analysis: {e}")
+        logger.error(f"Error in price analysis: {e}")
         return 0.0
\ No newline at end of file
@@ -1,28 +1,85 @@
-from sentence_transformers import SentenceTransformer, util
-import spacy
-
-# Attempt to load the SentenceTransformer model for semantic similarity.
-# This model provides a more sophisticated understanding of text meaning.
-try:
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-except Exception:
-    # If the model fails to load (e.g., no internet connection, model not found),
-    # we will fall back to a simpler similarity method using spaCy.
-    model = None
-
-# Load a blank English spaCy model. This will be used as a fallback
-# for text similarity if the SentenceTransformer model is not available.
-# We are using a blank model because we primarily need its tokenization
-# and vector capabilities for similarity calculation.
-nlp = spacy.blank('en')
+import logging
+
+import numpy as np
+
+from analysis.embedding_batcher import EmbeddingBatcher
+from analysis.lite_similarity import LiteSimilarity
+from config import Config
+
+# Inference backend for sentence embeddings. With the 'onnx' backend the exported
+# (optionally int8-quantized) model runs through onnxruntime and torch is never
+# imported. The PyTorch SentenceTransformer remains the fallback. With 'lite'
+# no model is loaded at all (see below).
+backend = None
+onnx_encoder = None
+model = None
+
+if Config.TEXT_SIM_BACKEND == 'onnx':
+    try:
+        from analysis.onnx_encoder import OnnxSentenceEncoder
+        onnx_encoder = OnnxSentenceEncoder(
+            Config.ONNX_MODEL_DIR,
+            quantized=Config.ONNX_QUANTIZED,
+            num_threads=Config.ONNX_NUM_THREADS,
+        )
+        backend = 'onnx'
+    except Exception as e:
+        logging.warning(f'ONNX text backend unavailable, falling back to PyTorch: {e}')
+
+if onnx_encoder is None and Config.TEXT_SIM_BACKEND != 'lite':
+    # Attempt to load the SentenceTransformer model for semantic similarity.
+    # This model provides a more sophisticated understanding of text meaning.
+    try:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer('all-MiniLM-L6-v2')
+        backend = 'torch'
+    except Exception as e:
+        # If the model fails to load (e.g., no internet connection, model not found),
+        # we will fall back to the model-free lite similarity.
+        logging.warning(f'SentenceTransformer unavailable, using the lite text similarity: {e}')
+        model = None
+
+def _encode_batch(texts):
+    if onnx_encoder is not None:
+        return onnx_encoder.encode(texts)
+    return model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+
+# Concurrent requests' texts are encoded together (see analysis/embedding_batcher.py)
+batcher = None
+if backend is not None and Config.EMBED_BATCHING:
+    batcher = EmbeddingBatcher(_encode_batch, max_batch=Config.EMBED_MAX_BATCH, max_wait_ms=Config.EMBED_MAX_WAIT_MS)
+
+# Character n-gram TF-IDF similarity (see analysis/lite_similarity.py): the
+# 'lite' backend, and the fallback when no embedding model is loaded
+lite = LiteSimilarity.from_csv()
+
+
+def encode_texts(texts):
+    """
+    Encodes texts into L2-normalised sentence embeddings with the active backend.
+
+    Args:
+        texts (list): The texts to encode.
+
+    Returns:
+        np.ndarray: An array of shape (len(texts), dim), or None if no
+                    embedding model is loaded.
+    """
+    if backend is None:
+        return None
+    if batcher is not None:
+        return batcher.encode(texts, timeout=Config.EMBED_TIMEOUT)
+    return _encode_batch(list(texts))
+
 
 def compute_text_similarity(text1, text2):
     """
     Computes the similarity between two text strings.
 
-    It first attempts to use a SentenceTransformer model for semantic similarity.
-    If the model is not available, it falls back to using spaCy's token vector
-    similarity.
+    It uses the sentence embedding model (ONNX or PyTorch backend) for semantic
+    similarity. With TEXT_SIM_BACKEND=lite, or if no model could be loaded,
+    it uses the cosine of character n-gram TF-IDF vectors instead.
 
     Args:
         text1 (str): The first text string.
@@ -30,20 +87,11 @@ def compute_text_similarity(text1, text2):
 
     Returns:
         float: A similarity score between 0.0 and 1.0, where 1.0 indicates
-               maximum similarity. Returns 0.5 as a default fallback
-               if spaCy vectors are not available.
+               maximum similarity.
     """
-    if model:
-        # Use SentenceTransformer for semantic similarity
-        emb1 = model.encode(text1, convert_to_tensor=True)
-        emb2 = model.encode(text2, convert_to_tensor=True)
-        sim = float(util.pytorch_cos_sim(emb1, emb2)[0][0])
-        return sim
-
-    # Fallback: Use spaCy's vector similarity
-    doc1 = nlp(text1)
-    doc2 = nlp(text2)
-    # spaCy similarity relies on word vectors. If vectors are not present
-    # (e.g., with a blank model or for very short texts), vector_norm will be 0.
-    # We return 0.5 in this case as a neutral similarity score.
-    return doc1.similarity(doc2) if doc1.vector_norm and doc2.vector_norm else 0.5
\ No newline at end of file
+    # Both texts are tokenized and encoded in a single batch
+    emb = encode_texts([text1, text2])
+    if emb is not None:
+        return float(np.dot(emb[0], emb[1]))
+
+    return lite.similarity(text1, text2)
@@ -1,15 +1,17 @@
-from flask import Flask, render_template, request, jsonify
-from scraping.extract_product import extract_product_details
-from scraping.trusted_sources import search_trusted_sources
-from analysis.text_similarity import compute_text_similarity as calculate_text_similarity
-from analysis.image_similarity import compute_image_similarity as calculate_image_similarity
-from analysis.price_analysis import compute_price_deviation as calculate_price_deviation
-from ml.classifier import classify_product
+from flask import Flask, Response, render_template, request, jsonify, send_file, url_for
+from pipeline.analysis import ExtractionError, analyze_url
 from config import Config  # Import the Config class
+import metrics
+import profiling
 import pandas as pd # Import pandas
 import time  # Import time for potential delays
-import logging
-from logging.handlers import RotatingFileHandler
+import json
+import os
+from ml.classifier import registry
+from serving.logging_setup import configure_logging
+from serving.prefork import memory_report
+from serving.scheduler import PRIORITIES, SchedulerBusy, scheduler
+from scraping.trusted_sources import router
 from typing import Any, Dict
 
 app = Flask(__name__)
@@ -20,11 +22,18 @@ if 'LOG_FILE' not in app.config:
 
 app.config.from_object(Config) # Load configuration from Config object
 
-# Configure logging
-handler = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=10000, backupCount=10)
-handler.setLevel(logging.INFO)
-app.logger.addHandler(handler)
-app.logger.setLevel(logging.INFO)
+# Configure logging: every logger goes to a rotating file (one per forked
+# worker), written from a background thread (see serving/logging_setup.py)
+configure_logging(
+    app.config['LOG_FILE'],
+    level=Config.LOG_LEVEL,
+    json_format=Config.LOG_FORMAT == 'json',
+    async_mode=Config.LOG_ASYNC,
+    max_bytes=Config.LOG_MAX_BYTES,
+    backup_count=Config.LOG_BACKUP_COUNT,
+    debug_sample_rate=Config.LOG_DEBUG_SAMPLE_RATE,
+)
+app.logger.setLevel(Config.LOG_LEVEL)
 
 app.logger.info("Flask application started.")
 
@@ -38,194 +47,84 @@ def analyze():
     url = request.form.get('url', '').strip()
     if not url:
         return jsonify({'error': 'Please provide a valid URL'})
-    
-    app.logger.info(f"Starting analysis for URL: {url}")
+    priority = (request.headers.get('X-Priority') or 'interactive').lower()
+    if priority not in PRIORITIES:
+        return jsonify({'error': f'X-Priority must be one of {", ".join(PRIORITIES)}'}), 400
+    # Optional time budget in seconds (see budget.py), instead of ANALYZE_BUDGET
+    time_budget = None
+    if request.form.get('budget'):
+        try:
+            time_budget = float(request.form['budget'])
+        except ValueError:
+            time_budget = -1
+        if not 0 < time_budget <= Config.ANALYZE_MAX_BUDGET:
+            return jsonify({'error': f'budget must be between 0 and {Config.ANALYZE_MAX_BUDGET:g} seconds'}), 400
+
+    # Opt-in profiling of this request (see profiling.py)
+    token = request.headers.get('X-Profile')
+    if token is None:
+        return _analyze(url, priority, time_budget)
+    if not profiling.authorized(token):
+        return jsonify({'error': 'Profiling is not enabled or the token is invalid'}), 403
+    with profiling.profile(url) as session:
+        response = _analyze(url, priority, time_budget)
+    response.headers['X-Profile-Id'] = session.id
+    response.headers['X-Profile-URL'] = url_for('download_profile', profile_id=session.id)
+    return response
+
+def _analyze(url, priority, time_budget=None):
+    client = request.headers.get('X-Client-Id') or request.remote_addr or 'anonymous'
+    app.logger.info("Starting analysis", extra={'url': url, 'priority': priority, 'client': client})
     
     try:
-        # Initialize all feature variables to default values to avoid UnboundLocalError
-        num_reviews = 0
-        avg_rating = 0.0
-        image_count = 0
-        desc_length = 0
-        keyword_original = 0
-        keyword_replica = 0
-        keyword_genuine = 0
-        
-        # 1. Extract product details
+        # Extraction, reference search, similarity features and classification
+        # run as a stage graph (see pipeline/analysis.py), once the scheduler
+        # admits the request (see serving/scheduler.py)
         try:
-            product = extract_product_details(url)
-            app.logger.info(f"Extracted product details for URL: {url}")
-        except Exception as e:
+            with scheduler.slot(url, priority=priority, client=client):
+                result = analyze_url(url, time_budget=time_budget)
+        except SchedulerBusy as e:
+            app.logger.warning(f"Analysis not admitted: {e}", extra={'url': url, 'priority': priority, 'client': client})
+            response = jsonify({'error': f'Server busy: {e}'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        except ExtractionError as e:
             app.logger.error(f"Failed to extract product details: {str(e)}")
             return jsonify({'error': f'Failed to extract product details: {str(e)}'})
         
-        # 2. Check if URL is from trusted domain
-        trusted_domains = [
-            'amazon.com', 'amazon.in', 'flipkart.com', 'tatacliq.com', 
-            'reliancedigital.in', 'snapdeal.com', 'myntra.com', 'nykaa.com', 
-            'adidas.co.in', 'nike.com', 'puma.com', 'reebok.in', 'ajio.com'
-        ]
-        
-        is_trusted_domain = any(domain in url.lower() for domain in trusted_domains)
-        
-        if is_trusted_domain:
-            # For trusted domains, still do some basic analysis
-            text_sim = 0.95
-            image_sim = 0.95
-            price_dev = 0.1
-            known_seller = True
-            
-            # Extract additional features for display
-            try:
-                num_reviews = max(0, int(product.get('num_reviews', 0)))
-                avg_rating = max(0, min(5, float(product.get('avg_rating', 0))))
-                image_count = max(1, int(product.get('image_count', 1)))
-                desc_length = len(str(product.get('description', '')))
-                
-                # Enhanced keyword analysis
-                title_desc = (product.get('title', '') + ' ' + product.get('description', '')).lower()
-                keyword_original = 1 if any(word in title_desc for word in ['original', 'authentic', 'official']) else 0
-                keyword_replica = 1 if any(word in title_desc for word in ['replica', 'copy', 'duplicate', 'fake']) else 0
-                keyword_genuine = 1 if any(word in title_desc for word in ['genuine', '100%', 'certified', 'warranty']) else 0
-                
-                # Adjust score based on content quality
-                base_score = 85
-                if keyword_replica > 0:
-                    base_score -= 20  # Penalty for replica keywords even on trusted sites
-                if avg_rating < 3.0 and num_reviews > 20:
-                    base_score -= 10  # Penalty for poor ratings
-                if keyword_genuine > 0 or keyword_original > 0:
-                    base_score += 5  # Bonus for genuine keywords
-                    
-                score = max(60, min(95, base_score))  # Keep within reasonable range
-                
-            except Exception as e:
-                app.logger.warning(f"Trusted domain feature extraction error: {e}")
-                num_reviews = avg_rating = image_count = desc_length = 0
-                keyword_original = keyword_replica = keyword_genuine = 0
-                score = 80
-            
-            if score >= 85:
-                verdict = "Highly Genuine"
-            elif score >= 70:
-                verdict = "Likely Genuine"
-            else:
-                verdict = "Suspicious"
-                
-            # Determine reference source
-            if "amazon" in url.lower():
-                ref_source = "Amazon"
-            elif "flipkart" in url.lower():
-                ref_source = "Flipkart"
-            elif "myntra" in url.lower():
-                ref_source = "Myntra"
-            elif "tatacliq" in url.lower():
-                ref_source = "Tata Cliq"
-            else:
-                ref_source = "Trusted Domain"
-            
-        else:
-            # For non-trusted domains, use ML model
-            try:
-                # Search trusted sources
-                trusted = search_trusted_sources(product['title'])
-                ref = trusted[0] if trusted else None
-                
-                # Calculate similarities
-                if ref and ref.get('title'):
-                    text_sim = calculate_text_similarity(product.get('title', ''), ref['title'])
-                else:
-                    text_sim = 0.1  # Low similarity if no reference
-                
-                if ref and ref.get('image_url') and product.get('image_url'):
-                    image_sim = calculate_image_similarity(product.get('image_url', ''), ref['image_url'])
-                else:
-                    image_sim = 0.1  # Low similarity if no images
-                
-                # Price deviation
-                product_price = product.get('price', 0)
-                if ref and ref.get('price') and product_price:
-                    try:
-                        ref_prices = [float(ref['price'])]
-                        price_dev = calculate_price_deviation(float(product_price), ref_prices)
-                    except:
-                        price_dev = 1.0  # High deviation on error
-                else:
-                    price_dev = 0.5  # Medium deviation if no reference price
-                
-                # Seller comparison
-                try:
-                    known_seller = (product.get('seller', '').lower() == ref.get('seller', '').lower()) if ref else False
-                except:
-                    known_seller = False
-                
-                # Extract additional features with better defaults
-                try:
-                    num_reviews = max(0, int(product.get('num_reviews', 0)))
-                    avg_rating = max(0, min(5, float(product.get('avg_rating', 0))))
-                    image_count = max(0, int(product.get('image_count', 1)))
-                    desc_length = len(str(product.get('description', '')))
-                    
-                    # Keyword analysis
-                    title_desc = (product.get('title', '') + ' ' + product.get('description', '')).lower()
-                    keyword_original = 1 if any(word in title_desc for word in ['original', 'authentic', 'official']) else 0
-                    keyword_replica = 1 if any(word in title_desc for word in ['replica', 'copy', 'duplicate', 'fake']) else 0
-                    keyword_genuine = 1 if any(word in title_desc for word in ['genuine', '100%', 'certified', 'warranty']) else 0
-                    
-                except Exception as e:
-                    app.logger.warning(f"Feature extraction error: {e}")
-                    num_reviews = avg_rating = image_count = desc_length = 0
-                    keyword_original = keyword_replica = keyword_genuine = 0
-                
-                # Prepare features for ML classifier
-                features = [
-                    text_sim, image_sim, price_dev, int(known_seller),
-                    num_reviews, avg_rating, image_count, desc_length,
-                    keyword_original, keyword_replica, keyword_genuine
-                ]
-                
-                app.logger.info(f"Features for classification: {features}")
-                score, verdict = classify_product(*features)
-                ref_source = ref.get('source', 'No Reference') if ref else 'No Reference'
-                
-            except Exception as e:
-                app.logger.error(f"ML analysis failed: {str(e)}")
-                score = 25  # Very low score for failed analysis
-                verdict = "High Risk - Analysis Failed"
-                text_sim = image_sim = 0.0
-                price_dev = 1.0
-                known_seller = False
-                ref_source = 'Analysis Failed'
-        
-        # Build response
-        result = {
-            'verdict': verdict,
-            'score': score,
-            'details': {
-                'product_title': product.get('title', ''),
-                'product_price': product.get('price', 0),
-                'seller': product.get('seller', ''),
-                'num_reviews': num_reviews,
-                'avg_rating': avg_rating,
-                'image_count': image_count,
-                'desc_length': desc_length,
-                'title_similarity': f"{text_sim * 100:.0f}%",
-                'image_similarity': f"{image_sim * 100:.0f}%",
-                'price_deviation': f"{price_dev:.0f}%",
-                'known_seller': known_seller,
-                'reference_source': ref_source,
-                'keyword_original': keyword_original,
-                'keyword_replica': keyword_replica,
-                'keyword_genuine': keyword_genuine
-            }
-        }
-        
-        app.logger.info(f"Analysis complete for URL {url}. Result: {verdict}")
+        app.logger.info("Analysis complete", extra={'url': url, 'verdict': result['verdict'], 'score': result['score'],
+                                                    'defaulted_features': result['defaulted_features']})
         return jsonify(result)
         
     except Exception as e:
         app.logger.error(f"Analysis failed: {str(e)}")
         return jsonify({'error': f'Analysis failed: {str(e)}'})
 
+@app.route('/profiles/<profile_id>')
+def download_profile(profile_id):
+    """
+    Downloads a request profile, as a speedscope file or, with ?format=folded,
+    as collapsed stacks for flamegraph.pl. Needs the X-Profile token.
+    """
+    if not profiling.authorized(request.headers.get('X-Profile', '')):
+        return jsonify({'error': 'Profiling is not enabled or the token is invalid'}), 403
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'folded':
+        with open(path) as f:
+            document = json.load(f)
+        return Response(profiling.folded(document), mimetype='text/plain', headers={
+            'Content-Disposition': f'attachment; filename={profile_id}.folded.txt'})
+    return send_file(os.path.abspath(path), mimetype='application/json', as_attachment=True,
+                     download_name=f'{profile_id}.speedscope.json')
+
+@app.route('/stats')
+def stats():
+    """Counters, stage timings, scheduler queues, search routing and model versions of this worker process."""
+    return jsonify({**metrics.snapshot(), 'scheduler': scheduler.stats(), 'routing': router.stats(),
+                    'model': {**registry.stats(), 'process_memory': memory_report()}})
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Compares Selenium page renders with the default and the lean browser profile.
+
+For each URL, starts Chrome with either profile, loads the page, waits for the
+given selector and reports the load time, the number and transfer size of the
+page's resources, and the memory (PSS, so shared pages aren't double counted)
+of the Chrome process tree after the render.
+
+    python -m benchmarks.bench_browser https://www.amazon.in/dp/B08MVGF24M --selector '#productTitle'
+
+Needs Chrome and chromedriver.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from selenium.webdriver.common.by import By
+
+from scraping.browser import new_driver, wait_for_selectors
+from serving.prefork import memory_report
+
+RESOURCES_JS = """
+const entries = performance.getEntriesByType('resource');
+return [entries.length, entries.reduce((total, e) => total + (e.transferSize || 0), 0)];
+"""
+
+
+def descendants(pid):
+    """pid and all of its descendant pids, from /proc."""
+    pids = [pid]
+    for current in pids:
+        task_dir = f'/proc/{current}/task'
+        try:
+            tids = os.listdir(task_dir)
+        except OSError:
+            continue
+        for tid in tids:
+            try:
+                with open(os.path.join(task_dir, tid, 'children')) as f:
+                    pids.extend(int(p) for p in f.read().split())
+            except OSError:
+                continue
+    return pids
+
+
+def render(url, selector, lean, headless):
+    driver = new_driver(lean=lean, headless=headless)
+    try:
+        t0 = time.perf_counter()
+        driver.get(url)
+        wait_for_selectors(driver, [(By.CSS_SELECTOR, selector)], timeout=30)
+        load_s = time.perf_counter() - t0
+        count, transferred = driver.execute_script(RESOURCES_JS)
+        pss = sum(memory_report(pid).get('pss_mb', 0) for pid in descendants(driver.service.process.pid))
+        return {'load_s': load_s, 'resources': count, 'transfer_kb': transferred / 1024, 'pss_mb': pss}
+    finally:
+        driver.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Default vs lean Selenium profile.')
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--selector', default='h1', help='CSS selector that marks the page as usable')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--headful-baseline', action='store_true',
+                        help='run the default profile with a window, as the scrapers used to')
+    args = parser.parse_args()
+
+    report = {}
+    for name, lean, headless in [('default', False, not args.headful_baseline), ('lean', True, True)]:
+        samples = [render(url, args.selector, lean, headless) for url in args.urls for _ in range(args.repeats)]
+        report[name] = {key: round(float(np.mean([s[key] for s in samples])), 2) for key in samples[0]}
+        report[name]['p95_load_s'] = round(float(np.percentile([s['load_s'] for s in samples], 95)), 2)
+    report['load_speedup'] = round(report['default']['load_s'] / report['lean']['load_s'], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
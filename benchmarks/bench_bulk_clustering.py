@@ -0,0 +1,156 @@
+"""
+Benchmarks the near-duplicate clustering of bulk scans (pipeline/bulk.py).
+
+Generates listings from a set of base products. Each product is reposted a
+random number of times, under another shop name, with words dropped, swapped
+or misspelt, and with a pHash a few bits off, as copied listings are. A
+third of the products share seller boilerplate without being duplicates.
+The listings are clustered with MinHash/LSH. It reports signature and clustering time,
+candidate pairs checked against all n(n-1)/2, and pairwise precision and
+recall against the planted groups. With --exact, the same similarity rule is
+also applied to every pair, for comparison.
+
+    python -m benchmarks.bench_bulk_clustering --listings 1000 10000 50000
+"""
+import argparse
+import json
+import random
+import time
+
+from config import Config
+from pipeline.bulk import MinHasher, cluster_listings, image_distance, jaccard
+
+WORDS = ('wireless bluetooth headphones noise cancelling over ear stereo bass running shoes men women '
+         'leather wallet smart watch fitness tracker perfume eau de parfum sunglasses polarized backpack '
+         'laptop travel cotton t-shirt slim fit analog quartz stainless steel strap waterproof '
+         'premium edition black white blue red size pack gift box charger fast usb type-c cable').split()
+SHOPS = ['BestDeals', 'MegaMart', 'ShopNow', 'TrendyHub', 'ValueStore', 'DailyKart', 'StyleZone', 'GadgetWorld']
+# Seller boilerplate shared by many unrelated listings
+BOILERPLATE = ('Cash on delivery available. 7 day easy return and replacement policy. '
+               'Ships within 24 hours from our warehouse. Contact us on WhatsApp for bulk orders.')
+
+
+def vocabulary(size, seed=0):
+    """WORDS plus made-up brand and model words, for a realistic spread of shingles."""
+    rng = random.Random(seed)
+    syllables = ['ka', 'ro', 'zu', 'mi', 'tek', 'lo', 'vi', 'xo', 'pra', 'nu', 'sen', 'ga', 'qi', 'dor']
+    made_up = {''.join(rng.choices(syllables, k=rng.randint(2, 3))) + rng.choice(['', str(rng.randint(1, 999))])
+               for _ in range(size)}
+    return WORDS + sorted(made_up)
+
+
+def base_product(rng, words):
+    title = ' '.join(rng.choices(words, k=rng.randint(6, 12)))
+    description = ' '.join(rng.choices(words, k=rng.randint(30, 80)))
+    if rng.random() < 0.3:
+        description += ' ' + BOILERPLATE
+    return title, description, rng.getrandbits(64)
+
+
+def repost(rng, title, description, bits):
+    """A copied listing: new shop name, a few words changed, a slightly different image."""
+    words = description.split()
+    for _ in range(rng.randint(0, max(1, len(words) // 15))):
+        i = rng.randrange(len(words))
+        action = rng.random()
+        if action < 0.4:
+            words[i] = rng.choice(WORDS)
+        elif action < 0.7 and len(words) > 10:
+            del words[i]
+        else:
+            words[i] = words[i][:-1] + rng.choice('aeiou') if len(words[i]) > 3 else words[i]
+    for _ in range(rng.randint(0, 4)):
+        bits ^= 1 << rng.randrange(64)
+    return f'{title} - {rng.choice(SHOPS)}', ' '.join(words), bits
+
+
+def make_listings(n, mean_group, seed=0):
+    rng = random.Random(seed)
+    minhasher = MinHasher(Config.BULK_MINHASH_PERM)
+    words = vocabulary(2000, seed)
+    listings, truth, group = [], [], 0
+    start = time.perf_counter()
+    while len(listings) < n:
+        title, description, bits = base_product(rng, words)
+        size = max(1, min(n - len(listings), int(rng.expovariate(1 / mean_group)) + 1))
+        for _ in range(size):
+            t, d, b = repost(rng, title, description, bits)
+            listings.append({'signature': minhasher.signature(f'{t}\n{d}'), 'image_bits': b, 'trusted': False})
+            truth.append(group)
+        group += 1
+    return listings, truth, time.perf_counter() - start
+
+
+def pair_scores(clusters, truth):
+    """Pairwise precision and recall of the clusters against the planted groups."""
+    predicted = {i: cid for cid, members in enumerate(clusters) for i in members}
+    true_pairs = sum(c * (c - 1) // 2 for c in _sizes(truth))
+    predicted_pairs = sum(len(members) * (len(members) - 1) // 2 for members in clusters)
+    agree = sum(c * (c - 1) // 2 for c in _sizes([(truth[i], predicted[i]) for i in range(len(truth))]))
+    return (agree / predicted_pairs if predicted_pairs else 1.0), (agree / true_pairs if true_pairs else 1.0)
+
+
+def _sizes(labels):
+    counts = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    return counts.values()
+
+
+def exact_pairs(listings, threshold, max_distance):
+    """Clusters by the same rule over every pair (quadratic)."""
+    parent = list(range(len(listings)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(listings)):
+        for j in range(i):
+            text = jaccard(listings[i]['signature'], listings[j]['signature'])
+            distance = image_distance(listings[i]['image_bits'], listings[j]['image_bits'])
+            if (text >= threshold and distance <= 2 * max_distance) or (distance <= max_distance and text >= threshold / 2):
+                parent[find(i)] = find(j)
+    groups = {}
+    for i in range(len(listings)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--listings', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--mean-group', type=float, default=4, help='mean reposts per product')
+    parser.add_argument('--exact', action='store_true', help='also compare every pair (slow above ~3000)')
+    args = parser.parse_args()
+
+    for n in args.listings:
+        listings, truth, signature_s = make_listings(n, args.mean_group)
+        start = time.perf_counter()
+        clusters, comparisons = cluster_listings(listings)
+        cluster_s = time.perf_counter() - start
+        precision, recall = pair_scores(clusters, truth)
+        report = {
+            'listings': n,
+            'planted_groups': len(set(truth)),
+            'clusters': len(clusters),
+            'signature_ms_per_listing': round(signature_s * 1000 / n, 3),
+            'cluster_s': round(cluster_s, 3),
+            'candidate_pairs': comparisons,
+            'all_pairs': n * (n - 1) // 2,
+            'pair_precision': round(precision, 4),
+            'pair_recall': round(recall, 4),
+            'analyses_saved': round(1 - len(clusters) / n, 3),
+        }
+        if args.exact:
+            start = time.perf_counter()
+            exact = exact_pairs(listings, Config.BULK_TEXT_THRESHOLD, Config.BULK_IMAGE_DISTANCE)
+            report['exact_s'] = round(time.perf_counter() - start, 3)
+            report['exact_pair_precision'], report['exact_pair_recall'] = (round(v, 4) for v in pair_scores(exact, truth))
+        print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmarks micro-batched against direct sentence embedding under concurrency.
+
+N threads each embed one (product title, trusted title) pair at a time, as
+/analyze requests do, either calling the encoder directly or through
+analysis.embedding_batcher.EmbeddingBatcher. Reports pairs per second and
+p50/p99 latency per pair at 1, 8 and 32 concurrent callers.
+
+    python -m benchmarks.bench_embedding_batcher
+    python -m benchmarks.bench_embedding_batcher --backend random-minilm --seconds 5
+
+`--backend auto` loads all-MiniLM-L6-v2 with sentence-transformers.
+`random-minilm` builds a randomly initialised BERT of the same size (6 layers,
+384 hidden) with a hashing tokenizer, for machines without the model
+downloaded. Its timings are representative, its embeddings are not.
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from analysis.embedding_batcher import EmbeddingBatcher
+from benchmarks.bench_text_embeddings import load_texts
+
+CONCURRENCY = [1, 8, 32]
+
+
+def sentence_transformer_encoder():
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+    return lambda texts: model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def random_minilm_encoder(max_length=32):
+    import torch
+    from transformers import BertConfig, BertModel
+    torch.manual_seed(0)
+    model = BertModel(BertConfig(vocab_size=30522, hidden_size=384, num_hidden_layers=6, num_attention_heads=12,
+                                 intermediate_size=1536, max_position_embeddings=512)).eval()
+
+    def encode(texts):
+        rows = [[101] + [zlib.crc32(w.lower().encode()) % 29000 + 1000 for w in t.split()][:max_length - 2] + [102]
+                for t in texts]
+        width = max(len(r) for r in rows)
+        ids = torch.tensor([r + [0] * (width - len(r)) for r in rows])
+        mask = (ids != 0).long()
+        with torch.inference_mode():
+            hidden = model(input_ids=ids, attention_mask=mask).last_hidden_state
+        pooled = (hidden * mask.unsqueeze(-1)).sum(1) / mask.sum(1, keepdim=True)
+        return torch.nn.functional.normalize(pooled, dim=1).numpy()
+    return encode
+
+
+def run(encode_pair, pairs, concurrency, seconds):
+    """Calls encode_pair from `concurrency` threads for `seconds`; returns the latencies."""
+    latencies = [[] for _ in range(concurrency)]
+    stop = time.perf_counter() + seconds
+
+    def worker(i):
+        n = i
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            encode_pair(pairs[n % len(pairs)])
+            latencies[i].append(time.perf_counter() - t0)
+            n += concurrency
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    flat = np.array([x for lat in latencies for x in lat])
+    return {
+        'pairs_per_s': round(len(flat) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(flat, 50)) * 1000, 2),
+        'p99_ms': round(float(np.percentile(flat, 99)) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Direct vs micro-batched embedding under concurrent callers.')
+    parser.add_argument('--backend', choices=['auto', 'random-minilm'], default='auto')
+    parser.add_argument('--seconds', type=float, default=3, help='duration of each run')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=3)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=CONCURRENCY)
+    args = parser.parse_args()
+
+    encode = sentence_transformer_encoder() if args.backend == 'auto' else random_minilm_encoder()
+    texts = load_texts()
+    pairs = [texts[i:i + 2] for i in range(0, len(texts) - 1, 2)]
+    # Unique strings, so the batcher's deduplication doesn't flatter it
+    pairs = [[f'{a} #{n}', f'{b} #{n}'] for n in range(20) for a, b in pairs]
+    encode(pairs[0])  # warm-up
+
+    batcher = EmbeddingBatcher(encode, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, name='bench')
+    report = {}
+    for concurrency in args.concurrency:
+        direct = run(encode, pairs, concurrency, args.seconds)
+        batched = run(batcher.encode, pairs, concurrency, args.seconds)
+        report[concurrency] = {'direct': direct, 'batched': batched,
+                               'speedup': round(batched['pairs_per_s'] / direct['pairs_per_s'], 2)}
+        print(f'{concurrency:3d} callers  direct {direct["pairs_per_s"]:7.1f} pairs/s p50 {direct["p50_ms"]:7.2f}ms '
+              f'p99 {direct["p99_ms"]:7.2f}ms | batched {batched["pairs_per_s"]:7.1f} pairs/s '
+              f'p50 {batched["p50_ms"]:7.2f}ms p99 {batched["p99_ms"]:7.2f}ms')
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Compares a full-page download with the streaming, early-stopping fetch.
+
+Serves a synthetic Amazon-like product page from a local server (inline
+scripts before and after the product details, optionally throttled to a given
+bandwidth), then fetches and parses it both ways. Reports time, bytes read and
+peak Python memory, and checks that every product field is identical.
+
+    python -m benchmarks.bench_fetch --page-mb 3 --mbps 20
+"""
+import argparse
+import json
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from bs4 import BeautifulSoup
+
+from scraping.extract_product import AMAZON_FIELDS
+from scraping.http_client import fetch_html
+
+PRODUCT_HTML = """
+<div id="centerCol">
+  <span id="productTitle"> SONY WH-1000XM4 Wireless Noise Cancelling Headphones </span>
+  <a id="bylineInfo" href="/stores/Sony">Visit the Sony Store</a>
+  <span class="a-icon-alt">4.5 out of 5 stars</span>
+  <span id="acrCustomerReviewText">12,345 ratings</span>
+  <span class="a-price"><span class="a-price-whole">24,990</span></span>
+  <div id="imgTagWrapperId"><img id="landingImage" src="https://m.media-amazon.example/sony.jpg"></div>
+  <div id="feature-bullets"><ul><li>Industry-leading noise cancellation</li><li>30 hours battery</li></ul></div>
+</div>
+"""
+
+
+def build_page(page_mb):
+    script = '<script>var data = "' + 'x' * 50_000 + '";</script>\n'
+    n = max(1, int(page_mb * 1024 * 1024 / len(script)))
+    # About a sixth of the scripts before the product details, the rest after
+    head, tail = script * (n // 6), script * (n - n // 6)
+    return f'<html><head><meta charset="utf-8">{head}</head><body>{PRODUCT_HTML}{tail}</body></html>'.encode()
+
+
+def serve(body, mbps):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            chunk = 64 * 1024
+            try:
+                for i in range(0, len(body), chunk):
+                    self.wfile.write(body[i:i + chunk])
+                    if mbps:
+                        time.sleep(chunk * 8 / (mbps * 1e6))
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client stopped reading
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fields(soup):
+    found = {}
+    for name, attrs in AMAZON_FIELDS:
+        element = soup.find(name, attrs)
+        found[f'{name}{attrs}'] = element.get('src') if element and element.name == 'img' else (
+            element.get_text(strip=True) if element else None)
+    return found
+
+
+def measure(fetch, url, repeats):
+    samples, peaks = [], []
+    for _ in range(repeats):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        text, nbytes = fetch(url)
+        result = fields(BeautifulSoup(text, 'html.parser'))
+        samples.append(time.perf_counter() - t0)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, {
+        'mean_s': round(sum(samples) / len(samples), 3),
+        'bytes_read': nbytes,
+        'peak_mem_mb': round(max(peaks) / 2 ** 20, 1),
+    }
+
+
+def full_fetch(url):
+    resp = requests.get(url, timeout=10)
+    return resp.text, len(resp.content)
+
+
+def streaming_fetch(url):
+    page = fetch_html(url, timeout=10, required=AMAZON_FIELDS)
+    return page.text, page.bytes_read
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full download vs streaming early-stop fetch.')
+    parser.add_argument('--page-mb', type=float, default=3.0, help='size of the synthetic page')
+    parser.add_argument('--mbps', type=float, default=20.0, help='simulated bandwidth (0 = unthrottled)')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    server = serve(build_page(args.page_mb), args.mbps)
+    url = f'http://127.0.0.1:{server.server_address[1]}/dp/B08MVGF24M'
+    full_fields, full = measure(full_fetch, url, args.repeats)
+    stream_fields, stream = measure(streaming_fetch, url, args.repeats)
+    server.shutdown()
+    print(json.dumps({
+        'full': full,
+        'streaming': stream,
+        'speedup': round(full['mean_s'] / stream['mean_s'], 2),
+        'identical_fields': full_fields == stream_fields,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmarks the compiled RandomForest evaluator against sklearn's predict_proba.
+
+Checks that both produce identical probabilities, then reports single-row and
+batch scoring latency.
+
+    python -m benchmarks.bench_forest --model ml/model.pkl
+"""
+import argparse
+import json
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+from ml.forest_eval import compile_forest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_call(fn, repeats):
+    """Returns the median wall time of `fn()` in microseconds."""
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return float(np.median(samples)) * 1e6
+
+
+def random_rows(n, n_features, seed=0):
+    """Feature rows spanning the ranges classify_product sees."""
+    rng = np.random.default_rng(seed)
+    X = rng.random((n, n_features))
+    X[:, 2] *= 2.0                        # price deviation, capped at 200%
+    X[:, 3] = X[:, 3] > 0.5               # known seller
+    X[:, 4] = rng.integers(0, 20000, n)   # num reviews
+    X[:, 5] *= 5.0                        # avg rating
+    X[:, 6] = rng.integers(0, 10, n)      # image count
+    X[:, 7] = rng.integers(0, 2000, n)    # description length
+    X[:, 8:] = X[:, 8:] > 0.5             # keyword flags
+    return X
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compiled forest vs sklearn predict_proba.')
+    parser.add_argument('--model', default=os.path.join(ROOT, 'ml', 'model.pkl'))
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=500)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    model = joblib.load(args.model)
+    forest = compile_forest(model)
+    X = random_rows(args.rows, model.n_features_in_)
+
+    expected = model.predict_proba(X)
+    actual = forest.predict_proba(X)
+    single = X[:1].tolist()
+
+    report = {
+        'trees': forest.n_trees,
+        'nodes': int(len(forest.feature)),
+        'max_depth': forest.max_depth,
+        'identical': bool(np.array_equal(expected, actual)),
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+        'single_row_us': {
+            'sklearn': round(time_call(lambda: model.predict_proba(single), args.repeats), 1),
+            'compiled': round(time_call(lambda: forest.predict_proba(single), args.repeats), 1),
+        },
+        f'batch_{args.rows}_ms': {
+            'sklearn': round(time_call(lambda: model.predict_proba(X), 5) / 1000, 2),
+            'compiled': round(time_call(lambda: forest.predict_proba(X), 5) / 1000, 2),
+        },
+    }
+    report['single_row_speedup'] = round(report['single_row_us']['sklearn'] / report['single_row_us']['compiled'], 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmarks the compiled keyword matcher (analysis/keywords.py) on long descriptions.
+
+Scans synthetic product descriptions of increasing length with the shipped
+lexicons, and with lexicons padded by random made-up terms to 10x and 100x
+their size. Reports throughput in MB/s and per-description latency, next to
+the previous approach: one `term in text` pass per term. The compiled
+matcher's throughput should stay roughly flat as the lexicon grows, while
+the per-term scan slows down in proportion to the number of terms.
+
+    python -m benchmarks.bench_keywords --sizes 2000 20000 200000 --scales 1 10 100
+"""
+import argparse
+import json
+import random
+import string
+import time
+
+import numpy as np
+
+from analysis.keywords import DEFAULT_LEXICON_DIR, KeywordMatcher, normalize, read_lexicon
+
+FILLER = ('Premium quality stainless steel case with sapphire crystal and a genuine leather strap. '
+          'Water resistant to 50 metres, quartz movement, ships with the original box and a '
+          'one year warranty. Suitable for daily wear; keep away from magnets. ')
+
+
+def shipped_lexicons():
+    matcher = KeywordMatcher.from_dir(DEFAULT_LEXICON_DIR)
+    lexicons = {category: [] for category in matcher.categories}
+    for term, categories in matcher.terms.items():
+        for category in categories:
+            lexicons[category].append(term)
+    return lexicons
+
+
+def padded(lexicons, scale, seed=0):
+    """The lexicons with (scale - 1) times as many random made-up terms added to each category."""
+    rng = random.Random(seed)
+    out = {}
+    for category, terms in lexicons.items():
+        extra = [' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+                          for _ in range(rng.randint(1, 2)))
+                 for _ in range(len(terms) * (scale - 1))]
+        out[category] = list(terms) + extra
+    return out
+
+
+def description(size, lexicons, seed=0):
+    """About `size` characters of filler text with a lexicon term every ~200 characters."""
+    rng = random.Random(seed)
+    terms = [term for terms in lexicons.values() for term in terms]
+    parts, length = [], 0
+    while length < size:
+        part = FILLER[:rng.randint(120, len(FILLER))] + rng.choice(terms) + '. '
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts)[:size]
+
+
+def naive_counts(lexicons, text):
+    """The previous approach: a substring scan per term."""
+    text = normalize(text)
+    return {category: sum(text.count(term) for term in terms) for category, terms in lexicons.items()}
+
+
+def time_call(fn, repeats):
+    """Median wall time of `fn()` in seconds."""
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 20000, 200000],
+                        help='description lengths in characters')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help='lexicon size multipliers')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    base = shipped_lexicons()
+    report = []
+    for scale in args.scales:
+        lexicons = padded(base, scale)
+        start = time.perf_counter()
+        matcher = KeywordMatcher(lexicons)
+        compile_ms = (time.perf_counter() - start) * 1000
+        for size in args.sizes:
+            text = description(size, base)
+            compiled_s = time_call(lambda: matcher.counts(text), args.repeats)
+            naive_s = time_call(lambda: naive_counts(lexicons, text), max(1, args.repeats // 4))
+            megabytes = len(text.encode('utf-8')) / 1e6
+            report.append({
+                'terms': len(matcher.terms),
+                'chars': len(text),
+                'compile_ms': round(compile_ms, 1),
+                'compiled_ms': round(compiled_s * 1000, 3),
+                'compiled_mb_s': round(megabytes / compiled_s, 1),
+                'per_term_ms': round(naive_s * 1000, 3),
+                'per_term_mb_s': round(megabytes / naive_s, 1),
+                'matches': sum(matcher.counts(text).values()),
+            })
+            print(json.dumps(report[-1]))
+
+
+if __name__ == '__main__':
+    main()
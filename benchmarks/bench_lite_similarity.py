@@ -0,0 +1,120 @@
+"""
+Benchmarks the lite text similarity (analysis/lite_similarity.py) against MiniLM.
+
+Scores every product title in data/labeling_template.csv against every trusted
+title. The diagonal holds the labelled pairs, and the other pairs are
+different products. Reports the lite engine's latency per pair (cold, and with
+the vector cache warm), and its agreement with all-MiniLM-L6-v2: Pearson and
+Spearman correlation, mean absolute difference, and how well each separates
+the labelled pairs from the others (ROC AUC). Without the MiniLM model,
+agreement is measured against the `text_similarity` column of the data.
+
+    python -m benchmarks.bench_lite_similarity
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+from scipy.stats import pearsonr, spearmanr
+from sklearn.metrics import roc_auc_score
+
+from analysis.lite_similarity import LiteSimilarity
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILE = os.path.join(ROOT, 'data', 'labeling_template.csv')
+
+
+def load_rows():
+    with open(DATA_FILE, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def minilm_scorer():
+    """Cosine of all-MiniLM-L6-v2 embeddings, or None if the model can't be loaded."""
+    try:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+    except Exception as e:
+        print(f'MiniLM unavailable ({e}); comparing with the labelled text_similarity instead')
+        return None
+
+    def score(pairs):
+        texts = sorted({text for pair in pairs for text in pair})
+        emb = dict(zip(texts, model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)))
+        return np.array([float(np.dot(emb[a], emb[b])) for a, b in pairs])
+    return score
+
+
+def latency_us(lite, pairs, repeats):
+    """Per-pair latencies in microseconds."""
+    times = []
+    for _ in range(repeats):
+        for a, b in pairs:
+            t0 = time.perf_counter()
+            lite.similarity(a, b)
+            times.append(time.perf_counter() - t0)
+    return np.array(times) * 1e6
+
+
+def summary(latencies):
+    return {'p50_us': round(float(np.percentile(latencies, 50)), 1),
+            'p95_us': round(float(np.percentile(latencies, 95)), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=50, help='passes over the pairs for the latency')
+    args = parser.parse_args()
+
+    rows = load_rows()
+    titles = [row['title'] for row in rows]
+    trusted = [row['trusted_title'] for row in rows]
+    pairs = [(a, b) for a in titles for b in trusted]
+    same = np.array([i == j for i in range(len(titles)) for j in range(len(trusted))])
+
+    start = time.perf_counter()
+    lite = LiteSimilarity.from_csv(DATA_FILE)
+    load_ms = (time.perf_counter() - start) * 1000
+    cold = LiteSimilarity.from_csv(DATA_FILE, cache_size=0)
+    report = {
+        'pairs': len(pairs),
+        'lite_load_ms': round(load_ms, 2),
+        'lite_cold': summary(latency_us(cold, pairs, args.repeats)),
+        'lite_cached': summary(latency_us(lite, pairs, args.repeats)),
+    }
+
+    lite_scores = np.array([lite.similarity(a, b) for a, b in pairs])
+    report['match_auc'] = {'lite': round(float(roc_auc_score(same, lite_scores)), 3)}
+    score = minilm_scorer()
+    if score is not None:
+        start = time.perf_counter()
+        reference = score(pairs)
+        report['minilm_ms_per_pair'] = round((time.perf_counter() - start) * 1000 / len(pairs), 3)
+        name = 'minilm'
+    else:
+        # Only the labelled pairs have a reference score
+        reference = np.array([float(row['text_similarity']) for row in rows])
+        lite_scores, same = lite_scores[same], same[same]
+        name = 'labelled'
+
+    report['agreement'] = {
+        'reference': name,
+        'pearson': round(float(pearsonr(lite_scores, reference)[0]), 3),
+        'spearman': round(float(spearmanr(lite_scores, reference)[0]), 3),
+        'mean_abs_diff': round(float(np.abs(lite_scores - reference).mean()), 3),
+    }
+    if not same.all():
+        report['match_auc'][name] = round(float(roc_auc_score(same, reference)), 3)
+    report['labelled_pairs'] = [
+        {'title': row['title'], 'trusted_title': row['trusted_title'], 'labelled': float(row['text_similarity']),
+         'lite': round(lite.similarity(row['title'], row['trusted_title']), 3)}
+        for row in rows
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
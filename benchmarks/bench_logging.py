@@ -0,0 +1,91 @@
+"""
+Measures the logging cost on the request thread.
+
+Each simulated request logs what a real analysis does: the start and end
+INFO lines with a long product URL, a few scraper warnings and the DEBUG
+extraction record. Compares the old setup (synchronous RotatingFileHandler
+capped at 10 KB, so it rotates every few requests) with the queue-based JSON
+pipeline, reporting the mean and p99 time spent in logging calls per request.
+A NullHandler run gives the floor: the cost of creating the records at all.
+
+    python -m benchmarks.bench_logging --requests 2000 --level DEBUG
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+from serving.logging_setup import configure_logging, stop_logging
+
+URL = 'https://www.example-retailer.in/sony-wh-1000xm4-wireless-headphones/p/itm' + 'a1b2c3' * 90
+
+
+def one_request(log):
+    log.info('Starting analysis', extra={'url': URL})
+    for source in ('Amazon', 'Flipkart', 'Snapdeal'):
+        log.warning(f'{source} search error: read timeout')
+    log.debug('Brand requests extraction', extra={'title': 'Sony WH-1000XM4', 'price': '24990',
+                                                   'num_images': 7, 'desc_length': 1840})
+    log.info('Analysis complete', extra={'url': URL, 'verdict': 'Likely Genuine', 'score': 82})
+
+
+def run(log, requests):
+    samples = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        one_request(log)
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return {
+        'mean_us': round(statistics.mean(samples) * 1e6, 1),
+        'p99_us': round(samples[int(len(samples) * 0.99) - 1] * 1e6, 1),
+    }
+
+
+def old_setup(path, level):
+    handler = RotatingFileHandler(path, maxBytes=10000, backupCount=1)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Request-thread logging cost: sync rotating file vs async JSON.')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--level', default='INFO')
+    args = parser.parse_args()
+
+    log = logging.getLogger('bench')
+    null = logging.NullHandler()
+    logging.getLogger().addHandler(null)
+    logging.getLogger().setLevel(args.level)
+    baseline = run(log, args.requests)
+    logging.getLogger().removeHandler(null)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = old_setup(os.path.join(tmp, 'old.log'), args.level)
+        old = run(log, args.requests)
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+
+        configure_logging(os.path.join(tmp, 'new.log'), level=args.level)
+        new = run(log, args.requests)
+        stop_logging()
+
+    print(json.dumps({
+        'level': args.level,
+        'null_handler': baseline,
+        'sync_rotating_10kb': old,
+        'async_json': new,
+        'speedup': round(old['mean_us'] / new['mean_us'], 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Compares end-to-end latency of the /analyze stage graph against the linear flow.
+
+Network-bound stages (extraction, trusted-source search, image downloads) and
+the text embedding are replaced by sleeps of configurable length, so the
+numbers reflect scheduling rather than retailer response times. Price,
+seller, content features and classification run for real.
+
+    python -m benchmarks.bench_pipeline --extract 1.5 --search 2.0 --image 0.6 --text 0.05
+
+--speculative adds the speculative slug search; --miss-rate sets the share of
+speculative results whose title doesn't match the extracted one. --cascade
+classifies with the early-exit cascade.
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from pipeline.analysis import analyze_url, build_analysis_graph
+from pipeline.graph import InlineExecutor
+
+PRODUCT = {
+    'title': 'SONY WH-1000XM4 Headphones', 'description': 'High-quality noise cancellation headphones',
+    'price': '4999', 'images': ['https://cheapgadgets.example/sony.jpg'], 'seller': 'UnknownSeller',
+    'num_reviews': 5, 'avg_rating': 3.2, 'image_count': 1, 'desc_length': 42,
+}
+REFERENCE = {
+    'source': 'Amazon India', 'title': 'SONY WH-1000XM4 Wireless Headphones', 'price': '24990',
+    'images': ['https://m.media-amazon.example/sony.jpg'], 'seller': 'Amazon Seller',
+}
+
+
+def simulated_stages(extract_s, search_s, image_s, text_s, miss_rate=0.0, seed=0):
+    """Stage functions that sleep instead of doing network or model work."""
+    rng = random.Random(seed)
+    mismatch = dict(REFERENCE, title='Boat Rockerz 450 Bluetooth On Ear Headphones')
+
+    def speculative_search(run, url):
+        time.sleep(search_s)
+        ref = mismatch if rng.random() < miss_rate else REFERENCE
+        return {'query': 'sony headphones', 'ref': ref, 'elapsed': search_s}
+
+    def sleep_then(seconds, value):
+        def stage(run, **deps):
+            time.sleep(seconds)
+            return value
+        return stage
+
+    return {
+        'product': sleep_then(extract_s, PRODUCT),
+        'ref': sleep_then(search_s, REFERENCE),
+        'text_sim': sleep_then(text_s, 0.82),
+        'product_image_hash': sleep_then(image_s, None),
+        'ref_image_hash': sleep_then(image_s, None),
+        'speculative_ref': speculative_search,
+    }
+
+
+def measure(executor, graph, repeats):
+    samples = []
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        analyze_url(f'https://cheapgadgets.example/sony-wh-1000xm4-headphones/p/{i}', graph=graph, executor=executor)
+        samples.append(time.perf_counter() - t0)
+    return {
+        'p50_s': round(float(np.percentile(samples, 50)), 3),
+        'p95_s': round(float(np.percentile(samples, 95)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stage graph vs linear /analyze latency.')
+    parser.add_argument('--extract', type=float, default=1.5, help='simulated extraction seconds')
+    parser.add_argument('--search', type=float, default=2.0, help='simulated trusted-source search seconds')
+    parser.add_argument('--image', type=float, default=0.6, help='simulated seconds per image download')
+    parser.add_argument('--text', type=float, default=0.05, help='simulated text embedding seconds')
+    parser.add_argument('--speculative', action='store_true', help='enable the speculative slug search')
+    parser.add_argument('--miss-rate', type=float, default=0.2, help='share of mismatching speculative results')
+    parser.add_argument('--cascade', action='store_true', help='classify with the early-exit cascade')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    stages = simulated_stages(args.extract, args.search, args.image, args.text, args.miss_rate)
+    graph = build_analysis_graph(stages, speculative=args.speculative, cascade=args.cascade)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        report = {
+            'linear': measure(InlineExecutor(), graph, args.repeats),
+            'graph': measure(pool, graph, args.repeats),
+        }
+    report['speedup_p50'] = round(report['linear']['p50_s'] / report['graph']['p50_s'], 2)
+    snapshot = metrics.snapshot()
+    if args.cascade:
+        report['cascade'] = {name: count for name, count in snapshot['counters'].items() if name.startswith('cascade.')}
+    if args.speculative:
+        hits = snapshot['counters'].get('speculative_search.hit', 0)
+        misses = snapshot['counters'].get('speculative_search.miss', 0)
+        report['speculative_hit_rate'] = round(hits / max(1, hits + misses), 2)
+        report['speculative_saved'] = snapshot['timings'].get('speculative_search.saved')
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
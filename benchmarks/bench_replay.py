@@ -0,0 +1,113 @@
+"""
+Regression and performance runs on a recorded corpus of retailer traffic.
+
+`record` analyzes a list of URLs live and saves every exchange (pages, search
+results, images, Selenium DOM snapshots) into an archive. `replay` analyzes
+the same URLs from the archive, offline, and reports each URL's verdict, score
+and extracted fields with the time taken. Pass an earlier replay report as
+`--baseline` to list changed results and compare timings:
+
+    python -m benchmarks.bench_replay record corpus.zip --urls urls.txt
+    python -m benchmarks.bench_replay replay corpus.zip --repeats 3 --output before.json
+    python -m benchmarks.bench_replay replay corpus.zip --baseline before.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from pipeline.analysis import ExtractionError, analyze_url
+from scraping import transport
+
+# Response details compared between runs, besides the verdict and score
+DETAIL_FIELDS = ('product_title', 'product_price', 'seller', 'reference_source', 'title_similarity',
+                 'image_similarity', 'price_deviation')
+
+
+def analyze(url):
+    try:
+        result = analyze_url(url)
+    except ExtractionError as e:
+        return {'error': str(e)}
+    summary = {'verdict': result['verdict'], 'score': result['score']}
+    summary.update({name: result['details'].get(name) for name in DETAIL_FIELDS})
+    return summary
+
+
+def record(args):
+    with open(args.urls) as f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    archive = transport.use(transport.RECORD, args.archive)
+    recorded = archive.meta.setdefault('urls', [])
+    for url in urls:
+        start = time.perf_counter()
+        summary = analyze(url)
+        print(f'{time.perf_counter() - start:6.2f}s  {summary.get("verdict") or summary.get("error")}  {url}')
+        if url not in recorded:
+            recorded.append(url)
+    archive.dirty = True
+    transport.save()
+    print(f'{len(archive.exchanges)} exchanges, {len(archive.snapshots)} DOM snapshots in {args.archive}')
+
+
+def replay(args):
+    archive = transport.use(transport.REPLAY, args.archive)
+    urls = archive.meta.get('urls', [])
+    results = {}
+    for url in urls:
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            summary = analyze(url)
+            times.append(time.perf_counter() - start)
+        summary['seconds'] = round(statistics.median(times), 4)
+        results[url] = summary
+    report = {
+        'archive': args.archive,
+        'urls': len(urls),
+        'total_seconds': round(sum(r['seconds'] for r in results.values()), 3),
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = {}
+        for url, result in results.items():
+            old = baseline['results'].get(url)
+            if old is None:
+                continue
+            diff = {key: [old.get(key), value] for key, value in result.items()
+                    if key != 'seconds' and old.get(key) != value}
+            if diff:
+                changed[url] = diff
+        report['comparison'] = {
+            'changed': changed,
+            'speedup': round(baseline['total_seconds'] / report['total_seconds'], 2) if report['total_seconds'] else None,
+        }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record or replay analysis runs.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('record', help='analyze URLs live and record the traffic')
+    rec.add_argument('archive')
+    rec.add_argument('--urls', required=True, help='file with one product URL per line')
+    rep = sub.add_parser('replay', help='analyze the recorded URLs offline')
+    rep.add_argument('archive')
+    rep.add_argument('--repeats', type=int, default=1, help='runs per URL (the median time is reported)')
+    rep.add_argument('--baseline', help='earlier replay report to compare with')
+    rep.add_argument('--output', help='also write the report here')
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == '__main__':
+    main()
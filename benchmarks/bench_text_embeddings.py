@@ -0,0 +1,120 @@
+"""
+Benchmarks the sentence embedding backends used by analysis/text_similarity.py.
+
+Each backend runs in its own subprocess so import time and resident memory are
+measured in isolation. Reports single-pair latency, batched throughput, peak RSS
+and cosine agreement of the ONNX embeddings with the PyTorch ones.
+
+    python -m benchmarks.bench_text_embeddings --model-dir models/minilm-onnx
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILE = os.path.join(ROOT, 'data', 'labeling_template.csv')
+BACKENDS = ['torch', 'onnx-fp32', 'onnx-int8']
+
+
+def load_texts():
+    """Returns the product and trusted titles from the labelled data."""
+    import csv
+    texts = []
+    with open(DATA_FILE, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            texts.extend([row['title'], row['trusted_title']])
+    return texts
+
+
+def run_backend(name, model_dir, out_file, repeats):
+    """Runs inside the subprocess: loads one backend, times it and saves embeddings."""
+    start = time.perf_counter()
+    if name == 'torch':
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+        encode = lambda texts: model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    else:
+        from analysis.onnx_encoder import OnnxSentenceEncoder
+        encoder = OnnxSentenceEncoder(model_dir, quantized=(name == 'onnx-int8'))
+        encode = encoder.encode
+    load_s = time.perf_counter() - start
+
+    texts = load_texts()
+    encode(texts[:2])  # warm-up
+
+    pair_latencies = []
+    for i in range(repeats):
+        pair = texts[(2 * i) % len(texts):(2 * i) % len(texts) + 2]
+        t0 = time.perf_counter()
+        encode(pair)
+        pair_latencies.append(time.perf_counter() - t0)
+
+    batch = texts * max(1, 256 // len(texts))
+    t0 = time.perf_counter()
+    encode(batch)
+    batch_s = time.perf_counter() - t0
+
+    np.save(out_file, encode(texts))
+    print(json.dumps({
+        'backend': name,
+        'load_s': round(load_s, 3),
+        'pair_p50_ms': round(float(np.percentile(pair_latencies, 50)) * 1000, 3),
+        'pair_p95_ms': round(float(np.percentile(pair_latencies, 95)) * 1000, 3),
+        'throughput_texts_per_s': round(len(batch) / batch_s, 1),
+        # ru_maxrss is reported in KiB on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model-dir', default=os.path.join(ROOT, 'models', 'minilm-onnx'))
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--backend', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        run_backend(args.backend, args.model_dir, args.out, args.repeats)
+        return
+
+    results = {}
+    embeddings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in BACKENDS:
+            out_file = os.path.join(tmp, f'{name}.npy')
+            proc = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_text_embeddings', '--backend', name,
+                 '--model-dir', args.model_dir, '--out', out_file, '--repeats', str(args.repeats)],
+                cwd=ROOT, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f'{name}: failed\n{proc.stderr.strip()}', file=sys.stderr)
+                continue
+            results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+            embeddings[name] = np.load(out_file)
+
+    if 'torch' in embeddings:
+        reference = embeddings['torch']
+        ref_pair_sims = (reference[0::2] * reference[1::2]).sum(axis=1)
+        for name, emb in embeddings.items():
+            if name == 'torch':
+                continue
+            cosines = (emb * reference).sum(axis=1)
+            pair_sims = (emb[0::2] * emb[1::2]).sum(axis=1)
+            results[name]['cosine_vs_torch_mean'] = round(float(cosines.mean()), 5)
+            results[name]['cosine_vs_torch_min'] = round(float(cosines.min()), 5)
+            results[name]['pair_similarity_max_abs_diff'] = round(float(np.abs(pair_sims - ref_pair_sims).max()), 5)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Request time budgets.
+
+`/analyze` runs within a budget of ANALYZE_BUDGET seconds (or the request's
+own). The stage graph gives each stage a deadline within it (see
+pipeline/graph.py), and sets it as the context's deadline while the stage
+runs. Blocking calls made by the stage check that deadline:
+
+    with budget.until(time.monotonic() + 5):
+        timeout = budget.cap(10)    # <= 5, fewer as time passes
+
+Outbound requests (scraping/transport.py), Selenium page loads and element
+waits (scraping/browser.py) and politeness delays are all capped this way. A
+stage that runs out of time therefore stops waiting on the network soon after
+its deadline, rather than running on in the background.
+
+The deadline is a context variable, so it reaches the executor threads the
+stages run in. Code outside any budget is unaffected: `cap` returns its
+argument unchanged.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Timeouts are never capped below this, so a call at the deadline fails fast
+# instead of being passed a zero or negative timeout
+MIN_TIMEOUT = 0.05
+
+_deadline = contextvars.ContextVar('budget_deadline', default=None)
+
+
+class BudgetExhausted(TimeoutError):
+    """The current deadline has passed."""
+
+
+@contextmanager
+def until(deadline):
+    """
+    Sets the deadline (a time.monotonic() value) for the block. An enclosing
+    earlier deadline still applies; None leaves the current one.
+    """
+    current = _deadline.get()
+    if deadline is None or (current is not None and current <= deadline):
+        yield
+        return
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def scope(seconds):
+    """`until` a deadline `seconds` from now; no budget if `seconds` is falsy."""
+    return until(time.monotonic() + seconds if seconds else None)
+
+
+def deadline():
+    """The current deadline, or None outside a budget."""
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left before the deadline (possibly negative), or None outside a budget."""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def cap(timeout):
+    """
+    Limits a timeout to the time left.
+
+    Raises:
+        BudgetExhausted: If the deadline has already passed.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise BudgetExhausted('Time budget exhausted')
+    left = max(left, MIN_TIMEOUT)
+    return left if timeout is None else min(timeout, left)
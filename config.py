@@ -1,5 +1,164 @@
 import os
 
+
+def _parse_numbers(value):
+    """Parses 'name=number,name=number' (e.g. stage timeouts) into a dict."""
+    numbers = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, number = item.partition('=')
+        numbers[name.strip()] = float(number)
+    return numbers
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     LOG_FILE_PATH = os.environ.get('LOG_FILE_PATH') or 'application.log'
+
+    # Text similarity inference backend: 'torch' (SentenceTransformer), 'onnx', or
+    # 'lite' (character n-gram TF-IDF, no model; see analysis/lite_similarity.py).
+    # The ONNX backend falls back to torch if the exported model can't be loaded,
+    # and torch to lite.
+    TEXT_SIM_BACKEND = os.environ.get('TEXT_SIM_BACKEND') or 'torch'
+    ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR') or os.path.join(os.path.dirname(__file__), 'models', 'minilm-onnx')
+    ONNX_QUANTIZED = os.environ.get('ONNX_QUANTIZED', '1') == '1'
+    ONNX_NUM_THREADS = int(os.environ.get('ONNX_NUM_THREADS') or 0)  # 0 lets onnxruntime decide
+    # Texts from concurrent requests are embedded in shared batches of up to
+    # EMBED_MAX_BATCH, formed within EMBED_MAX_WAIT_MS (see analysis/embedding_batcher.py)
+    EMBED_BATCHING = os.environ.get('EMBED_BATCHING', '1') == '1'
+    EMBED_MAX_BATCH = int(os.environ.get('EMBED_MAX_BATCH') or 64)
+    EMBED_MAX_WAIT_MS = float(os.environ.get('EMBED_MAX_WAIT_MS') or 3)
+    # Seconds a request waits for its embeddings before failing
+    EMBED_TIMEOUT = float(os.environ.get('EMBED_TIMEOUT') or 10)
+
+    # Keyword lexicons, one <category>.txt per category (see analysis/keywords.py)
+    KEYWORD_LEXICON_DIR = os.environ.get('KEYWORD_LEXICON_DIR') or os.path.join(os.path.dirname(__file__), 'data', 'lexicons')
+
+    # Score the RandomForest with the array-based evaluator in ml/forest_eval.py
+    USE_COMPILED_FOREST = os.environ.get('USE_COMPILED_FOREST', '1') == '1'
+    # Versioned classifier artifacts (see ml/registry.py); workers pick up a new
+    # live or shadow version within MODEL_RELOAD_INTERVAL seconds (0: load once).
+    # Without a live version, ml/model.pkl is used.
+    MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR') or os.path.join(os.path.dirname(__file__), 'ml', 'registry')
+    MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL') or 5)
+
+    # Append-only Parquet store of analysed listings; empty to disable
+    FEATURE_STORE_DIR = os.environ.get('FEATURE_STORE_DIR', os.path.join(os.path.dirname(__file__), 'data', 'feature_store'))
+
+    # /analyze stage execution: 'graph' runs independent stages concurrently on a
+    # thread pool, 'linear' runs them one after another in the request thread
+    ANALYZE_EXECUTOR = os.environ.get('ANALYZE_EXECUTOR') or 'graph'
+    ANALYZE_WORKERS = int(os.environ.get('ANALYZE_WORKERS') or 16)
+    # Per-stage timeouts in seconds ('ref' is the trusted-source search, 'image'
+    # each image download); a timed-out stage falls back to its no-reference default
+    STAGE_TIMEOUTS = _parse_numbers(os.environ.get('STAGE_TIMEOUTS') or 'ref=30,text_sim=10,image=15')
+
+    # Time budget of an /analyze request in seconds (0 for none; a request can
+    # pass its own as 'budget'), and the fraction of it by which each stage must
+    # finish. Stages out of time fall back to their no-reference defaults.
+    ANALYZE_BUDGET = float(os.environ.get('ANALYZE_BUDGET') or 25)
+    ANALYZE_MAX_BUDGET = float(os.environ.get('ANALYZE_MAX_BUDGET') or 120)
+    BUDGET_SPLIT = _parse_numbers(os.environ.get('BUDGET_SPLIT') or 'product=0.5,ref=0.8,text_sim=0.95,image=0.95')
+
+    # Bulk scans (python -m pipeline.bulk): URLs extracted or analysed at once, and
+    # per retailer domain; near-duplicate listings are clustered by MinHash/LSH
+    # over title and description shingles plus the image pHash, and one per
+    # cluster is analysed (see pipeline/bulk.py)
+    BULK_WORKERS = int(os.environ.get('BULK_WORKERS') or 8)
+    BULK_DOMAIN_LIMIT = int(os.environ.get('BULK_DOMAIN_LIMIT') or 2)
+    BULK_MINHASH_PERM = int(os.environ.get('BULK_MINHASH_PERM') or 128)
+    BULK_LSH_BANDS = int(os.environ.get('BULK_LSH_BANDS') or 32)
+    # Estimated Jaccard similarity of the shingles, and pHash bits, of near-duplicates
+    BULK_TEXT_THRESHOLD = float(os.environ.get('BULK_TEXT_THRESHOLD') or 0.6)
+    BULK_IMAGE_DISTANCE = int(os.environ.get('BULK_IMAGE_DISTANCE') or 8)
+
+    # Watchlist monitoring (python -m pipeline.watchlist): state in SQLite, each URL
+    # re-checked once per interval (seconds) with conditional requests; checks running
+    # at once, of which on one domain, and seconds between starting two on one domain
+    WATCHLIST_DB = os.environ.get('WATCHLIST_DB') or os.path.join(os.path.dirname(__file__), 'data', 'watchlist.sqlite3')
+    WATCHLIST_INTERVAL = float(os.environ.get('WATCHLIST_INTERVAL') or 86400)
+    WATCHLIST_WORKERS = int(os.environ.get('WATCHLIST_WORKERS') or 4)
+    WATCHLIST_DOMAIN_LIMIT = int(os.environ.get('WATCHLIST_DOMAIN_LIMIT') or 1)
+    WATCHLIST_DOMAIN_DELAY = float(os.environ.get('WATCHLIST_DOMAIN_DELAY') or 2)
+
+    # Search trusted sources with a query from the URL slug while the page is extracted,
+    # keeping the result if its title matches the extracted title at least this closely
+    SPECULATIVE_SEARCH = os.environ.get('SPECULATIVE_SEARCH', '0') == '1'
+    SPECULATIVE_MATCH_THRESHOLD = float(os.environ.get('SPECULATIVE_MATCH_THRESHOLD') or 0.6)
+
+    # Trusted-source search routing (see scraping/routing.py): a query's product
+    # category, from the lexicons in CATEGORY_LEXICON_DIR, picks the sources most
+    # likely to match until the estimated chance of a match reaches ROUTING_TARGET.
+    # Hit rates per category and source are learned in ROUTING_DB ('' keeps them
+    # in memory), synced every ROUTING_SYNC_INTERVAL seconds; a ROUTING_EXPLORE
+    # share of searches query every source.
+    ROUTING_ENABLED = os.environ.get('ROUTING_ENABLED', '1') == '1'
+    CATEGORY_LEXICON_DIR = os.environ.get('CATEGORY_LEXICON_DIR') or os.path.join(os.path.dirname(__file__), 'data', 'categories')
+    ROUTING_DB = os.environ.get('ROUTING_DB', os.path.join(os.path.dirname(__file__), 'data', 'routing.sqlite3'))
+    ROUTING_TARGET = float(os.environ.get('ROUTING_TARGET') or 0.9)
+    ROUTING_MIN_SOURCES = int(os.environ.get('ROUTING_MIN_SOURCES') or 2)
+    ROUTING_EXPLORE = float(os.environ.get('ROUTING_EXPLORE', 0.05))
+    ROUTING_SYNC_INTERVAL = float(os.environ.get('ROUTING_SYNC_INTERVAL') or 30)
+
+    # Classify from the cheap features first and compute text/image similarity only
+    # while they could change the verdict (see ml/cascade.py)
+    ANALYZE_CASCADE = os.environ.get('ANALYZE_CASCADE', '0') == '1'
+    # Largest score uncertainty (in points) at which the cascade may stop early
+    CASCADE_MAX_SPREAD = int(os.environ.get('CASCADE_MAX_SPREAD') or 15)
+
+    # Scraped pages are streamed and cut off after this many (decoded) bytes
+    FETCH_MAX_BYTES = int(os.environ.get('FETCH_MAX_BYTES') or 3 * 1024 * 1024)
+    FETCH_CHUNK_SIZE = int(os.environ.get('FETCH_CHUNK_SIZE') or 16 * 1024)
+
+    # Selenium: the lean profile (headless-friendly, eager page load, images, fonts,
+    # media and ad/analytics hosts blocked); see scraping/browser.py
+    BROWSER_LEAN = os.environ.get('BROWSER_LEAN', '1') == '1'
+    BROWSER_HEADLESS = os.environ.get('BROWSER_HEADLESS', '1') == '1'
+    # Seconds to wait for optional elements (price, description) after the required ones
+    BROWSER_OPTIONAL_WAIT = float(os.environ.get('BROWSER_OPTIONAL_WAIT') or 2)
+
+    # Logging (see serving/logging_setup.py): records are written as JSON lines by
+    # a background thread; LOG_ASYNC=0 writes them in the request thread instead
+    LOG_LEVEL = (os.environ.get('LOG_LEVEL') or 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT') or 'json'  # 'json' or 'text'
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', '1') == '1'
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES') or 10 * 1024 * 1024)
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT') or 5)
+    # Fraction of DEBUG records kept when LOG_LEVEL=DEBUG
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE') or 0.01)
+
+    # Base URL all retailer, search and image requests are redirected to, as
+    # '<override>/<host>/<path>' (used by the load test, see loadtest/)
+    UPSTREAM_OVERRIDE = os.environ.get('UPSTREAM_OVERRIDE') or ''
+
+    # Per-request profiling (see profiling.py): /analyze requests with an
+    # 'X-Profile: <PROFILE_TOKEN>' header are profiled; unset disables it
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN') or ''
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or 'profiles'
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS') or 5)
+    # Saved profiles kept
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP') or 50)
+
+    # Outbound HTTP (see scraping/transport.py): 'live', 'record' (exchanges are
+    # saved to TRANSPORT_ARCHIVE on exit) or 'replay' (answered from it, offline)
+    TRANSPORT_MODE = os.environ.get('TRANSPORT_MODE') or 'live'
+    TRANSPORT_ARCHIVE = os.environ.get('TRANSPORT_ARCHIVE') or 'corpus.zip'
+
+    # Admission of /analyze requests (see serving/scheduler.py): analyses running
+    # at once per worker, in total and per retailer domain. Bulk requests
+    # ('X-Priority: bulk') leave SCHED_INTERACTIVE_RESERVE slots of each free.
+    SCHED_CONCURRENCY = int(os.environ.get('SCHED_CONCURRENCY') or 6)
+    SCHED_DOMAIN_LIMIT = int(os.environ.get('SCHED_DOMAIN_LIMIT') or 3)
+    SCHED_INTERACTIVE_RESERVE = int(os.environ.get('SCHED_INTERACTIVE_RESERVE') or 2)
+    # Fair-queuing weights of API clients ('X-Client-Id'), 'client=weight,...'
+    SCHED_CLIENT_WEIGHTS = _parse_numbers(os.environ.get('SCHED_CLIENT_WEIGHTS') or '')
+    # Bulk requests allowed to wait per worker, and seconds any request waits
+    # for a slot; past either, /analyze answers 503 with Retry-After
+    SCHED_BULK_QUEUE = int(os.environ.get('SCHED_BULK_QUEUE') or 4)
+    SCHED_WAIT_TIMEOUT = float(os.environ.get('SCHED_WAIT_TIMEOUT') or 60)
+
+    # Single-flight (see pipeline/singleflight.py): directory for the lock and
+    # result files that let gunicorn workers share executions; empty shares
+    # them between threads of one process only
+    SINGLEFLIGHT_DIR = os.environ.get('SINGLEFLIGHT_DIR') or ''
+    # Seconds to wait for another worker's execution before running it anyway
+    SINGLEFLIGHT_WAIT = float(os.environ.get('SINGLEFLIGHT_WAIT') or 60)
@@ -0,0 +1,58 @@
+"""
+Production launch configuration: preloaded models shared copy-on-write between workers.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Environment:
+    WEB_CONCURRENCY   number of worker processes (default: number of cores)
+    WORKER_THREADS    request threads per worker (default: 16, scraping is I/O bound;
+                      more than SCHED_CONCURRENCY + SCHED_BULK_QUEUE, so bulk
+                      requests can't occupy every thread)
+    BIND              listen address (default: 0.0.0.0:8000)
+    SINGLEFLIGHT_DIR  lock files letting workers share identical scrapes; must be
+                      private to the server's user (default: <tmp>/fakeproduct-singleflight-<uid>)
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from serving import prefork  # noqa: E402
+
+workers = int(os.environ.get('WEB_CONCURRENCY') or prefork.threads_per_worker(1))
+threads = int(os.environ.get('WORKER_THREADS') or 16)
+worker_class = 'gthread'
+bind = os.environ.get('BIND') or '0.0.0.0:8000'
+timeout = 120
+
+# Workers coordinate identical in-flight scrapes through lock files, in a
+# directory private to this user (created 0700, refused otherwise)
+os.environ.setdefault('SINGLEFLIGHT_DIR', os.path.join(tempfile.gettempdir(), f'fakeproduct-singleflight-{os.getuid()}'))
+
+# Load app.py (and with it the SentenceTransformer and RandomForest) once in
+# the master before forking the workers.
+preload_app = True
+
+# Torch/BLAS threads per worker so that all workers together match the cores.
+# Must be set before the master imports numpy/torch.
+compute_threads = prefork.threads_per_worker(workers)
+prefork.limit_thread_env(compute_threads)
+
+
+def when_ready(server):
+    # The app is loaded by now; freeze it so worker GCs don't dirty its pages
+    prefork.freeze_heap()
+    server.log.info(f'Models preloaded, master memory: {prefork.memory_report()}')
+
+
+def post_fork(server, worker):
+    prefork.configure_worker(compute_threads)
+
+
+def post_worker_init(worker):
+    worker.log.info(f'Worker {worker.pid} ready ({compute_threads} compute threads), memory: {prefork.memory_report()}')
+
+
+def worker_exit(server, worker):
+    server.log.info(f'Worker {worker.pid} exiting, memory: {prefork.memory_report(worker.pid)}')
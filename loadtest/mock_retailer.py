@@ -0,0 +1,250 @@
+"""
+Local stand-in for the retailer, search and image hosts, for load tests.
+
+Run the app with UPSTREAM_OVERRIDE pointing here and every outgoing request
+arrives as `/<host>/<path>` (see `scraping.transport.upstream_url`). The
+server answers from the recorded responses in `loadtest/fixtures/`:
+
+- `images/*.jpg` for image URLs (picked by a hash of the path);
+- `search/<host>.html` for search pages, with `{query}` replaced by the
+  search terms so the result matches;
+- `product/<host>.html` for anything else, or `product/default.html` (a page
+  with JSON-LD and OpenGraph data) for hosts without a recording.
+
+Every response can be delayed (`latency_ms` ± `jitter_ms`, and throttled to
+`mbps`), padded with inline scripts to a realistic size, or replaced by an
+injected failure: a 503, a hang of `slow_ms`, or a reset connection.
+`/__stats` returns the counts of requests served and failures injected.
+
+    python -m loadtest.mock_retailer --port 8800 --latency-ms 150 --error-rate 0.02
+"""
+import argparse
+import html
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+# Query parameters holding the search terms, per search URL in scraping/trusted_sources.py
+QUERY_PARAMS = ('k', 'q', 'keyword', 'text')
+
+
+class MockSettings:
+    """Latency and failure injection applied to every response."""
+
+    def __init__(self, latency_ms=150, jitter_ms=50, mbps=0, page_kb=300, error_rate=0.0,
+                 slow_rate=0.0, slow_ms=15000, reset_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.mbps = mbps
+        self.page_kb = page_kb
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.reset_rate = reset_rate
+        self.random = random.Random(seed)
+
+    def as_dict(self):
+        return {key: value for key, value in vars(self).items() if key != 'random'}
+
+
+class Fixtures:
+    """Recorded responses, read once at startup."""
+
+    def __init__(self, directory=FIXTURES_DIR, page_kb=0):
+        self.pages = {}
+        for kind in ('product', 'search'):
+            folder = os.path.join(directory, kind)
+            for name in os.listdir(folder):
+                if name.endswith('.html'):
+                    with open(os.path.join(folder, name), encoding='utf-8') as f:
+                        self.pages[kind, name[:-len('.html')]] = f.read()
+        folder = os.path.join(directory, 'images')
+        self.images = []
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), 'rb') as f:
+                self.images.append(f.read())
+        # Real pages carry hundreds of KB of inline scripts after the product
+        # details; the app stops reading before them
+        script = '<script>window.__state = "' + 'x' * 16 * 1024 + '";</script>\n'
+        self.padding = script * (page_kb // 16)
+
+    def page(self, kind, host, query=''):
+        body = self.pages.get((kind, host)) or self.pages.get((kind, 'default'))
+        if body is None:
+            return None
+        body = body.replace('{query}', html.escape(query))
+        return body.replace('</body>', self.padding + '</body>', 1).encode('utf-8')
+
+    def image(self, path):
+        return self.images[zlib.crc32(path.encode()) % len(self.images)]
+
+
+def route(fixtures, path):
+    """
+    Picks the response for a redirected request.
+
+    Args:
+        fixtures (Fixtures): The recorded responses.
+        path (str): Request path with query, '/<host>/<path>?<query>'.
+
+    Returns:
+        tuple: (kind, content type, body), body None if nothing matches.
+    """
+    parts = urlsplit(path)
+    host, _, rest = parts.path.lstrip('/').partition('/')
+    rest = '/' + rest
+    if rest.lower().endswith(IMAGE_EXTENSIONS):
+        return 'image', 'image/jpeg', fixtures.image(parts.path)
+    params = parse_qs(parts.query)
+    query = next((params[name][0] for name in QUERY_PARAMS if name in params), None)
+    if query is not None or rest.rstrip('/').endswith('/search'):
+        # Reliance Digital appends ':relevance' to the query
+        query = (query or '').split(':')[0]
+        return 'search', 'text/html; charset=utf-8', fixtures.page('search', host, query)
+    return 'product', 'text/html; charset=utf-8', fixtures.page('product', host)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping connections (early-stopped downloads) is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(host='127.0.0.1', port=0, settings=None, fixtures_dir=FIXTURES_DIR):
+    """
+    Creates the mock retailer server (not started).
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port, 0 for a free one.
+        settings (MockSettings): Latency and failure injection.
+        fixtures_dir (str): Directory with product/, search/ and images/.
+
+    Returns:
+        ThreadingHTTPServer: The server; its `stats` Counter counts requests
+                             per kind and injected failures.
+    """
+    settings = settings or MockSettings()
+    fixtures = Fixtures(fixtures_dir, settings.page_kb)
+    stats = Counter()
+    stats_lock = threading.Lock()
+
+    def count(key):
+        with stats_lock:
+            stats[key] += 1
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path == '/__stats':
+                with stats_lock:
+                    body = json.dumps(dict(stats)).encode()
+                return self._send(200, 'application/json', body)
+
+            kind, content_type, body = route(fixtures, self.path)
+            count(kind)
+            rng = settings.random
+            roll = rng.random()
+            delay = max(0.0, settings.latency_ms + rng.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000
+            if roll < settings.reset_rate:
+                count('injected.reset')
+                time.sleep(delay)
+                # RST instead of FIN
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                self.close_connection = True
+                return
+            roll -= settings.reset_rate
+            if roll < settings.error_rate:
+                count('injected.error')
+                time.sleep(delay)
+                return self._send(503, 'text/plain', b'Service Unavailable')
+            roll -= settings.error_rate
+            if roll < settings.slow_rate:
+                count('injected.slow')
+                delay += settings.slow_ms / 1000
+            time.sleep(delay)
+            if body is None:
+                count('not_found')
+                return self._send(404, 'text/plain', b'Not Found')
+            self._send(200, content_type, body)
+
+        def _send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            chunk = 64 * 1024
+            try:
+                for i in range(0, len(body), chunk):
+                    self.wfile.write(body[i:i + chunk])
+                    if settings.mbps:
+                        time.sleep(min(chunk, len(body) - i) * 8 / (settings.mbps * 1e6))
+            except (BrokenPipeError, ConnectionResetError):
+                # The app stops reading once it has the elements it needs
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    server = _Server((host, port), Handler)
+    server.stats = stats
+    return server
+
+
+def start_server(host='127.0.0.1', port=0, settings=None, fixtures_dir=FIXTURES_DIR):
+    """Starts `make_server` in a daemon thread and returns the server."""
+    server = make_server(host, port, settings, fixtures_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    """Adds the MockSettings options to an argparse parser."""
+    parser.add_argument('--latency-ms', type=float, default=150, help='mean response delay')
+    parser.add_argument('--jitter-ms', type=float, default=50, help='uniform +/- jitter on the delay')
+    parser.add_argument('--mbps', type=float, default=0, help='bandwidth per response (0 = unthrottled)')
+    parser.add_argument('--page-kb', type=int, default=300, help='inline script padding after the product details')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 503 responses')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='fraction of responses delayed by --slow-ms')
+    parser.add_argument('--slow-ms', type=float, default=15000)
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='fraction of connections reset')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def settings_from_args(args):
+    return MockSettings(args.latency_ms, args.jitter_ms, args.mbps, args.page_kb, args.error_rate,
+                        args.slow_rate, args.slow_ms, args.reset_rate, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock retailer server for load tests.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, settings_from_args(args))
+    print(f'Mock retailer on http://{args.host}:{server.server_address[1]} '
+          f'(run the app with UPSTREAM_OVERRIDE=http://{args.host}:{server.server_address[1]})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+Load test: how many concurrent /analyze requests one box sustains.
+
+Starts the mock retailer (`loadtest/mock_retailer.py`) and the app (gunicorn
+with the bundled config, with UPSTREAM_OVERRIDE pointing at the mock), then
+drives POST /analyze with closed-loop workers at increasing concurrency. Each
+step reports throughput, latency percentiles and error rates, and the
+saturation point is where more concurrency stops adding throughput. The
+report is JSON, and `--baseline` adds the change against an earlier report:
+
+    python -m loadtest.run --concurrency 1,2,4,8,16 --duration 30 --output report.json
+    python -m loadtest.run --baseline report.json --output report-new.json
+
+`--bulk-concurrency N` adds N workers sending bulk requests (`X-Priority:
+bulk`, see serving/scheduler.py) alongside every step, which is reported as
+interactive traffic with the bulk throughput and latency next to it.
+
+To test an app that is already running (started with UPSTREAM_OVERRIDE set to
+a mock started separately), pass `--app-url` and `--mock-url`.
+"""
+import argparse
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import requests
+
+from loadtest.mock_retailer import add_arguments, settings_from_args, start_server
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_APP_CMD = 'gunicorn -c gunicorn.conf.py --bind 127.0.0.1:{port} app:app'
+
+# Product pages with a recording in loadtest/fixtures/product/ (the last host
+# has none, so it gets the structured-data page)
+DEFAULT_URLS = [
+    'https://www.amazon.in/Sony-WH-1000XM4-Cancelling-Headphones-Bluetooth/dp/B0863TXGM3',
+    'https://www.flipkart.com/sony-wh-1000xm4-bluetooth-headset/p/itmd6ca1f5b7ec71',
+    'https://www.snapdeal.com/product/sony-wh1000xm4-over-ear-wireless/638974453123',
+    'https://www.example-brand.in/products/sony-wh-1000xm4-wireless-noise-cancelling-headphones',
+]
+
+# Per-step latency percentiles reported, in percent
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def one_request(session, app_url, url, timeout, headers=None):
+    """
+    Posts one URL to /analyze.
+
+    Returns:
+        str: None on success, else the error kind ('http_<status>',
+             'app_error' for an {'error': ...} response, 'timeout' or
+             'connection').
+    """
+    try:
+        resp = session.post(f'{app_url}/analyze', data={'url': url}, timeout=timeout, headers=headers)
+    except requests.Timeout:
+        return 'timeout'
+    except requests.RequestException:
+        return 'connection'
+    if resp.status_code != 200:
+        return f'http_{resp.status_code}'
+    try:
+        body = resp.json()
+    except ValueError:
+        return 'invalid_json'
+    return 'app_error' if 'error' in body else None
+
+
+def run_step(app_url, urls, concurrency, duration, timeout, bulk_concurrency=0):
+    """
+    Runs `concurrency` closed-loop workers for `duration` seconds.
+
+    Requests still in flight at the end are waited for and counted.
+
+    Args:
+        bulk_concurrency (int): Extra workers sending bulk-priority requests.
+
+    Returns:
+        dict: Throughput, latency percentiles (ms) and error counts of the
+              step, and of its bulk traffic under 'bulk'.
+    """
+    results = {'interactive': ([], Counter()), 'bulk': ([], Counter())}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(index, priority, stride):
+        session = requests.Session()
+        headers = {'X-Priority': priority, 'X-Client-Id': f'loadtest-{priority}'}
+        latencies, errors = results[priority]
+        i = index
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            error = one_request(session, app_url, urls[i % len(urls)], timeout, headers)
+            elapsed = time.perf_counter() - start
+            i += stride
+            with lock:
+                latencies.append(elapsed)
+                if error:
+                    errors[error] += 1
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(n, 'interactive', concurrency), daemon=True)
+               for n in range(concurrency)]
+    threads += [threading.Thread(target=worker, args=(n, 'bulk', bulk_concurrency), daemon=True)
+                for n in range(bulk_concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - start
+
+    step = {'concurrency': concurrency, **summarize(*results['interactive'], wall)}
+    if bulk_concurrency:
+        step['bulk'] = {'concurrency': bulk_concurrency, **summarize(*results['bulk'], wall)}
+    return step
+
+
+def summarize(latencies, errors, wall):
+    """Throughput, error and latency figures of one kind of traffic in a step."""
+    latencies.sort()
+    total = len(latencies)
+    failed = sum(errors.values())
+    summary = {
+        'requests': total,
+        'duration_s': round(wall, 2),
+        'throughput_rps': round(total / wall, 3),
+        'goodput_rps': round((total - failed) / wall, 3),
+        'error_rate': round(failed / total, 4) if total else None,
+        'errors': dict(errors),
+        'latency_ms': {f'p{pct}': round(percentile(latencies, pct) * 1000, 1) if total else None
+                       for pct in PERCENTILES},
+    }
+    summary['latency_ms']['mean'] = round(sum(latencies) / total * 1000, 1) if total else None
+    summary['latency_ms']['max'] = round(latencies[-1] * 1000, 1) if total else None
+    return summary
+
+
+def saturation(steps, min_gain=0.1):
+    """
+    Finds where adding concurrency stops paying off.
+
+    Args:
+        steps (list): Step reports in increasing concurrency.
+        min_gain (float): Relative goodput gain below which a step counts as saturated.
+
+    Returns:
+        dict: The last concurrency before goodput gained less than `min_gain`,
+              with its goodput, or the highest concurrency tested if every
+              step still gained ('reached' is then False).
+    """
+    best = steps[0]
+    for step in steps[1:]:
+        if step['goodput_rps'] < best['goodput_rps'] * (1 + min_gain):
+            return {'concurrency': best['concurrency'], 'goodput_rps': best['goodput_rps'], 'reached': True}
+        best = step
+    return {'concurrency': best['concurrency'], 'goodput_rps': best['goodput_rps'], 'reached': False}
+
+
+def compare(report, baseline):
+    """Ratios of goodput and p99 latency against a baseline report, per concurrency."""
+    old_steps = {step['concurrency']: step for step in baseline.get('steps', [])}
+    changes = []
+    for step in report['steps']:
+        old = old_steps.get(step['concurrency'])
+        if not old or not old['goodput_rps'] or not old['latency_ms']['p99']:
+            continue
+        changes.append({
+            'concurrency': step['concurrency'],
+            'goodput_ratio': round(step['goodput_rps'] / old['goodput_rps'], 3),
+            'p99_ratio': round(step['latency_ms']['p99'] / old['latency_ms']['p99'], 3),
+            'error_rate_delta': round((step['error_rate'] or 0) - (old['error_rate'] or 0), 4),
+        })
+    return {'baseline_version': baseline.get('meta', {}).get('version'), 'steps': changes}
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def start_app(cmd, port, mock_url, startup_timeout):
+    """Starts the app with UPSTREAM_OVERRIDE set and waits until /stats answers."""
+    env = dict(os.environ, UPSTREAM_OVERRIDE=mock_url)
+    proc = subprocess.Popen(shlex.split(cmd.format(port=port)), cwd=ROOT_DIR, env=env)
+    app_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'App exited with status {proc.returncode}')
+        try:
+            if requests.get(f'{app_url}/stats', timeout=2).status_code == 200:
+                return proc, app_url
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    proc.terminate()
+    raise RuntimeError(f'App did not answer within {startup_timeout}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Step-load /analyze against a mock retailer.')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='comma-separated concurrency steps')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per step')
+    parser.add_argument('--warmup', type=float, default=10, help='seconds of unrecorded load first')
+    parser.add_argument('--timeout', type=float, default=60, help='client timeout per request')
+    parser.add_argument('--bulk-concurrency', type=int, default=0,
+                        help='bulk-priority workers running alongside every step')
+    parser.add_argument('--urls', help='file with one product URL per line (default: the recorded ones)')
+    parser.add_argument('--app-url', help='use a running app instead of starting one')
+    parser.add_argument('--app-cmd', default=DEFAULT_APP_CMD, help='command starting the app ({port} is substituted)')
+    parser.add_argument('--app-port', type=int, default=5055)
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--mock-url', help='use a running mock retailer instead of starting one')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    urls = DEFAULT_URLS
+    if args.urls:
+        with open(args.urls) as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    mock = None
+    mock_url = args.mock_url
+    if not mock_url:
+        mock = start_server(settings=settings_from_args(args))
+        mock_url = f'http://127.0.0.1:{mock.server_address[1]}'
+    proc = None
+    app_url = args.app_url
+    try:
+        if not app_url:
+            proc, app_url = start_app(args.app_cmd, args.app_port, mock_url, args.startup_timeout)
+        if args.warmup:
+            run_step(app_url, urls, levels[0], args.warmup, args.timeout)
+        steps = []
+        for level in levels:
+            step = run_step(app_url, urls, level, args.duration, args.timeout, args.bulk_concurrency)
+            print(f"concurrency {level}: {step['goodput_rps']} req/s, p95 {step['latency_ms']['p95']} ms, "
+                  f"p99 {step['latency_ms']['p99']} ms, errors {step['error_rate']}", file=sys.stderr)
+            if 'bulk' in step:
+                print(f"  bulk x{args.bulk_concurrency}: {step['bulk']['goodput_rps']} req/s, "
+                      f"p95 {step['bulk']['latency_ms']['p95']} ms, errors {step['bulk']['error_rate']}", file=sys.stderr)
+            steps.append(step)
+        app_stats = requests.get(f'{app_url}/stats', timeout=10).json()
+        mock_stats = requests.get(f'{mock_url}/__stats', timeout=10).json()
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if mock is not None:
+            mock.shutdown()
+
+    report = {
+        'meta': {
+            'version': git_version(),
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'app': args.app_url or args.app_cmd.format(port=args.app_port),
+            'urls': urls,
+            'duration_s': args.duration,
+            'bulk_concurrency': args.bulk_concurrency,
+            'mock': settings_from_args(args).as_dict() if mock is not None else {'url': mock_url},
+        },
+        'steps': steps,
+        'saturation': saturation(steps),
+        'app_stats': app_stats,
+        'mock_stats': mock_stats,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
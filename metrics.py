@@ -0,0 +1,64 @@
+"""
+Process-wide counters and timings, exposed as JSON at /stats.
+
+    metrics.incr('speculative_search.hit')
+    metrics.observe('stage.extract', 1.84)   # seconds
+"""
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+import numpy as np
+
+# Most recent samples kept per timing
+MAX_SAMPLES = 1000
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(int)
+_timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+
+
+def incr(name, n=1):
+    """Adds `n` to a counter."""
+    with _lock:
+        _counters[name] += n
+
+
+def observe(name, seconds):
+    """Records one duration sample."""
+    with _lock:
+        _timings[name].append(seconds)
+
+
+def counter(name):
+    """Returns the current value of a counter."""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    """
+    Returns all counters, plus count/mean/p50/p95 (in ms) of every timing.
+    """
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: list(samples) for name, samples in _timings.items()}
+    summary = {}
+    for name, samples in timings.items():
+        if not samples:
+            continue
+        ms = np.asarray(samples) * 1000
+        summary[name] = {
+            'count': len(ms),
+            'mean_ms': round(float(ms.mean()), 2),
+            'p50_ms': round(float(np.percentile(ms, 50)), 2),
+            'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        }
+    return {'counters': counters, 'timings': summary}
+
+
+def reset():
+    """Clears all counters and timings."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
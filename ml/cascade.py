@@ -0,0 +1,217 @@
+"""
+Cost-aware early exit for classification.
+
+Text similarity needs the sentence embedding and image similarity needs two
+image downloads, while price deviation, the seller check, reviews and the
+keyword flags are cheap once the page and the reference are known. The
+cascade scores the cheap features first and bounds the score over every
+possible value of the missing similarities (both lie in [0, 1]):
+
+- with the RandomForest, `CompiledForest.predict_proba_bounds` follows both
+  branches of any split on a missing feature;
+- the rule-based fallback only increases with either similarity, so scoring
+  with both at 0 and at 1 gives the bounds.
+
+If both bounds give the same verdict and are at most `max_spread` score
+points apart, nothing else can change the verdict and the expensive features
+are skipped. Otherwise text similarity (milliseconds) is added, and image
+similarity (seconds) only if the verdict is still open.
+
+Compare the cascade with the full pipeline on labelled or stored features:
+
+    python -m ml.cascade --data data/labeling_template.csv --max-spread 15
+    python -m ml.cascade --feature-store data/feature_store --since 2026-10-01 --sweep
+"""
+import argparse
+import logging
+import threading
+
+import numpy as np
+
+from config import Config
+from ml import classifier
+from ml.feature_store import FEATURE_COLUMNS, TRAINING_COLUMN_NAMES
+from ml.forest_eval import compile_forest
+
+logger = logging.getLogger(__name__)
+
+# Expensive features, in the order the cascade computes them
+EXPENSIVE_FEATURES = ['text_similarity', 'image_similarity']
+# Range of each expensive feature
+FEATURE_RANGES = {'text_similarity': (0.0, 1.0), 'image_similarity': (0.0, 1.0)}
+
+_forests = {}
+_forest_lock = threading.Lock()
+
+
+def _compiled_forest(live):
+    """The live model's compiled forest, compiled here if it scores with sklearn."""
+    if live.forest is not None:
+        return live.forest
+    # A reloaded legacy model.pkl keeps the version name 'legacy'
+    key = (live.version, live.meta.get('mtime'))
+    with _forest_lock:
+        if key not in _forests:
+            try:
+                _forests[key] = compile_forest(live.sklearn)
+            except Exception as e:
+                logger.warning(f'Cascade disabled, could not compile model: {e}')
+                _forests[key] = None
+    return _forests[key]
+
+
+def score_bounds(features):
+    """
+    Bounds the classify_product score when some expensive features are unknown.
+
+    Args:
+        features (dict): Feature values keyed by FEATURE_COLUMNS; None where not
+                         computed yet.
+
+    Returns:
+        tuple: (low, high, verdict_bands), or None if the model can't be bounded.
+    """
+    lower = [features[col] if features[col] is not None else FEATURE_RANGES[col][0] for col in FEATURE_COLUMNS]
+    upper = [features[col] if features[col] is not None else FEATURE_RANGES[col][1] for col in FEATURE_COLUMNS]
+    live = classifier.registry.live()
+    if live is None:
+        low, _ = classifier.classify_product(*lower)
+        high, _ = classifier.classify_product(*upper)
+        return low, high, classifier.FALLBACK_VERDICTS
+
+    forest = _compiled_forest(live)
+    if forest is None:
+        return None
+    x = [np.nan if features[col] is None else float(features[col]) for col in FEATURE_COLUMNS]
+    low, high = forest.predict_proba_bounds(x, lower, upper)
+    # Same rounding as classify_product
+    return int(low[1] * 100), int(high[1] * 100), classifier.MODEL_VERDICTS
+
+
+def early_exit(features, max_spread=None):
+    """
+    Decides the verdict without the unknown features, if they can't change it.
+
+    Args:
+        features (dict): Feature values keyed by FEATURE_COLUMNS; None where unknown.
+        max_spread (int): Largest allowed gap between the score bounds,
+                          defaults to Config.CASCADE_MAX_SPREAD.
+
+    Returns:
+        tuple: (score, verdict) with the score at the middle of the bounds, or
+               None if the remaining features are needed.
+    """
+    if max_spread is None:
+        max_spread = Config.CASCADE_MAX_SPREAD
+    bounds = score_bounds(features)
+    if bounds is None:
+        return None
+    low, high, bands = bounds
+    verdict = classifier.verdict_for(low, bands)
+    if verdict != classifier.verdict_for(high, bands) or high - low > max_spread:
+        return None
+    return (low + high) // 2, verdict
+
+
+def cascade_classify(features, compute, max_spread=None):
+    """
+    Classifies with the cheap features first, computing expensive ones only as needed.
+
+    Args:
+        features (dict): The cheap features, keyed by FEATURE_COLUMNS.
+        compute (callable): `compute(name)` returns the value of an expensive feature.
+        max_spread (int): See `early_exit`.
+
+    Returns:
+        tuple: (score, verdict, computed) where `computed` lists the expensive
+               features that were needed.
+    """
+    features = dict(features, **{name: None for name in EXPENSIVE_FEATURES})
+    computed = []
+    for name in EXPENSIVE_FEATURES:
+        decision = early_exit(features, max_spread)
+        if decision is not None:
+            return decision[0], decision[1], computed
+        features[name] = compute(name)
+        computed.append(name)
+    score, verdict = classifier.classify_product(*(features[col] for col in FEATURE_COLUMNS))
+    return score, verdict, computed
+
+
+def evaluate(df, max_spread):
+    """
+    Runs the cascade over rows whose features are all known, against the full model.
+
+    Args:
+        df (pd.DataFrame): Rows with the FEATURE_COLUMNS (and optionally `label`).
+        max_spread (int): See `early_exit`.
+
+    Returns:
+        dict: Rows, skip rates per expensive feature, exit rates per step,
+              verdict agreement and mean score difference with the full model,
+              and accuracy of both against `label` if present.
+    """
+    exits = {name: 0 for name in EXPENSIVE_FEATURES + ['full']}
+    skipped = {name: 0 for name in EXPENSIVE_FEATURES}
+    agree, score_diff = 0, 0
+    correct = {'full': 0, 'cascade': 0}
+    labels = df['label'].str.strip().str.lower() if 'label' in df.columns else None
+    bands = classifier.MODEL_VERDICTS if classifier.registry.live() is not None else classifier.FALLBACK_VERDICTS
+    # The two genuine verdicts count as predicting genuine
+    genuine_verdicts = {bands[0][1], bands[1][1]}
+
+    for i, row in enumerate(df[FEATURE_COLUMNS].itertuples(index=False, name=None)):
+        full_score, full_verdict = classifier.classify_product(*row)
+        row = dict(zip(FEATURE_COLUMNS, row))
+        score, verdict, computed = cascade_classify(row, row.__getitem__, max_spread)
+        step = EXPENSIVE_FEATURES[len(computed)] if len(computed) < len(EXPENSIVE_FEATURES) else 'full'
+        exits[step] += 1
+        for name in EXPENSIVE_FEATURES:
+            skipped[name] += name not in computed
+        agree += verdict == full_verdict
+        score_diff += abs(score - full_score)
+        if labels is not None:
+            genuine = labels.iloc[i] == 'genuine'
+            correct['full'] += (full_verdict in genuine_verdicts) == genuine
+            correct['cascade'] += (verdict in genuine_verdicts) == genuine
+
+    n = max(1, len(df))
+    report = {
+        'rows': len(df),
+        'max_spread': max_spread,
+        'skip_rate': {name: round(count / n, 3) for name, count in skipped.items()},
+        # Share of rows decided before computing each feature ('full' = all computed)
+        'exit_before': {name: round(count / n, 3) for name, count in exits.items()},
+        'verdict_agreement': round(agree / n, 3),
+        'mean_abs_score_diff': round(score_diff / n, 2),
+    }
+    if labels is not None:
+        report['accuracy'] = {name: round(count / n, 3) for name, count in correct.items()}
+    return report
+
+
+if __name__ == '__main__':
+    import json
+
+    import pandas as pd
+
+    from ml.feature_store import read_features
+
+    parser = argparse.ArgumentParser(description='Compare the classification cascade with the full model.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--data', help='labelled CSV (as used by train_model.py)')
+    source.add_argument('--feature-store', help='feature store root')
+    parser.add_argument('--since')
+    parser.add_argument('--max-spread', type=int, default=Config.CASCADE_MAX_SPREAD)
+    parser.add_argument('--sweep', action='store_true', help='report a range of --max-spread values')
+    args = parser.parse_args()
+
+    if args.data:
+        df = pd.read_csv(args.data).rename(columns={v: k for k, v in TRAINING_COLUMN_NAMES.items()})
+    else:
+        df = read_features(args.feature_store, since=args.since)
+        df = df[~df['trusted_domain']]
+    df = df.dropna(subset=FEATURE_COLUMNS)
+    spreads = [0, 5, 10, 15, 20, 30, 50, 100] if args.sweep else [args.max_spread]
+    for spread in spreads:
+        print(json.dumps(evaluate(df, spread)))
@@ -1,22 +1,51 @@
+import logging
 import os
-import joblib
 from typing import Any, Tuple
-# Placeholder for future scikit-learn model
-model = None
+
+import metrics
+from config import Config
+from ml.registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+# Used while the registry has no live version
 model_path = os.path.join(os.path.dirname(__file__), 'model.pkl')
 
-# Load the pre-trained machine learning model from the specified path.
-# The model is expected to be saved using joblib.
-if os.path.exists(model_path):
+# The live (and shadow) model; reloaded when a new version is activated
+registry = ModelRegistry(Config.MODEL_REGISTRY_DIR, reload_interval=Config.MODEL_RELOAD_INTERVAL,
+                         fallback_path=model_path, use_compiled=Config.USE_COMPILED_FOREST)
+
+if registry.live() is None:
+    logger.warning(f'No model in {Config.MODEL_REGISTRY_DIR} or at {model_path}. Using fallback logic.')
+
+# (minimum score, verdict), highest first
+MODEL_VERDICTS = [(80, 'Highly Genuine'), (60, 'Likely Genuine'), (40, 'Suspicious'), (0, 'High Risk')]
+FALLBACK_VERDICTS = [(80, 'Highly Genuine'), (65, 'Likely Genuine'), (45, 'Suspicious'), (0, 'High Risk')]
+
+
+def verdict_for(score, bands=MODEL_VERDICTS):
+    """Returns the verdict of the first band whose minimum the score reaches."""
+    for minimum, verdict in bands:
+        if score >= minimum:
+            return verdict
+    return bands[-1][1]
+
+def _shadow_score(shadow, X, score, verdict):
+    """Scores with the candidate version and records how it compares with the live one."""
     try:
-        # Attempt to load the model
-        model = joblib.load(model_path)
+        shadow_score = int(shadow.predict_proba(X)[0][1] * 100)
     except Exception as e:
-        # Print an error message if the model fails to load
-        print(f'Error loading model: {e}')
-else:
-    # Print a message if the model file does not exist
-    print(f'Model file not found at {model_path}. Using fallback logic.')
+        logger.error(f'Shadow model {shadow.version} prediction error: {e}')
+        metrics.incr('model.shadow.failed')
+        return
+    metrics.incr('model.shadow.scored')
+    if verdict_for(shadow_score, MODEL_VERDICTS) == verdict:
+        metrics.incr('model.shadow.verdict_agree')
+    else:
+        metrics.incr('model.shadow.verdict_differ')
+        logger.info('Shadow verdict differs', extra={
+            'shadow_version': shadow.version, 'score': score, 'shadow_score': shadow_score})
+    metrics.incr('model.shadow.abs_score_diff', abs(shadow_score - score))
 
 def classify_product(
     text_similarity: float,
@@ -35,7 +64,8 @@ def classify_product(
     Classify a product as genuine or fake based on features.
     Returns (score, verdict).
     """
-    if model:
+    live = registry.live()
+    if live is not None:
         try:
             X = [[
                 text_similarity,
@@ -50,21 +80,15 @@ def classify_product(
                 keyword_replica,
                 keyword_genuine
             ]]
-            pred = model.predict_proba(X)[0][1]
+            pred = live.predict_proba(X)[0][1]
             score = int(pred * 100)
-            
-            if score >= 80:
-                verdict = 'Highly Genuine'
-            elif score >= 60:
-                verdict = 'Likely Genuine'
-            elif score >= 40:
-                verdict = 'Suspicious'
-            else:
-                verdict = 'High Risk'
-                
+            verdict = verdict_for(score, MODEL_VERDICTS)
+            shadow = registry.shadow()
+            if shadow is not None:
+                _shadow_score(shadow, X, score, verdict)
             return score, verdict
         except Exception as e:
-            print(f"Model prediction error: {e}")
+            logger.error(f"Model prediction error: {e}")
     
     # Enhanced fallback logic
     try:
@@ -107,18 +131,8 @@ def classify_product(
         
         # Final score
         score = max(0, min(100, int(positive_score - red_flags)))
-        
-        if score >= 80:
-            verdict = 'Highly Genuine'
-        elif score >= 65:
-            verdict = 'Likely Genuine'
-        elif score >= 45:
-            verdict = 'Suspicious'
-        else:
-            verdict = 'High Risk'
-            
-        return score, verdict
+        return score, verdict_for(score, FALLBACK_VERDICTS)
         
     except Exception as e:
-        print(f"Fallback classification error: {e}")
+        logger.error(f"Fallback classification error: {e}")
         return 30, 'High Risk' 
\ No newline at end of file
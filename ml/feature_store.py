@@ -0,0 +1,306 @@
+"""
+Append-only columnar store of analysed listings.
+
+Every /analyze call appends the raw scraped fields and the 11 computed features
+to a Parquet dataset partitioned by date:
+
+    <root>/date=2026-10-19/part-<timestamp>-<pid>-<seq>.parquet
+
+Records are queued in memory and written in batches by a background thread, so
+the request path only pays for a queue put. Files are written under a temporary
+name and renamed into place, so readers never see partial files. Training and
+offline re-scoring read the features back with `read_features` instead of
+re-scraping:
+
+    python -m ml.feature_store rescore --root data/feature_store --since 2026-10-01
+"""
+import argparse
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    logging.warning('pyarrow not available, the feature store is disabled.')
+
+# Feature columns in the order classify_product takes them
+FEATURE_COLUMNS = [
+    'text_similarity', 'image_similarity', 'price_deviation', 'known_seller',
+    'num_reviews', 'avg_rating', 'image_count', 'desc_length',
+    'keyword_original', 'keyword_replica', 'keyword_genuine',
+]
+# The labelled CSV (and so the saved model) calls the last feature keyword_100%_genuine
+TRAINING_COLUMN_NAMES = {'keyword_genuine': 'keyword_100%_genuine'}
+
+if PYARROW_AVAILABLE:
+    SCHEMA = pa.schema([
+        ('analyzed_at', pa.timestamp('ms', tz='UTC')),
+        ('url', pa.string()),
+        ('trusted_domain', pa.bool_()),
+        # Raw scraped fields
+        ('title', pa.string()),
+        ('description', pa.string()),
+        ('price', pa.string()),
+        ('seller', pa.string()),
+        ('images', pa.list_(pa.string())),
+        ('scraping_error', pa.bool_()),
+        # Reference match
+        ('reference_source', pa.string()),
+        ('reference_title', pa.string()),
+        ('reference_price', pa.string()),
+        # Computed features
+        ('text_similarity', pa.float64()),
+        ('image_similarity', pa.float64()),
+        ('price_deviation', pa.float64()),
+        ('known_seller', pa.int8()),
+        ('num_reviews', pa.int64()),
+        ('avg_rating', pa.float64()),
+        ('image_count', pa.int64()),
+        ('desc_length', pa.int64()),
+        ('keyword_original', pa.int8()),
+        ('keyword_replica', pa.int8()),
+        ('keyword_genuine', pa.int8()),
+        # Outcome at analysis time
+        ('score', pa.int64()),
+        ('verdict', pa.string()),
+    ])
+
+logger = logging.getLogger(__name__)
+
+
+def make_record(url, product, features, score, verdict, ref=None, reference_source='', trusted_domain=False):
+    """
+    Builds a store record from one analysis.
+
+    Args:
+        url (str): The analysed URL.
+        product (dict): Output of extract_product_details.
+        features (dict): The computed features, keyed by FEATURE_COLUMNS.
+        score (int): Authenticity score.
+        verdict (str): Verdict label.
+        ref (dict): The trusted-source reference product, if any.
+        reference_source (str): Name of the reference source.
+        trusted_domain (bool): Whether the URL was on a trusted domain.
+    """
+    ref = ref or {}
+    record = {
+        'analyzed_at': datetime.now(timezone.utc),
+        'url': url,
+        'trusted_domain': bool(trusted_domain),
+        'title': str(product.get('title', '')),
+        'description': str(product.get('description', '')),
+        'price': str(product.get('price', '')),
+        'seller': str(product.get('seller', '')),
+        'images': [str(i) for i in product.get('images', []) if i],
+        'scraping_error': bool(product.get('scraping_error', False)),
+        'reference_source': reference_source,
+        'reference_title': str(ref.get('title', '')),
+        'reference_price': str(ref.get('price', '')),
+        'score': int(score),
+        'verdict': verdict,
+    }
+    for col in FEATURE_COLUMNS:
+        record[col] = features.get(col, 0)
+    record['known_seller'] = int(bool(record['known_seller']))
+    return record
+
+
+class FeatureStore:
+    """Batched, append-only Parquet writer running off the request path."""
+
+    def __init__(self, root, batch_size=256, flush_interval=30.0, max_queue=10000):
+        """
+        Args:
+            root (str): Dataset root directory.
+            batch_size (int): Records per written file (at most).
+            flush_interval (float): Seconds after which a partial batch is written.
+            max_queue (int): Records buffered before new ones are dropped.
+        """
+        self.root = root
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.written = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        atexit.register(self.close)
+
+    def _ensure_writer(self):
+        # The writer thread is started lazily, and again after a fork: with the
+        # preloaded gunicorn mode the store is created in the master, whose
+        # threads don't exist in the workers.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._run, name='feature-store-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def append(self, record):
+        """Queues a record for writing. Never blocks; drops the record if the queue is full."""
+        if not PYARROW_AVAILABLE:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        """Blocks until every record queued so far has been written."""
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Writes the remaining records and stops the writer thread."""
+        if self._pid != os.getpid():
+            return
+        self.flush(timeout=30)
+        self._queue.put(None)
+        self._thread.join(timeout=30)
+        self._pid = None
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = 'timeout'
+            if isinstance(item, dict):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                self._write(batch)
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+    def _write(self, records):
+        partitions = {}
+        for record in records:
+            partitions.setdefault(record['analyzed_at'].strftime('%Y-%m-%d'), []).append(record)
+        for date, rows in partitions.items():
+            try:
+                directory = os.path.join(self.root, f'date={date}')
+                os.makedirs(directory, exist_ok=True)
+                self._seq += 1
+                name = f'part-{int(time.time() * 1000)}-{os.getpid()}-{self._seq}.parquet'
+                table = pa.Table.from_pylist(rows, schema=SCHEMA)
+                tmp_path = os.path.join(directory, f'.{name}.tmp')
+                pq.write_table(table, tmp_path, compression='zstd')
+                os.replace(tmp_path, os.path.join(directory, name))
+                self.written += len(rows)
+            except Exception as e:
+                logger.error(f'Feature store write failed ({len(rows)} records dropped): {e}')
+
+
+def read_features(root, since=None, until=None, columns=None):
+    """
+    Reads stored records into a pandas DataFrame.
+
+    Args:
+        root (str): Dataset root directory.
+        since (str): First date to include (YYYY-MM-DD), inclusive.
+        until (str): Last date to include (YYYY-MM-DD), inclusive.
+        columns (list): Columns to read, or None for all.
+
+    Returns:
+        pd.DataFrame: The stored records (empty if the store is empty).
+    """
+    import pandas as pd
+
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError('pyarrow is required to read the feature store')
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or SCHEMA.names)
+    dataset = ds.dataset(root, format='parquet', partitioning='hive', schema=SCHEMA.append(pa.field('date', pa.string())))
+    expr = None
+    if since:
+        expr = ds.field('date') >= since
+    if until:
+        until_expr = ds.field('date') <= until
+        expr = until_expr if expr is None else expr & until_expr
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+
+def load_labeled_features(root, labels_path, since=None, until=None):
+    """
+    Joins stored features with hand labels for training.
+
+    Args:
+        root (str): Feature store root.
+        labels_path (str): CSV with `url` and `label` columns (genuine/fake).
+
+    Returns:
+        pd.DataFrame: The latest stored record per labelled URL, with the
+                      feature columns named as in the labelled CSV. Records
+                      with features skipped by the classification cascade are
+                      left out.
+    """
+    import pandas as pd
+
+    df = read_features(root, since=since, until=until)
+    labels = pd.read_csv(labels_path, usecols=['url', 'label'])
+    df = df.sort_values('analyzed_at').drop_duplicates('url', keep='last').dropna(subset=FEATURE_COLUMNS)
+    return df.merge(labels, on='url', how='inner').rename(columns=TRAINING_COLUMN_NAMES)
+
+
+def rescore(root, since=None, until=None):
+    """
+    Re-scores stored features with the current classifier. Records with
+    features skipped by the classification cascade are left out.
+
+    Returns:
+        pd.DataFrame: url, stored score/verdict and new score/verdict per record.
+    """
+    from ml.classifier import classify_product
+
+    df = read_features(root, since=since, until=until)
+    df = df[~df['trusted_domain']].dropna(subset=FEATURE_COLUMNS)
+    new = [classify_product(*row) for row in df[FEATURE_COLUMNS].itertuples(index=False, name=None)]
+    out = df[['analyzed_at', 'url', 'score', 'verdict']].copy()
+    out['new_score'] = [score for score, _ in new]
+    out['new_verdict'] = [verdict for _, verdict in new]
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Feature store utilities.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rescore_parser = sub.add_parser('rescore', help='re-score stored features with the current model')
+    rescore_parser.add_argument('--root', default=os.path.join('data', 'feature_store'))
+    rescore_parser.add_argument('--since')
+    rescore_parser.add_argument('--until')
+    rescore_parser.add_argument('--out', help='write the per-record results to this CSV')
+    args = parser.parse_args()
+
+    results = rescore(args.root, since=args.since, until=args.until)
+    changed = (results['verdict'] != results['new_verdict']).sum()
+    print(f'Re-scored {len(results)} records, {changed} verdicts changed')
+    if len(results):
+        print(results.groupby(['verdict', 'new_verdict']).size().to_string())
+    if args.out:
+        results.to_csv(args.out, index=False)
@@ -0,0 +1,198 @@
+"""
+Array-based evaluator for the RandomForest saved by train_model.py.
+
+`compile_forest` flattens every fitted tree into shared NumPy tables (feature,
+threshold, left/right child and leaf probabilities). `CompiledForest` then
+scores one row or a batch by walking all trees at once with vectorised
+indexing, without sklearn's per-call validation and joblib dispatch. The
+probabilities are bit-for-bit identical to `RandomForestClassifier.predict_proba`.
+
+Export a compiled copy of a saved model:
+
+    python -m ml.forest_eval --model ml/model.pkl --out ml/model_compiled
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+ARRAYS = ['feature', 'threshold', 'left', 'right', 'value', 'roots']
+
+
+class CompiledForest:
+    """
+    A RandomForest flattened into node tables.
+
+    All trees share one set of tables; `roots` holds the index of each tree's
+    root node. Leaves point to themselves, so walking every tree for `max_depth`
+    steps lands each one on its leaf regardless of the leaf's depth.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(feature.max()) + 1 if len(feature) else 0
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def predict_proba(self, X):
+        """
+        Computes class probabilities, matching sklearn's `predict_proba` exactly.
+
+        Args:
+            X (array-like): A single row of features or a 2-D batch.
+
+        Returns:
+            np.ndarray: Array of shape (n_rows, n_classes).
+        """
+        # sklearn evaluates trees on float32 inputs, compared against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        node = np.tile(self.roots, (X.shape[0], 1))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        leaf_values = self.value[node]  # (n_rows, n_trees, n_classes)
+        # sklearn adds up the per-tree probabilities in tree order; cumsum keeps
+        # that order (a plain sum would use pairwise summation and could differ
+        # in the last bit)
+        proba = np.cumsum(leaf_values, axis=1)[:, -1, :]
+        proba /= self.n_trees
+        return proba
+
+    def predict_proba_bounds(self, x, lower, upper):
+        """
+        Bounds the class probabilities of one row with some features unknown.
+
+        Unknown features (NaN in `x`) may take any value between `lower` and
+        `upper`. At a split on an unknown feature whose threshold falls inside
+        that range, both children are followed, so each tree contributes the
+        smallest and largest leaf probability it can reach. With no unknown
+        features both bounds equal `predict_proba(x)[0]`.
+
+        Args:
+            x (array-like): One row of features, NaN where unknown.
+            lower (array-like): Per-feature lower bounds (used where x is NaN).
+            upper (array-like): Per-feature upper bounds (used where x is NaN).
+
+        Returns:
+            tuple: (low, high) arrays of shape (n_classes,).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        unknown = np.isnan(x)
+        # Same float32 rounding as predict_proba
+        lo = np.where(unknown, lower, x).astype(np.float32).astype(np.float64)
+        hi = np.where(unknown, upper, x).astype(np.float32).astype(np.float64)
+        trees = np.arange(self.n_trees)
+        node = self.roots.copy()
+        for _ in range(self.max_depth):
+            feature, threshold = self.feature[node], self.threshold[node]
+            go_left = hi[feature] <= threshold
+            go_right = lo[feature] > threshold
+            # Leaves point to themselves; don't duplicate them
+            both = ~(go_left | go_right) & (self.left[node] != self.right[node])
+            nxt = np.where(go_left, self.left[node], self.right[node])
+            if both.any():
+                trees = np.concatenate([trees, trees[both]])
+                nxt = np.concatenate([nxt, self.left[node[both]]])
+            node = nxt
+
+        values = self.value[node]
+        low = np.full((self.n_trees, values.shape[1]), np.inf)
+        high = np.full((self.n_trees, values.shape[1]), -np.inf)
+        np.minimum.at(low, trees, values)
+        np.maximum.at(high, trees, values)
+        # Summed in tree order, as in predict_proba
+        return np.cumsum(low, axis=0)[-1] / self.n_trees, np.cumsum(high, axis=0)[-1] / self.n_trees
+
+    def save(self, out_dir):
+        """Writes the tables as .npy files (loadable with mmap_mode) plus metadata."""
+        os.makedirs(out_dir, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(out_dir, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(out_dir, 'forest.json'), 'w') as f:
+            json.dump({'max_depth': self.max_depth, 'classes': self.classes_.tolist(), 'n_trees': self.n_trees}, f)
+
+    @classmethod
+    def load(cls, model_dir, mmap_mode=None):
+        """
+        Loads tables written by `save`.
+
+        Args:
+            model_dir (str): Directory containing the .npy tables.
+            mmap_mode (str): Passed to `np.load`; 'r' maps the tables read-only
+                             so processes share them through the page cache.
+        """
+        with open(os.path.join(model_dir, 'forest.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(model_dir, f'{name}.npy'), mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(max_depth=meta['max_depth'], classes=meta['classes'], **arrays)
+
+
+def compile_forest(model):
+    """
+    Flattens a fitted RandomForestClassifier into a `CompiledForest`.
+
+    Args:
+        model: A fitted sklearn RandomForestClassifier (single output).
+
+    Returns:
+        CompiledForest: The compiled forest.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        ids = np.arange(n, dtype=np.int32) + offset
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+        lefts.append(np.where(is_leaf, ids, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, ids, tree.children_right + offset).astype(np.int32))
+
+        # Same normalisation as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.concatenate(values),
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=max_depth,
+        classes=model.classes_,
+    )
+
+
+if __name__ == '__main__':
+    import joblib
+
+    parser = argparse.ArgumentParser(description='Export a RandomForest model as compiled NumPy tables.')
+    parser.add_argument('--model', default=os.path.join(os.path.dirname(__file__), 'model.pkl'))
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(__file__), 'model_compiled'))
+    args = parser.parse_args()
+    forest = compile_forest(joblib.load(args.model))
+    forest.save(args.out)
+    print(f'Wrote {forest.n_trees} trees ({len(forest.feature)} nodes, depth {forest.max_depth}) to {args.out}')
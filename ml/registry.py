@@ -0,0 +1,422 @@
+"""
+Versioned classifier artifacts with hot reload and shadow scoring.
+
+Layout of a registry directory (MODEL_REGISTRY_DIR):
+
+    versions/<version>/model.joblib    the fitted sklearn model
+    versions/<version>/forest/         its CompiledForest tables (.npy, see ml/forest_eval.py)
+    versions/<version>/meta.json       version, created_at, sha256, n_trees, metrics, notes...
+    CURRENT                            name of the live version
+    SHADOW                             name of a candidate scored alongside it (optional)
+
+A version directory is written under a temporary name and renamed into place,
+and the pointer files are replaced with `os.replace`, so readers never see a
+half-written artifact. Workers check the pointers at most every
+MODEL_RELOAD_INTERVAL seconds, on the request path. When one changes, the new
+version is loaded and swapped in with a single reference assignment. A
+request keeps the model it started with, and no restart is needed.
+
+The forest tables are opened with `np.load(mmap_mode='r')`. Every worker
+maps the same files, so the arrays live once in the page cache instead of
+once per worker. The sklearn model is only loaded when it is needed
+(USE_COMPILED_FOREST=0).
+
+    python -m ml.registry publish ml/model.pkl --note "retrained on October labels"
+    python -m ml.registry list
+    python -m ml.registry activate 20261019-101500-3fa2c1
+    python -m ml.registry shadow 20261020-091200-8be0d4    # or --clear
+    python -m ml.registry bench                            # reload latency, per-worker memory
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+
+import metrics
+from ml.forest_eval import ARRAYS, CompiledForest, compile_forest
+
+logger = logging.getLogger(__name__)
+
+CURRENT = 'CURRENT'
+SHADOW = 'SHADOW'
+
+
+class LoadedModel:
+    """One version of the classifier, ready to score."""
+
+    def __init__(self, version, meta, path=None, sklearn_model=None, forest=None, use_compiled=True):
+        """
+        Args:
+            version (str): Version name ('legacy' for a bare model.pkl).
+            meta (dict): The version's metadata.
+            path (str): Version directory, for loading the sklearn model lazily.
+            sklearn_model: An already-loaded sklearn model.
+            forest (CompiledForest): The compiled forest, if available.
+            use_compiled (bool): Score with the compiled forest when there is one.
+        """
+        self.version = version
+        self.meta = meta
+        self.path = path
+        self.forest = forest
+        self.use_compiled = use_compiled
+        self._sklearn = sklearn_model
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pickle(cls, model_path, use_compiled=True):
+        """Loads a bare joblib model file (no registry), compiling its forest in memory."""
+        model = joblib.load(model_path)
+        forest = None
+        if use_compiled:
+            try:
+                forest = compile_forest(model)
+            except Exception as e:
+                # Not a RandomForest (or an incompatible sklearn version); score with sklearn
+                logger.warning(f'Could not compile model, using sklearn predict_proba: {e}')
+        meta = {'version': 'legacy', 'source': model_path, 'mtime': os.path.getmtime(model_path)}
+        return cls('legacy', meta, sklearn_model=model, forest=forest, use_compiled=use_compiled)
+
+    @classmethod
+    def load(cls, path, use_compiled=True):
+        """Loads a registry version directory, memory-mapping its forest tables."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        forest_dir = os.path.join(path, 'forest')
+        forest = CompiledForest.load(forest_dir, mmap_mode='r') if os.path.isdir(forest_dir) else None
+        loaded = cls(meta['version'], meta, path=path, forest=forest, use_compiled=use_compiled)
+        if forest is None or not use_compiled:
+            loaded.sklearn  # noqa: B018  load now rather than on the first request
+        return loaded
+
+    @property
+    def sklearn(self):
+        """The sklearn model, loaded on first use."""
+        if self._sklearn is None and self.path is not None:
+            with self._lock:
+                if self._sklearn is None:
+                    self._sklearn = joblib.load(os.path.join(self.path, 'model.joblib'), mmap_mode='r')
+        return self._sklearn
+
+    @property
+    def scorer(self):
+        """What predict_proba runs on: the compiled forest or the sklearn model."""
+        if self.use_compiled and self.forest is not None:
+            return self.forest
+        return self.sklearn
+
+    def predict_proba(self, X):
+        return self.scorer.predict_proba(X)
+
+    def memory(self):
+        """Bytes of the forest tables that are memory-mapped (shared) and held in the heap (private)."""
+        mapped = heap = 0
+        if self.forest is not None:
+            for name in ARRAYS:
+                array = getattr(self.forest, name)
+                if isinstance(array, np.memmap):
+                    mapped += array.nbytes
+                else:
+                    heap += array.nbytes
+        return {'mapped_bytes': mapped, 'heap_bytes': heap}
+
+
+class ModelRegistry:
+    """Versions in a registry directory, with the live and shadow models loaded."""
+
+    def __init__(self, root, reload_interval=5.0, fallback_path=None, use_compiled=True):
+        """
+        Args:
+            root (str): Registry directory.
+            reload_interval (float): Seconds between checks for a changed
+                                     CURRENT or SHADOW pointer; 0 loads once.
+            fallback_path (str): joblib model used while the registry has no
+                                 live version (reloaded when the file changes).
+            use_compiled (bool): Score with the compiled forests.
+        """
+        self.root = root
+        self.reload_interval = reload_interval
+        self.fallback_path = fallback_path
+        self.use_compiled = use_compiled
+        self._live = None
+        self._shadow = None
+        self._signature = None
+        self._checked = 0.0
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        self.last_reload_s = None
+
+    # --- Reading -------------------------------------------------------------
+
+    def live(self):
+        """The live model (None if there is no model at all)."""
+        self._maybe_reload()
+        return self._live
+
+    def shadow(self):
+        """The candidate model being shadow-scored, or None."""
+        self._maybe_reload()
+        return self._shadow
+
+    def _read_pointer(self, name):
+        try:
+            with open(os.path.join(self.root, name)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _current_signature(self):
+        fallback_mtime = None
+        if self.fallback_path and os.path.exists(self.fallback_path):
+            fallback_mtime = os.path.getmtime(self.fallback_path)
+        return self._read_pointer(CURRENT), self._read_pointer(SHADOW), fallback_mtime
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._signature is not None and (not self.reload_interval or now - self._checked < self.reload_interval):
+            return
+        # One thread reloads; the others keep scoring with the current models
+        blocking = self._signature is None
+        if not self._reload_lock.acquire(blocking=blocking):
+            return
+        try:
+            self._checked = now
+            signature = self._current_signature()
+            if signature != self._signature:
+                self._load(signature)
+        finally:
+            self._reload_lock.release()
+
+    def _load(self, signature):
+        current, shadow, _ = signature
+        start = time.perf_counter()
+        try:
+            if current:
+                live = self._live if self._live is not None and self._live.version == current else \
+                    LoadedModel.load(self.version_path(current), self.use_compiled)
+            elif self.fallback_path and os.path.exists(self.fallback_path):
+                live = LoadedModel.from_pickle(self.fallback_path, self.use_compiled)
+            else:
+                live = None
+            shadow_model = None
+            if shadow and shadow != current:
+                shadow_model = self._shadow if self._shadow is not None and self._shadow.version == shadow else \
+                    LoadedModel.load(self.version_path(shadow), self.use_compiled)
+        except Exception as e:
+            # Keep serving the models already loaded; retried at the next check
+            logger.error(f'Could not load model version {current or self.fallback_path}: {e}')
+            metrics.incr('model.reload_failed')
+            if self._signature is None:
+                self._signature = (None, None, None)
+            return
+        elapsed = time.perf_counter() - start
+        previous = self._live.version if self._live is not None else None
+        self._live, self._shadow, self._signature = live, shadow_model, signature
+        if self.reloads or live is not None:
+            self.reloads += 1
+            self.last_reload_s = elapsed
+            metrics.observe('model.reload', elapsed)
+        logger.info('Loaded classifier', extra={
+            'version': live.version if live else None, 'previous_version': previous,
+            'shadow_version': shadow_model.version if shadow_model else None, 'load_ms': round(elapsed * 1000, 2)})
+
+    def stats(self):
+        """Loaded versions, reload count and latency, and model memory of this worker."""
+        live, shadow = self._live, self._shadow
+        return {
+            'live': live.version if live else None,
+            'shadow': shadow.version if shadow else None,
+            'reloads': self.reloads,
+            'last_reload_ms': round(self.last_reload_s * 1000, 2) if self.last_reload_s is not None else None,
+            'memory': {model.version: model.memory() for model in (live, shadow) if model is not None},
+        }
+
+    # --- Writing -------------------------------------------------------------
+
+    def version_path(self, version):
+        return os.path.join(self.root, 'versions', version)
+
+    def versions(self):
+        """Metadata of every version, oldest first."""
+        versions_dir = os.path.join(self.root, 'versions')
+        metas = []
+        if os.path.isdir(versions_dir):
+            for name in os.listdir(versions_dir):
+                meta_path = os.path.join(versions_dir, name, 'meta.json')
+                if not name.startswith('.') and os.path.exists(meta_path):
+                    with open(meta_path) as f:
+                        metas.append(json.load(f))
+        return sorted(metas, key=lambda meta: meta['created_at'])
+
+    def publish(self, model, version=None, metadata=None, activate=False):
+        """
+        Adds a fitted model as a new version.
+
+        Args:
+            model: A fitted sklearn classifier.
+            version (str): Version name, defaults to '<UTC timestamp>-<hash prefix>'.
+            metadata (dict): Extra metadata (metrics, params, notes, ...).
+            activate (bool): Make it the live version.
+
+        Returns:
+            str: The version name.
+        """
+        os.makedirs(os.path.join(self.root, 'versions'), exist_ok=True)
+        created = datetime.now(timezone.utc)
+        tmp = os.path.join(self.root, 'versions', f'.tmp-{os.getpid()}-{threading.get_ident()}')
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            model_file = os.path.join(tmp, 'model.joblib')
+            # Uncompressed, so that joblib.load can memory-map its arrays
+            joblib.dump(model, model_file)
+            with open(model_file, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            version = version or f'{created:%Y%m%d-%H%M%S}-{digest[:6]}'
+            meta = {'version': version, 'created_at': created.isoformat(timespec='milliseconds'), 'sha256': digest,
+                    'model_class': type(model).__name__}
+            try:
+                forest = compile_forest(model)
+                forest.save(os.path.join(tmp, 'forest'))
+                meta.update(n_trees=forest.n_trees, n_nodes=int(len(forest.feature)), max_depth=forest.max_depth)
+            except Exception as e:
+                logger.warning(f'Publishing {version} without a compiled forest: {e}')
+            meta.update(metadata or {})
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+            os.rename(tmp, self.version_path(version))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        if activate:
+            self.activate(version)
+        return version
+
+    def _write_pointer(self, name, version):
+        path = os.path.join(self.root, name)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(f'{version}\n')
+        os.replace(tmp, path)
+
+    def activate(self, version):
+        """Makes a version live in every worker (within MODEL_RELOAD_INTERVAL)."""
+        if not os.path.isdir(self.version_path(version)):
+            raise ValueError(f'Unknown model version: {version}')
+        self._write_pointer(CURRENT, version)
+
+    def set_shadow(self, version):
+        """Shadow-scores a version next to the live one; None stops shadow scoring."""
+        if version is None:
+            try:
+                os.remove(os.path.join(self.root, SHADOW))
+            except FileNotFoundError:
+                pass
+            return
+        if not os.path.isdir(self.version_path(version)):
+            raise ValueError(f'Unknown model version: {version}')
+        self._write_pointer(SHADOW, version)
+
+
+def _bench(registry, workers):
+    """
+    Reload latency of the live version, and the memory its forest adds to each
+    of `workers` processes, memory-mapped vs read into the heap.
+    """
+    from serving.prefork import memory_report
+
+    version = registry._read_pointer(CURRENT)
+    if not version:
+        raise SystemExit('No live version to benchmark; publish one with --activate first')
+    path = registry.version_path(version)
+
+    timings = []
+    for _ in range(20):
+        start = time.perf_counter()
+        LoadedModel.load(path)
+        timings.append(time.perf_counter() - start)
+    print(f'Reload of {version}: p50 {np.percentile(timings, 50) * 1000:.2f} ms, '
+          f'max {max(timings) * 1000:.2f} ms')
+
+    for label, mmap_mode in (('mmap', 'r'), ('in-heap', None)):
+        pids = []
+        for _ in range(workers):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                before = memory_report()
+                forest = CompiledForest.load(os.path.join(path, 'forest'), mmap_mode=mmap_mode)
+                # Touch every table, as scoring would
+                for name in ARRAYS:
+                    getattr(forest, name).sum()
+                after = memory_report()
+                os.write(write_fd, json.dumps({key: after[key] - before.get(key, 0) for key in after}).encode())
+                time.sleep(0.5)  # stay alive while the siblings measure
+                os._exit(0)
+            os.close(write_fd)
+            pids.append((pid, read_fd))
+        reports = []
+        for pid, read_fd in pids:
+            with os.fdopen(read_fd) as f:
+                reports.append(json.loads(f.read()))
+            os.waitpid(pid, 0)
+        private = np.mean([r.get('private_clean_mb', 0) + r.get('private_dirty_mb', 0) for r in reports])
+        pss = np.mean([r.get('pss_mb', 0) for r in reports])
+        print(f'{label:8s} x{workers}: model adds {private:.1f} MB private, {pss:.1f} MB Pss per worker')
+
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Manage classifier versions.')
+    parser.add_argument('--root', default=Config.MODEL_REGISTRY_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    pub = sub.add_parser('publish', help='add a joblib model file as a new version')
+    pub.add_argument('model')
+    pub.add_argument('--version')
+    pub.add_argument('--note')
+    pub.add_argument('--activate', action='store_true')
+    sub.add_parser('list', help='list versions')
+    act = sub.add_parser('activate', help='make a version live')
+    act.add_argument('version')
+    sha = sub.add_parser('shadow', help='shadow-score a version next to the live one')
+    sha.add_argument('version', nargs='?')
+    sha.add_argument('--clear', action='store_true')
+    bench = sub.add_parser('bench', help='reload latency and per-worker memory of the live version')
+    bench.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == 'publish':
+        metadata = {'source': os.path.abspath(args.model)}
+        if args.note:
+            metadata['note'] = args.note
+        version = registry.publish(joblib.load(args.model), args.version, metadata, activate=args.activate)
+        print(f'Published {version}' + (' (live)' if args.activate else ''))
+    elif args.command == 'list':
+        live, shadow = registry._read_pointer(CURRENT), registry._read_pointer(SHADOW)
+        for meta in registry.versions():
+            mark = 'live' if meta['version'] == live else 'shadow' if meta['version'] == shadow else ''
+            print(f"{meta['version']:28s} {mark:6s} {meta['created_at']}  {meta.get('note', '')}")
+    elif args.command == 'activate':
+        registry.activate(args.version)
+        print(f'{args.version} is live')
+    elif args.command == 'shadow':
+        if not args.clear and not args.version:
+            parser.error('give a version or --clear')
+        registry.set_shadow(None if args.clear else args.version)
+        print('Shadow scoring stopped' if args.clear else f'Shadow-scoring {args.version}')
+    else:
+        _bench(registry, args.workers)
+
+
+if __name__ == '__main__':
+    main()
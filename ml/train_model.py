@@ -1,14 +1,56 @@
+"""
+Trains the RandomForest used by ml/classifier.py.
+
+    python -m ml.train_model --data data/labeling_template.csv --model-out ml/model.pkl \
+        --search halving --budget 600 --compare-grid
+
+Hyperparameters are tuned by successive halving. All candidates are scored on
+a small subsample of the training rows, and the best third is kept and
+re-scored on three times as many rows, until one candidate remains or the
+full training set is reached. The search stops early when the leaders stop
+improving, and always stops at the wall-clock budget. The fold split and the
+feature matrices are cached on disk, keyed by the content of the labelled rows.
+
+With --feature-store, the features of analysed listings are read from the
+feature store (see ml/feature_store.py) and labelled by URL from --data,
+instead of using the precomputed columns of the CSV.
+
+With --publish, the model is also added to the model registry as a new
+version, with its parameters and scores as metadata (see ml/registry.py), and
+--activate or --shadow puts it in front of traffic without a restart.
+"""
+import argparse
+import hashlib
+import itertools
+import os
+import random
+import sys
+import time
+
+import joblib
+import numpy as np
 import pandas as pd
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV, KFold
 from sklearn.metrics import classification_report, accuracy_score, precision_score, recall_score, f1_score
-import joblib
-import numpy as np
+from sklearn.model_selection import GridSearchCV, PredefinedSplit, StratifiedKFold, train_test_split
+
+from ml.feature_store import load_labeled_features
 
-# Define the absolute path for the data file
-DATA_FILE_PATH = '/home/runner/work/AppSec_finalProject/AppSec_finalProject/data/labeling_template.csv'
-# Define the absolute path for saving the trained model
-MODEL_SAVE_PATH = '/home/runner/work/AppSec_finalProject/AppSec_finalProject/ml/model.pkl'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Default location of the labelled data
+DATA_FILE_PATH = os.path.join(ROOT, 'data', 'labeling_template.csv')
+# Default location for saving the trained model
+MODEL_SAVE_PATH = os.path.join(ROOT, 'ml', 'model.pkl')
+CACHE_DIR = os.path.join(ROOT, '.cache', 'train_model')
+
+# Hyperparameter space (the exhaustive grid is 108 combinations)
+PARAM_GRID = {
+    'n_estimators': [100, 200, 300],
+    'max_depth': [None, 10, 20, 30],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4]
+}
 
 
 def load_data(filepath):
@@ -18,67 +60,314 @@ def load_data(filepath):
         return df
     except FileNotFoundError:
         print(f"Error: Data file not found at {filepath}")
-        exit(1)
+        sys.exit(1)
     except Exception as e:
         print(f"Error loading data: {e}")
-        exit(1)
-
-# Load labeled data
-df = load_data(DATA_FILE_PATH)
-
-# Add new features if present
-feature_cols = ['text_similarity', 'image_similarity', 'price_deviation', 'known_seller']
-for col in ['num_reviews', 'avg_rating', 'image_count', 'desc_length']:
-    if col in df.columns:
-        feature_cols.append(col)
-
-# Add keyword flags as features if they exist in the dataframe
-for k in ['original', 'replica', '100% genuine']:
-    col = f'keyword_{k.replace(" ", "_")}'
-    if col in df.columns:
-        feature_cols.append(col)
-
-# Prepare features (X) and target (y)
-X = df[feature_cols]
-y = df['label'].str.strip().str.lower().map({'genuine': 1, 'fake': 0})
-
-# Check for unmapped labels
-if y.isnull().any():
-    print("Error: Found unmapped labels in the 'label' column:", df['label'][y.isnull()])
-    exit(1)
-# Train/test split
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Define the model
-model = RandomForestClassifier(random_state=42, class_weight='balanced')
-
-# Hyperparameter tuning using GridSearchCV
-param_grid = {
-    'n_estimators': [100, 200, 300],
-    'max_depth': [None, 10, 20, 30],
-    'min_samples_split': [2, 5, 10],
-    'min_samples_leaf': [1, 2, 4]
-}
+        sys.exit(1)
+
+
+def select_feature_columns(df):
+    """Returns the feature columns present in the labelled data, in model order."""
+    feature_cols = ['text_similarity', 'image_similarity', 'price_deviation', 'known_seller']
+    # Add new features if present
+    for col in ['num_reviews', 'avg_rating', 'image_count', 'desc_length']:
+        if col in df.columns:
+            feature_cols.append(col)
+    # Add keyword flags as features if they exist in the dataframe
+    for k in ['original', 'replica', '100% genuine']:
+        col = f'keyword_{k.replace(" ", "_")}'
+        if col in df.columns:
+            feature_cols.append(col)
+    return feature_cols
+
+
+def prepare_dataset(df):
+    """
+    Builds the feature matrix and target vector from labelled data.
+
+    Returns:
+        tuple: (X, y, feature_cols) with X a float64 array and y an int array
+               (1 = genuine, 0 = fake).
+    """
+    feature_cols = select_feature_columns(df)
+    y = df['label'].str.strip().str.lower().map({'genuine': 1, 'fake': 0})
+    # Check for unmapped labels
+    if y.isnull().any():
+        print("Error: Found unmapped labels in the 'label' column:", df['label'][y.isnull()])
+        sys.exit(1)
+    return df[feature_cols].to_numpy(dtype=np.float64), y.to_numpy(dtype=np.int64), feature_cols
+
+
+def load_cached_dataset(df, cv, seed, cache_dir=CACHE_DIR):
+    """
+    Builds the feature matrices and fold assignment, caching them on disk.
+
+    The cache key covers the labelled rows' content, the fold count and the
+    seed, so new data or a different split invalidates it.
+
+    Args:
+        df (pd.DataFrame): Labelled data (CSV or feature store rows).
+        cv (int): Requested number of folds.
+        seed (int): Random seed of the train/test and fold splits.
+        cache_dir (str): Cache directory, or None to disable caching.
+
+    Returns:
+        dict: X_train, X_test, y_train, y_test, folds (fold id per training
+              row) and feature_cols.
+    """
+    columns = select_feature_columns(df) + ['label']
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df[columns], index=False).values.tobytes())
+    digest.update(f'{columns}:{cv}:{seed}'.encode())
+    cache_file = os.path.join(cache_dir, f'{digest.hexdigest()}.npz') if cache_dir else None
+
+    if cache_file and os.path.exists(cache_file):
+        cached = np.load(cache_file, allow_pickle=False)
+        data = {k: cached[k] for k in cached.files}
+        data['feature_cols'] = data['feature_cols'].tolist()
+        return data
+
+    X, y, feature_cols = prepare_dataset(df)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    # Stratified folds need every class to appear in every fold
+    n_splits = max(2, min(cv, np.bincount(y_train).min()))
+    folds = np.empty(len(y_train), dtype=np.int64)
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    for fold, (_, val_idx) in enumerate(splitter.split(X_train, y_train)):
+        folds[val_idx] = fold
+
+    data = {
+        'X_train': X_train, 'X_test': X_test, 'y_train': y_train, 'y_test': y_test,
+        'folds': folds, 'feature_cols': np.array(feature_cols),
+    }
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cache_file, **data)
+    data['feature_cols'] = feature_cols
+    return data
+
+
+def _fold_f1(estimator, params, X, y, train, val):
+    """F1 on one validation fold of `estimator` with `params` fitted on `train`."""
+    model = clone(estimator).set_params(**params).fit(X[train], y[train])
+    return f1_score(y[val], model.predict(X[val]), zero_division=0)
+
+
+def cv_scores(estimator, candidates, X, y, folds, rows=None, parallel=None):
+    """
+    Mean F1 of `estimator` with each of `candidates` over the cached folds.
+
+    The fits of all candidates and folds run as one batch of `parallel` jobs.
+
+    Args:
+        rows (np.ndarray): Indices of the training rows to use, or None for all.
+        parallel (joblib.Parallel): Runs the fits, or None to fit one after another.
+    """
+    rows = np.arange(len(y)) if rows is None else rows
+    splits = []
+    for fold in np.unique(folds):
+        train = rows[folds[rows] != fold]
+        # Too few rows at this rung to fit a classifier on this fold
+        if len(np.unique(y[train])) >= 2:
+            splits.append((train, np.flatnonzero(folds == fold)))
+    parallel = parallel or joblib.Parallel(n_jobs=1)
+    scores = parallel(joblib.delayed(_fold_f1)(estimator, params, X, y, train, val)
+                      for params in candidates for train, val in splits)
+    n = len(splits)
+    return [float(np.mean(scores[i * n:(i + 1) * n])) if n else 0.0 for i in range(len(candidates))]
+
+
+def cv_score(estimator, params, X, y, folds, rows=None):
+    """
+    Mean F1 of `estimator` with `params` over the cached folds.
+
+    Args:
+        rows (np.ndarray): Indices of the training rows to use, or None for all.
+    """
+    return cv_scores(estimator, [params], X, y, folds, rows=rows)[0]
+
+
+def successive_halving(estimator, candidates, X, y, folds, budget_s=None, factor=3,
+                       min_rows=None, tol=1e-3, seed=42, n_jobs=-1, log=print):
+    """
+    Successive-halving search over `candidates` with a wall-clock budget.
+
+    Each rung scores the surviving candidates on a random subsample of the
+    training rows, keeps the best 1/`factor` and multiplies the rows by `factor`.
+    The search stops when one candidate is left, the rows are exhausted, the best
+    score stops improving by more than `tol` between rungs while the survivors are
+    tied, or the budget runs out.
+
+    The fits of a rung run on `n_jobs` processes, a batch of candidates at a
+    time, so that the budget is checked between batches.
+
+    Returns:
+        tuple: (best_params, best_score, history) where history lists
+               (rung, rows, candidates, best_score) tuples.
+    """
+    deadline = time.monotonic() + budget_s if budget_s else None
+    n_classes = len(np.unique(y))
+    n_folds = len(np.unique(folds))
+    if min_rows is None:
+        min_rows = min(len(y), max(2 * n_classes * n_folds, len(y) // factor ** 3))
+
+    # A fixed row order so that each rung's sample contains the previous one
+    order = np.random.RandomState(seed).permutation(len(y))
+    survivors = list(candidates)
+    rows = min_rows
+    best_params, best_score = survivors[0], -1.0
+    history = []
+    rung = 0
+    with joblib.Parallel(n_jobs=n_jobs) as parallel:
+        while True:
+            sample = np.sort(order[:rows])
+            # Without a budget, the whole rung is one batch
+            batch = max(1, joblib.effective_n_jobs(n_jobs)) if deadline else len(survivors)
+            scored = []
+            for i in range(0, len(survivors), batch):
+                if deadline and time.monotonic() > deadline and (scored or history):
+                    break
+                chunk = survivors[i:i + batch]
+                scores = cv_scores(estimator, chunk, X, y, folds, rows=sample, parallel=parallel)
+                scored.extend(zip(scores, chunk))
+            scored.sort(key=lambda item: item[0], reverse=True)
+            previous_best = best_score
+            if scored:
+                # Scores on larger samples supersede those of earlier rungs
+                best_score, best_params = scored[0]
+            history.append((rung, rows, len(scored), scored[0][0] if scored else None))
+            log(f'Rung {rung}: {len(scored)} candidates on {rows} rows, best F1 {history[-1][3]}')
+
+            if deadline and time.monotonic() > deadline:
+                log('Wall-clock budget exhausted, stopping search')
+                break
+            if rows >= len(y) or len(scored) <= 1:
+                break
+            keep = max(1, len(scored) // factor)
+            leaders = [score for score, _ in scored[:keep]]
+            if rung > 0 and best_score - previous_best <= tol and max(leaders) - min(leaders) <= tol:
+                log('Leaders stopped improving, stopping search early')
+                break
+            survivors = [params for _, params in scored[:keep]]
+            rows = min(len(y), rows * factor)
+            rung += 1
+    return best_params, best_score, history
+
+
+def grid_candidates(param_grid):
+    """Expands a parameter grid into a list of parameter dicts."""
+    keys = sorted(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(param_grid[k] for k in keys))]
+
+
+def run_grid_baseline(estimator, X, y, folds, n_jobs=-1):
+    """Exhaustive GridSearchCV over PARAM_GRID on the same folds, for timing comparison."""
+    start = time.perf_counter()
+    grid_search = GridSearchCV(estimator, PARAM_GRID, cv=PredefinedSplit(folds), scoring='f1', n_jobs=n_jobs)
+    grid_search.fit(X, y)
+    return grid_search.best_params_, float(grid_search.best_score_), time.perf_counter() - start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the fake product RandomForest classifier.')
+    parser.add_argument('--data', default=DATA_FILE_PATH, help='labelled CSV file')
+    parser.add_argument('--feature-store', help='train on features from this feature store root instead, '
+                                                'labelled by the url/label columns of --data')
+    parser.add_argument('--since', help='first feature store date to use (YYYY-MM-DD)')
+    parser.add_argument('--model-out', default=MODEL_SAVE_PATH, help='where to save the trained model')
+    parser.add_argument('--search', choices=['halving', 'random', 'grid'], default='halving',
+                        help='halving: successive halving over the full grid; random: successive '
+                             'halving over --n-candidates random grid points; grid: exhaustive GridSearchCV')
+    parser.add_argument('--n-candidates', type=int, default=30, help='candidates sampled for --search random')
+    parser.add_argument('--factor', type=int, default=3, help='halving factor')
+    parser.add_argument('--budget', type=float, default=None, help='wall-clock budget for the search in seconds')
+    parser.add_argument('--cv', type=int, default=5, help='number of cross-validation folds')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help='processes fitting candidates, for the search and the grid baseline alike (-1: all cores)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='cache for fold splits and feature matrices')
+    parser.add_argument('--no-cache', action='store_true', help='rebuild the cached fold splits and features')
+    parser.add_argument('--compare-grid', action='store_true', help='also time the exhaustive grid search')
+    parser.add_argument('--publish', action='store_true',
+                        help='also publish the model as a new version of the model registry (ml/registry.py)')
+    parser.add_argument('--activate', action='store_true', help='with --publish, make the new version live')
+    parser.add_argument('--shadow', action='store_true', help='with --publish, shadow-score the new version')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.feature_store:
+        df = load_labeled_features(args.feature_store, args.data, since=args.since)
+        print(f"Loaded {len(df)} labelled rows from the feature store at {args.feature_store}")
+    else:
+        df = load_data(args.data)
+    data = load_cached_dataset(df, args.cv, args.seed, cache_dir=None if args.no_cache else args.cache_dir)
+    X_train, y_train, folds = data['X_train'], data['y_train'], data['folds']
+    print(f"Training on {len(y_train)} rows, {len(np.unique(folds))} folds, features: {data['feature_cols']}")
+
+    # Define the model
+    model = RandomForestClassifier(random_state=args.seed, class_weight='balanced')
+
+    start = time.perf_counter()
+    if args.search == 'grid':
+        best_params, best_score, _ = run_grid_baseline(model, X_train, y_train, folds, n_jobs=args.n_jobs)
+    else:
+        candidates = grid_candidates(PARAM_GRID)
+        if args.search == 'random':
+            candidates = random.Random(args.seed).sample(candidates, min(args.n_candidates, len(candidates)))
+        best_params, best_score, _ = successive_halving(
+            model, candidates, X_train, y_train, folds,
+            budget_s=args.budget, factor=args.factor, seed=args.seed, n_jobs=args.n_jobs,
+        )
+    search_s = time.perf_counter() - start
+    print("Best parameters found: ", best_params)
+    print(f"Mean cross-validation F1 score: {best_score}")
+    print(f"Search time ({args.search}): {search_s:.2f}s")
+
+    if args.compare_grid and args.search != 'grid':
+        grid_params, grid_score, grid_s = run_grid_baseline(model, X_train, y_train, folds, n_jobs=args.n_jobs)
+        print(f"Grid baseline: {grid_s:.2f}s, best F1 {grid_score}, parameters {grid_params}")
+        print(f"Speed-up over grid: {grid_s / search_s:.1f}x")
+
+    # Refit the best parameters on the full training split
+    best_model = clone(model).set_params(**best_params)
+    best_model.fit(pd.DataFrame(X_train, columns=data['feature_cols']), y_train)
+
+    # Evaluate the best model on the test set
+    y_test = data['y_test']
+    y_pred = best_model.predict(pd.DataFrame(data['X_test'], columns=data['feature_cols']))
+    print(classification_report(y_test, y_pred, zero_division=0))
 
-grid_search = GridSearchCV(model, param_grid, cv=5, scoring='f1', n_jobs=-1)
-grid_search.fit(X_train, y_train)
+    print(f"Accuracy: {accuracy_score(y_test, y_pred)}")
+    print(f"Precision: {precision_score(y_test, y_pred, zero_division=0)}")
+    print(f"Recall: {recall_score(y_test, y_pred, zero_division=0)}")
+    print(f"F1-score: {f1_score(y_test, y_pred, zero_division=0)}")
 
-print("Best parameters found: ", grid_search.best_params_)
-best_model = grid_search.best_estimator_
+    # Save the best model
+    os.makedirs(os.path.dirname(os.path.abspath(args.model_out)), exist_ok=True)
+    joblib.dump(best_model, args.model_out)
+    print(f"Model saved to {args.model_out}")
 
-# Cross-validation on the best model
-cv_scores = cross_val_score(best_model, X_train, y_train, cv=5, scoring='f1')
-print(f"Cross-validation F1 scores: {cv_scores}")
-print(f"Mean cross-validation F1 score: {np.mean(cv_scores)}")
+    if args.publish:
+        from config import Config
+        from ml.registry import ModelRegistry
 
-# Evaluate the best model on the test set
-y_pred = best_model.predict(X_test)
-print(classification_report(y_test, y_pred))
+        registry = ModelRegistry(Config.MODEL_REGISTRY_DIR)
+        metadata = {
+            'params': best_params,
+            'cv_f1': best_score,
+            'test_f1': float(f1_score(y_test, y_pred, zero_division=0)),
+            'test_accuracy': float(accuracy_score(y_test, y_pred)),
+            'feature_cols': list(data['feature_cols']),
+            'training_rows': int(len(y_train)),
+            'data': os.path.abspath(args.feature_store or args.data),
+        }
+        version = registry.publish(best_model, metadata=metadata, activate=args.activate)
+        if args.shadow and not args.activate:
+            registry.set_shadow(version)
+        print(f"Published model version {version}" + (' (live)' if args.activate else ' (shadow)' if args.shadow else ''))
+    return best_model
 
-print(f"Accuracy: {accuracy_score(y_test, y_pred)}")
-print(f"Precision: {precision_score(y_test, y_pred)}")
-print(f"Recall: {recall_score(y_test, y_pred)}")
-print(f"F1-score: {f1_score(y_test, y_pred)}")
 
-# Save the best model
-joblib.dump(best_model, '/home/runner/work/AppSec_finalProject/AppSec_finalProject/ml/model.pkl')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
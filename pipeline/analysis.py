@@ -0,0 +1,510 @@
+"""
+The /analyze pipeline expressed as a stage graph.
+
+    extract ──> search ──┬──> text_sim ───────────────┐
+       │                 ├──> ref_image_hash ──┐      │
+       ├──> product_image_hash ────────────> image_sim┤
+       │                 ├──> price_dev ──────────────┤
+       │                 └──> known_seller ───────────┤
+       └──> content_features ──────────────────────────┴──> classification
+
+Once the reference product is known, text similarity, the two image
+downloads and the price deviation run concurrently on a shared thread pool
+(ANALYZE_EXECUTOR=graph, the default). ANALYZE_EXECUTOR=linear runs the
+same stages one after another in the request thread.
+
+With SPECULATIVE_SEARCH=1 a `speculative_ref` stage searches trusted sources
+with a query derived from the URL slug as soon as the request starts,
+concurrently with extraction. The `ref` stage keeps that result if its title
+matches the extracted title, and falls back to a normal search otherwise.
+
+Extraction, trusted-source searches and image hashes go through single-flight
+groups (pipeline/singleflight.py), so concurrent requests for the same
+product share one execution of each.
+
+Each request has a time budget (ANALYZE_BUDGET, or per call). Extraction,
+the searches, text similarity and the image downloads must finish within the
+fractions of it given by BUDGET_SPLIT. A stage that runs out of time falls
+back to its no-reference default, and classification runs on what is
+available. The response lists the defaulted features in `defaulted_features`
+and sets `partial`.
+
+With ANALYZE_CASCADE=1 the graph has no classification stage. The request
+thread classifies from the cheap features, and submits text similarity and
+the image downloads only if they could still change the verdict
+(ml/cascade.py). Skipped features are reported as None. No stage ever waits
+on another stage's result, so a pool full of waiting stages can't deadlock.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rapidfuzz import fuzz
+
+import metrics
+from analysis.image_similarity import fetch_image_hash, hash_similarity
+from analysis.keywords import keyword_features
+from analysis.price_analysis import compute_price_deviation as calculate_price_deviation
+from analysis.text_similarity import compute_text_similarity as calculate_text_similarity
+from config import Config
+from ml.cascade import EXPENSIVE_FEATURES, cascade_classify
+from ml.classifier import classify_product
+from ml.feature_store import FeatureStore, make_record
+from pipeline.graph import InlineExecutor, Stage, StageGraph
+from pipeline.singleflight import SingleFlight
+from scraping.extract_product import extract_product_details
+from scraping.trusted_sources import query_from_url, search_trusted_sources
+
+logger = logging.getLogger(__name__)
+
+TRUSTED_DOMAINS = [
+    'amazon.com', 'amazon.in', 'flipkart.com', 'tatacliq.com',
+    'reliancedigital.in', 'snapdeal.com', 'myntra.com', 'nykaa.com',
+    'adidas.co.in', 'nike.com', 'puma.com', 'reebok.in', 'ajio.com'
+]
+
+# Default feature values used when there is no reference to compare against
+NO_REFERENCE_TEXT_SIM = 0.1
+NO_REFERENCE_IMAGE_SIM = 0.1
+NO_REFERENCE_PRICE_DEV = 0.5
+
+# Shared by all requests; each request's stages are scheduled on it
+default_executor = InlineExecutor() if Config.ANALYZE_EXECUTOR == 'linear' else ThreadPoolExecutor(
+    max_workers=Config.ANALYZE_WORKERS, thread_name_prefix='analyze')
+
+# Append-only store of analysed listings and their features (written off the request path)
+feature_store = FeatureStore(Config.FEATURE_STORE_DIR) if Config.FEATURE_STORE_DIR else None
+
+
+# Identical operations in flight for concurrent requests run once
+extract_flight = SingleFlight('extract')
+search_flight = SingleFlight('search')
+image_hash_flight = SingleFlight('image_hash')
+
+
+class ExtractionError(Exception):
+    """Raised when the product page can't be scraped at all."""
+
+
+def image_url(item):
+    """Returns the main image URL of a product or reference dict, if any."""
+    if not item:
+        return ''
+    if item.get('image_url'):
+        return item['image_url']
+    images = item.get('images') or []
+    return images[0] if images else ''
+
+
+def content_features(product, fallback_image_count=0):
+    """
+    Extracts review, rating, image, description and keyword features from a product.
+
+    Args:
+        product (dict): Output of extract_product_details.
+        fallback_image_count (int): Image count assumed when the scraper didn't report one.
+
+    Returns:
+        dict: num_reviews, avg_rating, image_count, desc_length, the three keyword
+              flags and the lexicon match counts per category (keyword_counts).
+    """
+    return {
+        'num_reviews': max(0, int(product.get('num_reviews', 0))),
+        'avg_rating': max(0, min(5, float(product.get('avg_rating', 0)))),
+        'image_count': max(fallback_image_count, int(product.get('image_count', 1))),
+        'desc_length': len(str(product.get('description', ''))),
+        **keyword_features(product.get('title', ''), product.get('description', '')),
+    }
+
+
+EMPTY_CONTENT_FEATURES = {
+    'num_reviews': 0, 'avg_rating': 0, 'image_count': 0, 'desc_length': 0,
+    'keyword_original': 0, 'keyword_replica': 0, 'keyword_genuine': 0, 'keyword_counts': {},
+}
+
+
+def search(query):
+    """search_trusted_sources, shared with concurrent identical searches."""
+    return search_flight.do(' '.join(query.split()), search_trusted_sources, query)
+
+
+def image_hash(url):
+    """fetch_image_hash, shared with concurrent downloads of the same image."""
+    return image_hash_flight.do(url, fetch_image_hash, url)
+
+
+# --- Stage functions. Each takes the run and its dependencies' results. ---
+
+def stage_extract(run, url):
+    try:
+        return extract_flight.do(url, extract_product_details, url)
+    except Exception as e:
+        raise ExtractionError(str(e)) from e
+
+
+def stage_search(run, product):
+    trusted = search(product['title'])
+    return trusted[0] if trusted else None
+
+
+def stage_speculative_search(run, url):
+    """Searches trusted sources with a query taken from the URL slug, alongside extraction."""
+    query = query_from_url(url)
+    if not query:
+        return None
+    start = time.perf_counter()
+    trusted = search(query)
+    return {
+        'query': query,
+        'ref': trusted[0] if trusted else None,
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def with_speculation(search_stage):
+    """
+    Wraps a `ref` stage so that it uses the speculative result if its title
+    matches the extracted title closely enough, and runs `search_stage`
+    otherwise.
+    """
+    def stage(run, product, speculative_ref):
+        if speculative_ref is None:
+            metrics.incr('speculative_search.skipped')
+            return search_stage(run, product=product)
+
+        ref = speculative_ref['ref']
+        match = fuzz.token_set_ratio(product.get('title', ''), ref.get('title', '')) / 100.0 if ref else 0.0
+        # Time spent waiting for the speculative search after extraction had finished
+        product_done = run.finished_at.get('product')
+        waited = max(0.0, run.finished_at['speculative_ref'] - product_done) if product_done else 0.0
+        if ref and ref.get('title') and match >= Config.SPECULATIVE_MATCH_THRESHOLD:
+            metrics.incr('speculative_search.hit')
+            # A normal search would have started when extraction finished
+            metrics.observe('speculative_search.saved', speculative_ref['elapsed'] - waited)
+            return ref
+        metrics.incr('speculative_search.miss')
+        metrics.observe('speculative_search.saved', -waited)
+        return search_stage(run, product=product)
+    return stage
+
+
+def stage_text_sim(run, product, ref):
+    if ref and ref.get('title'):
+        return calculate_text_similarity(product.get('title', ''), ref['title'])
+    return NO_REFERENCE_TEXT_SIM  # Low similarity if no reference
+
+
+def stage_product_image_hash(run, product):
+    url = image_url(product)
+    return run.memo(('image_hash', url), image_hash, url) if url else None
+
+
+def stage_ref_image_hash(run, ref):
+    url = image_url(ref)
+    return run.memo(('image_hash', url), image_hash, url) if url else None
+
+
+def stage_image_sim(run, product, ref, product_image_hash, ref_image_hash):
+    if image_url(ref) and image_url(product):
+        return hash_similarity(product_image_hash, ref_image_hash)
+    return NO_REFERENCE_IMAGE_SIM  # Low similarity if no images
+
+
+def stage_price_dev(run, product, ref):
+    product_price = product.get('price', 0)
+    if ref and ref.get('price') and product_price:
+        try:
+            return calculate_price_deviation(float(product_price), [float(ref['price'])])
+        except Exception:
+            return 1.0  # High deviation on error
+    return NO_REFERENCE_PRICE_DEV  # Medium deviation if no reference price
+
+
+def stage_known_seller(run, product, ref):
+    try:
+        return (product.get('seller', '').lower() == ref.get('seller', '').lower()) if ref else False
+    except Exception:
+        return False
+
+
+def stage_content_features(run, product):
+    try:
+        return content_features(product)
+    except Exception as e:
+        logger.warning(f'Feature extraction error: {e}')
+        return dict(EMPTY_CONTENT_FEATURES)
+
+
+def stage_classification(run, text_sim, image_sim, price_dev, known_seller, content_features):
+    features = [
+        text_sim, image_sim, price_dev, int(known_seller),
+        content_features['num_reviews'], content_features['avg_rating'],
+        content_features['image_count'], content_features['desc_length'],
+        content_features['keyword_original'], content_features['keyword_replica'],
+        content_features['keyword_genuine'],
+    ]
+    logger.info(f'Features for classification: {features}')
+    return classify_product(*features)
+
+
+# Features that hold a default value when a stage timed out, failed or was skipped
+DEFAULTED_FEATURES = {
+    'ref': ('text_similarity', 'image_similarity', 'price_deviation', 'known_seller'),
+    'text_sim': ('text_similarity',),
+    'product_image_hash': ('image_similarity',),
+    'ref_image_hash': ('image_similarity',),
+    'image_sim': ('image_similarity',),
+}
+
+
+def defaulted_features(run):
+    """Names of the features that were defaulted in a run, sorted."""
+    return sorted({feature for stage in run.defaulted for feature in DEFAULTED_FEATURES.get(stage, ())})
+
+
+# Stage computing each expensive feature
+FEATURE_STAGES = {'text_similarity': 'text_sim', 'image_similarity': 'image_sim'}
+
+
+def cascade_classification(run, price_dev, known_seller, content_features):
+    """
+    Classifies from the cheap features, running the similarity stages only if needed.
+
+    Called from the request thread, not as a stage: it waits for the similarity
+    stages, and a pool thread doing so could starve them of threads.
+    """
+    features = dict(content_features, price_deviation=price_dev, known_seller=int(known_seller))
+    score, verdict, computed = cascade_classify(features, lambda name: run.result(FEATURE_STAGES[name]))
+    for name in EXPENSIVE_FEATURES:
+        if name not in computed:
+            metrics.incr(f'cascade.skipped.{FEATURE_STAGES[name]}')
+    if len(computed) < len(EXPENSIVE_FEATURES):
+        metrics.incr(f'cascade.exit_before.{FEATURE_STAGES[EXPENSIVE_FEATURES[len(computed)]]}')
+    else:
+        metrics.incr('cascade.full')
+    logger.info(f'Cascade classification computed {computed or "no expensive features"}')
+    return score, verdict
+
+
+def build_analysis_graph(stage_fns=None, timeouts=None, speculative=None, cascade=None, budget_split=None):
+    """
+    Builds the stage graph for non-trusted listings.
+
+    Args:
+        stage_fns (dict): Replacement functions by stage name (used by the benchmark).
+        timeouts (dict): Per-stage timeouts in seconds, defaults to Config.STAGE_TIMEOUTS.
+        budget_split (dict): Fraction of the time budget by which each stage must
+                             finish ('image' for the downloads), defaults to
+                             Config.BUDGET_SPLIT.
+        speculative (bool): Add the speculative slug search, defaults to Config.SPECULATIVE_SEARCH.
+        cascade (bool): Classify with the early-exit cascade, defaults to Config.ANALYZE_CASCADE.
+                        The graph then has no classification stage; analyze_url
+                        runs the cascade on the request thread.
+    """
+    fns = {
+        'product': stage_extract,
+        'ref': stage_search,
+        'speculative_ref': stage_speculative_search,
+        'text_sim': stage_text_sim,
+        'product_image_hash': stage_product_image_hash,
+        'ref_image_hash': stage_ref_image_hash,
+        'image_sim': stage_image_sim,
+        'price_dev': stage_price_dev,
+        'known_seller': stage_known_seller,
+        'content_features': stage_content_features,
+        'classification': stage_classification,
+    }
+    fns.update(stage_fns or {})
+    if speculative is None:
+        speculative = Config.SPECULATIVE_SEARCH
+    if speculative:
+        fns['ref'] = with_speculation(fns['ref'])
+    if cascade is None:
+        cascade = Config.ANALYZE_CASCADE
+    classification = [] if cascade else [
+        Stage('classification', fns['classification'],
+              ['text_sim', 'image_sim', 'price_dev', 'known_seller', 'content_features'])]
+    timeouts = dict(Config.STAGE_TIMEOUTS, **(timeouts or {}))
+    split = dict(Config.BUDGET_SPLIT, **(budget_split or {}))
+    stages = []
+    if speculative:
+        stages.append(Stage('speculative_ref', fns['speculative_ref'], ['url'],
+                            timeout=timeouts.get('ref'), default=None, finish_by=split.get('ref')))
+    return StageGraph(stages + [
+        Stage('product', fns['product'], ['url'], timeout=timeouts.get('product'), finish_by=split.get('product')),
+        Stage('ref', fns['ref'], ['product', 'speculative_ref'] if speculative else ['product'],
+              timeout=timeouts.get('ref'), default=None, finish_by=split.get('ref')),
+        Stage('text_sim', fns['text_sim'], ['product', 'ref'], timeout=timeouts.get('text_sim'),
+              default=NO_REFERENCE_TEXT_SIM, finish_by=split.get('text_sim')),
+        Stage('product_image_hash', fns['product_image_hash'], ['product'],
+              timeout=timeouts.get('image'), default=None, finish_by=split.get('image')),
+        Stage('ref_image_hash', fns['ref_image_hash'], ['ref'], timeout=timeouts.get('image'), default=None,
+              finish_by=split.get('image')),
+        Stage('image_sim', fns['image_sim'], ['product', 'ref', 'product_image_hash', 'ref_image_hash'],
+              timeout=timeouts.get('image'), default=NO_REFERENCE_IMAGE_SIM, finish_by=split.get('image')),
+        Stage('price_dev', fns['price_dev'], ['product', 'ref']),
+        Stage('known_seller', fns['known_seller'], ['product', 'ref']),
+        Stage('content_features', fns['content_features'], ['product']),
+    ] + classification, inputs=['url'])
+
+
+analysis_graph = build_analysis_graph()
+
+
+def is_trusted_url(url):
+    return any(domain in url.lower() for domain in TRUSTED_DOMAINS)
+
+
+def score_trusted(url, product):
+    """Rule-based scoring for listings on trusted domains. Returns (features, score, verdict, ref_source)."""
+    # For trusted domains, still do some basic analysis
+    features = {'text_similarity': 0.95, 'image_similarity': 0.95, 'price_deviation': 0.1, 'known_seller': True}
+    try:
+        content = content_features(product, fallback_image_count=1)
+        # Adjust score based on content quality
+        base_score = 85
+        if content['keyword_replica'] > 0:
+            base_score -= 20  # Penalty for replica keywords even on trusted sites
+        if content['avg_rating'] < 3.0 and content['num_reviews'] > 20:
+            base_score -= 10  # Penalty for poor ratings
+        if content['keyword_genuine'] > 0 or content['keyword_original'] > 0:
+            base_score += 5  # Bonus for genuine keywords
+        score = max(60, min(95, base_score))  # Keep within reasonable range
+    except Exception as e:
+        logger.warning(f'Trusted domain feature extraction error: {e}')
+        content = dict(EMPTY_CONTENT_FEATURES)
+        score = 80
+    features.update(content)
+
+    if score >= 85:
+        verdict = "Highly Genuine"
+    elif score >= 70:
+        verdict = "Likely Genuine"
+    else:
+        verdict = "Suspicious"
+
+    # Determine reference source
+    if "amazon" in url.lower():
+        ref_source = "Amazon"
+    elif "flipkart" in url.lower():
+        ref_source = "Flipkart"
+    elif "myntra" in url.lower():
+        ref_source = "Myntra"
+    elif "tatacliq" in url.lower():
+        ref_source = "Tata Cliq"
+    else:
+        ref_source = "Trusted Domain"
+    return features, score, verdict, ref_source
+
+
+def _percent(value):
+    return f'{value * 100:.0f}%' if value is not None else 'Not needed'
+
+
+def analyze_url(url, graph=None, seed=None, executor=None, time_budget=None, on_run=None):
+    """
+    Runs the full analysis of a product URL.
+
+    Args:
+        url (str): Product page URL.
+        graph (StageGraph): Graph to run, defaults to the analysis graph.
+        seed (dict): Precomputed stage results (e.g. {'product': {...}}).
+        executor: Executor for the stages, defaults to the shared one.
+        time_budget (float): Seconds for the analysis, defaults to
+                             Config.ANALYZE_BUDGET; 0 is unlimited.
+        on_run (callable): Called with the PipelineRun once the analysis is
+                           done, e.g. to keep stage results for a later seed.
+
+    Returns:
+        dict: The /analyze response body (verdict, score, details, and the
+              defaulted features if the budget or a stage ran out).
+
+    Raises:
+        ExtractionError: If the product details can't be extracted in time.
+    """
+    start = time.perf_counter()
+    graph = graph or analysis_graph
+    if time_budget is None:
+        time_budget = Config.ANALYZE_BUDGET
+    run = graph.run(executor or default_executor, seed=seed, time_budget=time_budget or None, url=url)
+    if 'speculative_ref' in graph.stages and not is_trusted_url(url):
+        # Start searching with the URL slug while the page is being extracted
+        run.submit('speculative_ref')
+    try:
+        product = run.result('product')
+    except TimeoutError as e:
+        raise ExtractionError(str(e)) from e
+    logger.info(f'Extracted product details for URL: {url}')
+    ref = None
+
+    if is_trusted_url(url):
+        features, score, verdict, ref_source = score_trusted(url, product)
+    else:
+        try:
+            # Start every stage at once; each runs as soon as its inputs are ready.
+            # The cascade starts the similarity stages itself, only if needed.
+            names = ['ref', 'price_dev', 'known_seller', 'content_features']
+            cascade = 'classification' not in graph.stages
+            results = run.results(names if cascade else names + ['text_sim', 'image_sim', 'classification'])
+            if cascade:
+                score, verdict = cascade_classification(
+                    run, results['price_dev'], results['known_seller'], results['content_features'])
+                for name in ['text_sim', 'image_sim']:
+                    results[name] = run.result(name) if run.submitted(name) else None
+            else:
+                score, verdict = results['classification']
+            ref = results['ref']
+            features = {
+                'text_similarity': results['text_sim'],
+                'image_similarity': results['image_sim'],
+                'price_deviation': results['price_dev'],
+                'known_seller': results['known_seller'],
+            }
+            features.update(results['content_features'])
+            ref_source = ref.get('source', 'No Reference') if ref else 'No Reference'
+        except Exception as e:
+            logger.error(f'ML analysis failed: {str(e)}')
+            score = 25  # Very low score for failed analysis
+            verdict = "High Risk - Analysis Failed"
+            features = {'text_similarity': 0.0, 'image_similarity': 0.0, 'price_deviation': 1.0, 'known_seller': False}
+            features.update(EMPTY_CONTENT_FEATURES)
+            ref_source = 'Analysis Failed'
+
+    if on_run is not None:
+        on_run(run)
+    defaulted = defaulted_features(run)
+    if defaulted:
+        metrics.incr('analysis.partial')
+    metrics.incr('analysis.count')
+    metrics.observe('analysis.total', time.perf_counter() - start)
+    if feature_store is not None:
+        feature_store.append(make_record(
+            url, product, features, score, verdict,
+            ref=ref, reference_source=ref_source, trusted_domain=is_trusted_url(url),
+        ))
+
+    # Build response
+    return {
+        'verdict': verdict,
+        'score': score,
+        'details': {
+            'product_title': product.get('title', ''),
+            'product_price': product.get('price', 0),
+            'seller': product.get('seller', ''),
+            'num_reviews': features['num_reviews'],
+            'avg_rating': features['avg_rating'],
+            'image_count': features['image_count'],
+            'desc_length': features['desc_length'],
+            'title_similarity': _percent(features['text_similarity']),
+            'image_similarity': _percent(features['image_similarity']),
+            'price_deviation': f"{features['price_deviation']:.0f}%",
+            'known_seller': features['known_seller'],
+            'reference_source': ref_source,
+            'keyword_original': features['keyword_original'],
+            'keyword_replica': features['keyword_replica'],
+            'keyword_genuine': features['keyword_genuine'],
+            'keyword_counts': features.get('keyword_counts', {}),
+        },
+        'partial': bool(defaulted),
+        'defaulted_features': defaulted,
+    }
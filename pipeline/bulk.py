@@ -0,0 +1,369 @@
+"""
+Bulk scans: analyse one listing per cluster of near-duplicates.
+
+Counterfeit sellers post the same listing under many URLs and shop names. A
+bulk scan extracts every URL and hashes its main image, then groups
+near-duplicate listings:
+
+1. Each listing gets a MinHash signature (BULK_MINHASH_PERM values) of the
+   character 5-gram shingles of its title and description. The share of
+   equal values estimates the Jaccard similarity of two shingle sets.
+2. Locality-sensitive hashing buckets the signatures by BULK_LSH_BANDS bands,
+   and the 64-bit image pHash by four 16-bit bands. Only listings that share
+   a bucket are compared. With 32 bands of 4 values, a pair at Jaccard 0.6
+   shares a bucket with 99% probability and a pair at 0.2 with 5%. Images
+   within 3 bits of each other always share a pHash band. The work grows with
+   the number of listings and duplicates, not with every pair.
+3. Candidates are near-duplicates if their texts reach BULK_TEXT_THRESHOLD and
+   their images aren't clearly different (more than twice
+   BULK_IMAGE_DISTANCE bits apart). They also are if their images are within
+   BULK_IMAGE_DISTANCE bits and their texts reach half the threshold.
+   Clusters are the connected components. Listings on trusted and
+   other domains are never merged, since they're scored differently.
+
+The most complete listing of each cluster is analysed in full (seeded with
+its extracted product and image hash), and its verdict is propagated to the
+other members:
+
+    python -m pipeline.bulk urls.txt --out results.jsonl
+    python -m pipeline.bulk urls.txt --cluster-only      # clusters, no analysis
+
+Fetches go through a scheduler limiting work per retailer domain
+(BULK_DOMAIN_LIMIT), as the server does for bulk traffic.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from analysis.lite_similarity import ngram_buckets
+from config import Config
+from pipeline.analysis import (ExtractionError, analyze_url, extract_flight, image_hash, image_url,
+                               is_trusted_url)
+from scraping.extract_product import extract_product_details
+from serving.scheduler import BULK, Scheduler
+
+logger = logging.getLogger(__name__)
+
+# Shingle size in characters, and the bits of the shingle hashes
+SHINGLE_SIZE = 5
+SHINGLE_BITS = 32
+# The 64-bit pHash is split into this many bands for the image LSH
+IMAGE_BANDS = 4
+
+
+class MinHasher:
+    """MinHash signatures of shingle sets, with `num_perm` universal hash functions."""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        # h(x) = (a * x + b) mod 2**64, top 32 bits (a odd): a multiply-shift family
+        self.a = (rng.randint(0, 2 ** 62, num_perm, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self.b = rng.randint(0, 2 ** 62, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, text):
+        """
+        The signature of a text's character shingles.
+
+        Returns:
+            np.ndarray: `num_perm` uint32 values, or None if the text is too short to shingle.
+        """
+        shingles = np.unique(ngram_buckets(text, (SHINGLE_SIZE, SHINGLE_SIZE), SHINGLE_BITS))
+        if not len(shingles):
+            return None
+        hashed = (self.a[:, None] * shingles[None, :] + self.b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+def jaccard(sig1, sig2):
+    """Estimated Jaccard similarity of two signatures (0 if either is missing)."""
+    if sig1 is None or sig2 is None:
+        return 0.0
+    return float(np.count_nonzero(sig1 == sig2)) / len(sig1)
+
+
+def phash_bits(phash):
+    """A pHash (imagehash.ImageHash) as a 64-bit integer, or None."""
+    if phash is None:
+        return None
+    return int(''.join('1' if bit else '0' for bit in phash.hash.flatten()), 2)
+
+
+def image_distance(bits1, bits2):
+    """Hamming distance of two pHashes as integers, or None if either is missing."""
+    if bits1 is None or bits2 is None:
+        return None
+    return bin(bits1 ^ bits2).count('1')
+
+
+class _DisjointSet:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        self.parent[self.find(i)] = self.find(j)
+
+
+def cluster_listings(listings, bands=None, text_threshold=None, image_max_distance=None, max_probes=8):
+    """
+    Groups near-duplicate listings by LSH over their signatures and image hashes.
+
+    Args:
+        listings (list): Dicts with `signature` (from MinHasher.signature or
+                         None), `image_bits` (phash_bits or None) and
+                         `trusted` (bool).
+        bands (int): LSH bands of the text signatures, defaults to Config.BULK_LSH_BANDS.
+        text_threshold (float): See the module docstring, defaults to Config.BULK_TEXT_THRESHOLD.
+        image_max_distance (int): See the module docstring, defaults to Config.BULK_IMAGE_DISTANCE.
+        max_probes (int): Dissimilar bucket members a listing is compared with at most.
+
+    Returns:
+        tuple: (clusters, comparisons). Clusters are lists of listing indices,
+               largest first. Comparisons counts the candidate pairs checked.
+    """
+    bands = bands or Config.BULK_LSH_BANDS
+    text_threshold = Config.BULK_TEXT_THRESHOLD if text_threshold is None else text_threshold
+    image_max_distance = Config.BULK_IMAGE_DISTANCE if image_max_distance is None else image_max_distance
+
+    buckets = defaultdict(list)
+    for i, listing in enumerate(listings):
+        signature, bits = listing['signature'], listing['image_bits']
+        if signature is not None:
+            rows = len(signature) // bands
+            for band in range(bands):
+                buckets[(listing['trusted'], band, signature[band * rows:(band + 1) * rows].tobytes())].append(i)
+        if bits is not None:
+            for band in range(IMAGE_BANDS):
+                buckets[(listing['trusted'], 'image', band, (bits >> (16 * band)) & 0xffff)].append(i)
+
+    def similar(i, j):
+        text = jaccard(listings[i]['signature'], listings[j]['signature'])
+        distance = image_distance(listings[i]['image_bits'], listings[j]['image_bits'])
+        if text >= text_threshold and (distance is None or distance <= 2 * image_max_distance):
+            return True
+        return distance is not None and distance <= image_max_distance and text >= text_threshold / 2
+
+    sets = _DisjointSet(len(listings))
+    comparisons = 0
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        # A listing is compared with up to `max_probes` earlier members of
+        # other clusters until one matches, instead of with every member.
+        # Joining a cluster doesn't change the roots of the earlier members.
+        seen, seen_roots = [], set()
+        for i in members:
+            if sets.find(i) in seen_roots:
+                continue
+            for j in seen:
+                comparisons += 1
+                if similar(i, j):
+                    sets.union(i, j)
+                    break
+            else:
+                if len(seen) < max_probes:
+                    seen.append(i)
+                    seen_roots.add(sets.find(i))
+
+    groups = defaultdict(list)
+    for i in range(len(listings)):
+        groups[sets.find(i)].append(i)
+    clusters = sorted(groups.values(), key=lambda members: (-len(members), members[0]))
+    return clusters, comparisons
+
+
+def _completeness(listing):
+    """Sort key choosing a cluster's representative: the most complete listing first."""
+    product = listing['product'] or {}
+    return (listing['error'] is None and not product.get('scraping_error'),
+            listing['image_bits'] is not None,
+            len(product.get('description') or ''),
+            -listing['index'])
+
+
+class BulkScan:
+    """Extracts, clusters and analyses a list of URLs."""
+
+    def __init__(self, workers=None, domain_limit=None, time_budget=None, minhasher=None):
+        """
+        Args:
+            workers (int): URLs extracted or analysed at once, defaults to Config.BULK_WORKERS.
+            domain_limit (int): Of which on one retailer domain, defaults to Config.BULK_DOMAIN_LIMIT.
+            time_budget (float): Seconds per representative analysis (see analyze_url).
+            minhasher (MinHasher): Signature function, defaults to one of Config.BULK_MINHASH_PERM values.
+        """
+        self.workers = workers or Config.BULK_WORKERS
+        self.time_budget = time_budget
+        self.minhasher = minhasher or MinHasher(Config.BULK_MINHASH_PERM)
+        self.scheduler = Scheduler(concurrency=self.workers, domain_limit=domain_limit or Config.BULK_DOMAIN_LIMIT,
+                                   interactive_reserve=0, bulk_queue=sys.maxsize, wait_timeout=24 * 3600)
+
+    def _collect(self, index, url):
+        """Extracts one URL and computes its signature and image hash."""
+        listing = {'index': index, 'url': url, 'product': None, 'signature': None, 'image_bits': None,
+                   'trusted': is_trusted_url(url), 'phash': None, 'error': None}
+        try:
+            with self.scheduler.slot(url, priority=BULK, client='bulk-scan'):
+                listing['product'] = extract_flight.do(url, extract_product_details, url)
+                img = image_url(listing['product'])
+                listing['phash'] = image_hash(img) if img else None
+        except Exception as e:
+            logger.warning(f'Bulk extraction failed for {url}: {e}')
+            listing['error'] = str(e)
+            return listing
+        product = listing['product']
+        if not product.get('scraping_error'):
+            # Scraper fallbacks share placeholder fields, so they are never clustered
+            listing['signature'] = self.minhasher.signature(f"{product.get('title', '')}\n{product.get('description', '')}")
+            listing['image_bits'] = phash_bits(listing['phash'])
+        return listing
+
+    def _analyze(self, listing):
+        seed = {'product': listing['product'], 'product_image_hash': listing['phash']}
+        try:
+            with self.scheduler.slot(listing['url'], priority=BULK, client='bulk-scan'):
+                return analyze_url(listing['url'], seed=seed, time_budget=self.time_budget)
+        except ExtractionError as e:
+            return {'error': f'Failed to extract product details: {e}'}
+        except Exception as e:
+            logger.error(f"Bulk analysis failed for {listing['url']}: {e}")
+            return {'error': f'Analysis failed: {e}'}
+
+    def run(self, urls, analyze=True):
+        """
+        Scans `urls`.
+
+        Args:
+            urls (list): Product URLs.
+            analyze (bool): Analyse cluster representatives; False only clusters.
+
+        Returns:
+            dict: `listings` (one entry per URL, in order, with its cluster,
+                  representative and verdict), `clusters` (members and
+                  representative of each cluster with more than one
+                  listing) and `stats`.
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk') as pool:
+            listings = list(pool.map(self._collect, range(len(urls)), urls))
+            extracted_s = time.perf_counter() - start
+
+            clusterable = [listing for listing in listings if listing['error'] is None]
+            groups, comparisons = cluster_listings(clusterable)
+            clusters = [[clusterable[i] for i in group] for group in groups]
+            for cluster_id, members in enumerate(clusters):
+                members.sort(key=_completeness, reverse=True)
+                for member in members:
+                    member['cluster'] = cluster_id
+            clustered_s = time.perf_counter() - start - extracted_s
+            metrics.observe('bulk.cluster', clustered_s)
+
+            representatives = [members[0] for members in clusters]
+            if analyze:
+                analyses = dict(zip((rep['index'] for rep in representatives),
+                                    pool.map(self._analyze, representatives)))
+            else:
+                analyses = {}
+
+        results = [self._result(listing, clusters, analyses) for listing in listings]
+        analysed = len(analyses)
+        metrics.incr('bulk.listings', len(urls))
+        metrics.incr('bulk.analyzed', analysed)
+        metrics.incr('bulk.propagated', sum(result.get('propagated', False) for result in results))
+        return {
+            'listings': results,
+            'clusters': [{
+                'id': cluster_id,
+                'size': len(members),
+                'representative': members[0]['url'],
+                'urls': [member['url'] for member in members],
+                'sellers': sorted({str((member['product'] or {}).get('seller', '')) for member in members}),
+            } for cluster_id, members in enumerate(clusters) if len(members) > 1],
+            'stats': {
+                'urls': len(urls),
+                'extraction_failed': len(listings) - len(clusterable),
+                'clusters': len(clusters),
+                'duplicate_clusters': sum(len(members) > 1 for members in clusters),
+                'analyses': analysed,
+                'analyses_saved': len(clusterable) - len(clusters) if analyze else 0,
+                'candidate_pairs': comparisons,
+                'extract_s': round(extracted_s, 2),
+                'cluster_s': round(clustered_s, 3),
+                'total_s': round(time.perf_counter() - start, 2),
+            },
+        }
+
+    def _result(self, listing, clusters, analyses):
+        """The output entry of one listing."""
+        result = {'url': listing['url']}
+        if listing['error'] is not None:
+            result['error'] = listing['error']
+            return result
+        members = clusters[listing['cluster']]
+        rep = members[0]
+        product = listing['product'] or {}
+        result.update({
+            'title': product.get('title', ''),
+            'seller': product.get('seller', ''),
+            'cluster': listing['cluster'],
+            'cluster_size': len(members),
+            'representative': rep['url'],
+            'propagated': listing is not rep and rep['index'] in analyses,
+        })
+        if listing is not rep:
+            result['text_similarity'] = round(jaccard(listing['signature'], rep['signature']), 3)
+            result['image_distance'] = image_distance(listing['image_bits'], rep['image_bits'])
+        analysis = analyses.get(rep['index'])
+        if analysis is not None:
+            if 'error' in analysis:
+                result['analysis_error'] = analysis['error']
+            else:
+                result['verdict'] = analysis['verdict']
+                result['score'] = analysis['score']
+                if listing is rep:
+                    result['analysis'] = analysis
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-scan product URLs, analysing one listing per cluster.')
+    parser.add_argument('urls', help="file with one product URL per line ('-' for stdin)")
+    parser.add_argument('--out', help='write one JSON result per URL here (default: stdout)')
+    parser.add_argument('--workers', type=int, default=Config.BULK_WORKERS)
+    parser.add_argument('--domain-limit', type=int, default=Config.BULK_DOMAIN_LIMIT)
+    parser.add_argument('--budget', type=float, help='time budget per analysis in seconds')
+    parser.add_argument('--cluster-only', action='store_true', help="cluster the listings but don't analyse them")
+    args = parser.parse_args()
+
+    f = sys.stdin if args.urls == '-' else open(args.urls)
+    with f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    scan = BulkScan(workers=args.workers, domain_limit=args.domain_limit, time_budget=args.budget)
+    report = scan.run(urls, analyze=not args.cluster_only)
+
+    out = open(args.out, 'w') if args.out else sys.stdout
+    for result in report['listings']:
+        out.write(json.dumps(result, default=str) + '\n')
+    if args.out:
+        out.close()
+    for cluster in report['clusters'][:10]:
+        print(f"cluster {cluster['id']}: {cluster['size']} listings, {len(cluster['sellers'])} sellers, "
+              f"representative {cluster['representative']}", file=sys.stderr)
+    print(json.dumps(report['stats']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+A small dependency-graph executor for per-request analysis stages.
+
+A `StageGraph` declares stages and their dependencies once. `StageGraph.run`
+starts a `PipelineRun` for one request. Each stage is submitted to the
+executor as soon as all of its dependencies have finished, so independent
+stages (e.g. text similarity and the two image downloads) overlap. Every stage
+runs at most once per run, and `PipelineRun.memo` shares sub-computations
+between stages of the same request.
+
+A stage with a timeout that doesn't finish in time resolves to its default
+value, and is recorded in `PipelineRun.defaulted`. Python threads can't be
+killed, so the late stage still runs to completion in the background; its
+result is discarded.
+
+A run can also have a time budget. A stage with a `finish_by` fraction must
+then finish within that fraction of the budget, counted from the start of the
+run, so the budget is split between consecutive stages. Its timeout is cut to
+the time left, and the deadline is set for the stage's blocking calls (see
+budget.py). A stage whose deadline has passed before it starts is skipped, and
+resolves to its default like a timed-out one. Stages without `finish_by`
+(e.g. classification) always run.
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import budget
+import metrics
+import profiling
+
+logger = logging.getLogger(__name__)
+
+_NO_DEFAULT = object()
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    `fn` is called as `fn(run, **deps)`, where each dependency's result is passed
+    as a keyword argument named after the dependency stage.
+    """
+
+    def __init__(self, name: str, fn: Callable, deps: Iterable[str] = (), timeout: Optional[float] = None,
+                 default: Any = _NO_DEFAULT, finish_by: Optional[float] = None):
+        """
+        Args:
+            name (str): Stage name, also the keyword its result is passed as.
+            fn (callable): The stage function.
+            deps (iterable): Names of the stages (or run inputs) it needs.
+            timeout (float): Seconds after the stage is started before it falls
+                             back to `default`; None waits indefinitely.
+            default: Value used when the stage times out or fails. Without a
+                     default, failures propagate to dependent stages.
+            finish_by (float): Fraction of the run's time budget by which the
+                               stage must have finished; None is unbudgeted.
+        """
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.default = default
+        self.finish_by = finish_by
+
+    @property
+    def has_default(self):
+        return self.default is not _NO_DEFAULT
+
+
+class InlineExecutor:
+    """Executor that runs each task immediately in the calling thread (the linear flow)."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class StageGraph:
+    """An immutable set of stages; `run` executes it for one request."""
+
+    def __init__(self, stages: Iterable[Stage], inputs: Iterable[str] = ()):
+        """
+        Args:
+            stages (iterable): The stages.
+            inputs (iterable): Names of the values supplied by the caller of `run`.
+        """
+        self.stages: Dict[str, Stage] = {}
+        self.inputs = tuple(inputs)
+        for stage in stages:
+            if stage.name in self.stages or stage.name in self.inputs:
+                raise ValueError(f'Duplicate stage name: {stage.name}')
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages and dep not in self.inputs:
+                    raise ValueError(f'Stage {stage.name} depends on unknown stage {dep}')
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done' or name in self.inputs:
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f'Stage dependency cycle: {" -> ".join(path + [name])}')
+            state[name] = 'visiting'
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            state[name] = 'done'
+
+        for name in self.stages:
+            visit(name, [])
+
+    def run(self, executor, seed: Optional[Dict[str, Any]] = None, time_budget: Optional[float] = None,
+            **inputs) -> 'PipelineRun':
+        """
+        Starts a run. Nothing executes until a stage is submitted or requested.
+
+        Args:
+            executor: A concurrent.futures executor (or InlineExecutor).
+            seed (dict): Precomputed stage results, e.g. an already-extracted product.
+            time_budget (float): Seconds the budgeted stages may take in total; None is unlimited.
+            **inputs: Values for the graph's inputs.
+        """
+        missing = set(self.inputs) - set(inputs)
+        if missing:
+            raise ValueError(f'Missing pipeline inputs: {sorted(missing)}')
+        values = dict(inputs)
+        values.update(seed or {})
+        return PipelineRun(self, executor, values, time_budget)
+
+
+class PipelineRun:
+    """Execution state of a StageGraph for one request."""
+
+    def __init__(self, graph: StageGraph, executor, values: Dict[str, Any], time_budget: Optional[float] = None):
+        self.graph = graph
+        self.executor = executor
+        self.time_budget = time_budget
+        self.started = time.monotonic()
+        self.timings: Dict[str, float] = {}
+        # perf_counter() at which each stage finished
+        self.finished_at: Dict[str, float] = {}
+        self.defaulted = set()
+        self._resolved = set()
+        self._lock = threading.RLock()
+        self._futures: Dict[str, Future] = {}
+        self._memo: Dict[Any, Future] = {}
+        for name, value in values.items():
+            future = Future()
+            future.set_result(value)
+            self._futures[name] = future
+
+    def submit(self, name: str) -> Future:
+        """Schedules a stage (and, first, its dependencies). Returns its future."""
+        with self._lock:
+            future = self._futures.get(name)
+            if future is not None:
+                return future
+            future = self._futures[name] = Future()
+        stage = self.graph.stages[name]
+        dep_futures = [self.submit(dep) for dep in stage.deps]
+        pending = [len(dep_futures)]
+        pending_lock = threading.Lock()
+
+        def on_dep_done(_):
+            with pending_lock:
+                pending[0] -= 1
+                ready = pending[0] == 0
+            if ready:
+                self._start(stage, future, dep_futures)
+
+        if not dep_futures:
+            self._start(stage, future, dep_futures)
+        for dep_future in dep_futures:
+            dep_future.add_done_callback(on_dep_done)
+        return future
+
+    def submitted(self, name: str) -> bool:
+        """Whether a stage has been submitted (or seeded) in this run."""
+        with self._lock:
+            return name in self._futures
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Submits a stage if needed and waits for its result."""
+        return self.submit(name).result(timeout)
+
+    def results(self, names: Iterable[str]) -> Dict[str, Any]:
+        """Submits several stages at once, then waits for all of them."""
+        names = list(names)
+        futures = [self.submit(name) for name in names]
+        return {name: future.result() for name, future in zip(names, futures)}
+
+    def memo(self, key, fn: Callable, *args) -> Any:
+        """
+        Calls `fn(*args)` once per `key` within this run; concurrent and later
+        callers with the same key get the same result.
+        """
+        with self._lock:
+            future = self._memo.get(key)
+            owner = future is None
+            if owner:
+                future = self._memo[key] = Future()
+        if owner:
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def deadline(self, stage: Stage) -> Optional[float]:
+        """The time.monotonic() by which a stage must finish, or None if it isn't budgeted."""
+        if self.time_budget is None or stage.finish_by is None:
+            return None
+        return self.started + self.time_budget * stage.finish_by
+
+    def _resolve(self, stage: Stage, future: Future, value=None, error=None, defaulted=False):
+        # Claim the stage first: resolving the future runs dependent stages, which
+        # may read `defaulted` (and the request may return) before set_result returns
+        with self._lock:
+            if stage.name in self._resolved:
+                # Already resolved, by the stage or by its timeout
+                return False
+            self._resolved.add(stage.name)
+            if defaulted:
+                self.defaulted.add(stage.name)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+        return True
+
+    def _start(self, stage: Stage, future: Future, dep_futures):
+        kwargs = {}
+        for dep, dep_future in zip(stage.deps, dep_futures):
+            error = dep_future.exception()
+            if error is not None:
+                if stage.has_default:
+                    self._resolve(stage, future, stage.default, defaulted=True)
+                else:
+                    self._resolve(stage, future, error=error)
+                return
+            kwargs[dep] = dep_future.result()
+
+        timeout = stage.timeout
+        deadline = self.deadline(stage)
+        if deadline is not None:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                self._skip(stage, future)
+                return
+            timeout = left if timeout is None else min(timeout, left)
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._expire, (stage, future, timeout))
+            timer.daemon = True
+            timer.start()
+        # Copy the caller's context so context variables reach the worker thread
+        context = contextvars.copy_context()
+        self.executor.submit(context.run, self._execute, stage, future, kwargs, timer, deadline)
+
+    def _execute(self, stage: Stage, future: Future, kwargs, timer, deadline=None):
+        if future.done():
+            return
+        start = time.perf_counter()
+        error = None
+        try:
+            with profiling.stage_scope(stage.name), budget.until(deadline):
+                value = stage.fn(self, **kwargs)
+        except Exception as e:
+            value, error = None, e
+        if timer is not None:
+            timer.cancel()
+        # Timings are recorded before resolving so that dependent stages can read them
+        end = time.perf_counter()
+        self.timings[stage.name] = end - start
+        self.finished_at[stage.name] = end
+        metrics.observe(f'stage.{stage.name}', end - start)
+
+        if error is None:
+            self._resolve(stage, future, value)
+        elif stage.has_default:
+            logger.warning(f'Stage {stage.name} failed, using default: {error}')
+            self._resolve(stage, future, stage.default, defaulted=True)
+        else:
+            self._resolve(stage, future, error=error)
+
+    def _expire(self, stage: Stage, future: Future, timeout: float):
+        if stage.has_default:
+            expired = self._resolve(stage, future, stage.default, defaulted=True)
+        else:
+            expired = self._resolve(stage, future, error=TimeoutError(f'Stage {stage.name} timed out after {timeout:.2f}s'))
+        if expired:
+            metrics.incr(f'stage.{stage.name}.timeout')
+            logger.warning(f'Stage {stage.name} timed out after {timeout:.2f}s'
+                           + (', using default' if stage.has_default else ''))
+
+    def _skip(self, stage: Stage, future: Future):
+        metrics.incr(f'stage.{stage.name}.skipped')
+        if stage.has_default:
+            logger.warning(f'Stage {stage.name} skipped, no time budget left; using default')
+            self._resolve(stage, future, stage.default, defaulted=True)
+        else:
+            self._resolve(stage, future, error=budget.BudgetExhausted(f'No time budget left for stage {stage.name}'))
@@ -0,0 +1,227 @@
+"""
+Single-flight execution of identical concurrent operations.
+
+When many requests for the same product arrive together, the extraction,
+trusted-source search and image downloads for it run once. The other callers
+wait for that execution and get (a copy of) its result:
+
+    extract_flight = SingleFlight('extract')
+    product = extract_flight.do(url, extract_product_details, url)
+
+Within a process, callers with the same key share one execution. With a
+directory configured (SINGLEFLIGHT_DIR, set by gunicorn.conf.py), gunicorn
+workers coordinate too. The first worker takes an exclusive `flock` on a
+per-key lock file and writes the result next to it. Workers that find the
+lock held wait for it, then use that result if it was written while they
+waited. Nothing is cached beyond the flight itself: a call that starts after
+the previous one finished runs again.
+
+Results are shared as JSON (image hashes as hex strings); results that don't
+serialise are not shared. The directory must be private: it is created with
+mode 0700, and one owned by another user or readable by others is refused,
+so that other local users can't plant results. Coalescing then stays within
+the process.
+
+Counters `singleflight.<name>.executed`, `.coalesced` (threads that waited in
+the same process) and `.coalesced_workers` (results taken from another
+worker) are exposed at /stats.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import stat
+import threading
+import time
+from concurrent.futures import Future
+
+import budget
+import metrics
+from config import Config
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+try:
+    import imagehash
+    IMAGEHASH_AVAILABLE = True
+except ImportError:
+    IMAGEHASH_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Lock and result files untouched for this long are removed
+STALE_FILE_AGE = 600
+# Flights between two sweeps of stale files
+SWEEP_EVERY = 256
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution."""
+
+    def __init__(self, name, directory=None, wait_timeout=None):
+        """
+        Args:
+            name (str): Operation name, used in counters and file names.
+            directory (str): Directory for cross-worker lock and result files,
+                             defaults to Config.SINGLEFLIGHT_DIR; empty
+                             coalesces within the process only.
+            wait_timeout (float): Seconds to wait for another worker's
+                                  execution before running the operation
+                                  anyway, defaults to Config.SINGLEFLIGHT_WAIT.
+        """
+        self.name = name
+        self.directory = Config.SINGLEFLIGHT_DIR if directory is None else directory
+        self.wait_timeout = Config.SINGLEFLIGHT_WAIT if wait_timeout is None else wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._flights = 0
+        self._directory_checked = False
+
+    def do(self, key, fn, *args):
+        """
+        Returns `fn(*args)`, sharing one execution among concurrent callers with `key`.
+
+        If the execution raises, every waiting caller in the process gets the exception.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            metrics.incr(f'singleflight.{self.name}.coalesced')
+            # Callers may modify their result; don't share the object
+            return copy.deepcopy(call.result())
+        try:
+            result = self._run(key, fn, args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _run(self, key, fn, args):
+        if not self.directory or not FCNTL_AVAILABLE or not self._check_directory():
+            metrics.incr(f'singleflight.{self.name}.executed')
+            return fn(*args)
+
+        digest = hashlib.sha1(f'{self.name}\0{key}'.encode()).hexdigest()
+        base = os.path.join(self.directory, f'{self.name}-{digest}')
+        start = time.time()
+        with open(f'{base}.lock', 'a+b') as lock_file:
+            waited = not _try_lock(lock_file)
+            if waited:
+                locked = self._wait(lock_file)
+                result = _read_result(f'{base}.result', since=start)
+                if result is not _MISSING:
+                    metrics.incr(f'singleflight.{self.name}.coalesced_workers')
+                    return result
+                if not locked:
+                    logger.warning(f'Gave up waiting for another worker\'s {self.name} of {key}')
+            metrics.incr(f'singleflight.{self.name}.executed')
+            result = fn(*args)
+            _write_result(f'{base}.result', result)
+            # Closing the file releases the lock
+        self._maybe_sweep()
+        return result
+
+    def _check_directory(self):
+        """Creates the directory if needed; clears it (coalescing in-process only) unless it is private."""
+        if self._directory_checked:
+            return bool(self.directory)
+        self._directory_checked = True
+        if not _private_directory(self.directory):
+            logger.warning(f'Not sharing {self.name} results across workers: {self.directory} '
+                           f'must be a directory owned by this user and inaccessible to others')
+            self.directory = ''
+        return bool(self.directory)
+
+    def _wait(self, lock_file):
+        """Polls for the lock; returns False if it wasn't released within wait_timeout (or the time budget)."""
+        left = budget.remaining()
+        deadline = time.monotonic() + (self.wait_timeout if left is None else min(self.wait_timeout, left))
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            if _try_lock(lock_file):
+                return True
+        return False
+
+    def _maybe_sweep(self):
+        with self._lock:
+            self._flights += 1
+            if self._flights % SWEEP_EVERY:
+                return
+        cutoff = time.time() - STALE_FILE_AGE
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.startswith(f'{self.name}-') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _try_lock(lock_file):
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _private_directory(path):
+    """Whether `path` is (now) a directory, not a symlink, owned by this user with no group/other access."""
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError as e:
+        logger.warning(f'Single-flight directory {path} unusable: {e}')
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid == os.geteuid() and not info.st_mode & 0o077
+
+
+def _encode(value):
+    if IMAGEHASH_AVAILABLE and isinstance(value, imagehash.ImageHash):
+        return {'__imagehash__': str(value)}
+    raise TypeError(f'{type(value).__name__} is not shareable')
+
+
+def _decode(obj):
+    if IMAGEHASH_AVAILABLE and obj.keys() == {'__imagehash__'}:
+        return imagehash.hex_to_hash(obj['__imagehash__'])
+    return obj
+
+
+def _read_result(path, since):
+    """The result at `path` if it was written after `since`, else _MISSING."""
+    try:
+        if os.stat(path).st_mtime < since:
+            return _MISSING
+        with open(path, encoding='utf-8') as f:
+            return json.load(f, object_hook=_decode)
+    except (OSError, ValueError):
+        return _MISSING
+
+
+def _write_result(path, result):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(result, f, default=_encode)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug(f'Could not share result at {path}: {e}')
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
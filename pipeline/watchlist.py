@@ -0,0 +1,416 @@
+"""
+Incremental monitoring of a watchlist of listings.
+
+Each watched URL is re-checked once per WATCHLIST_INTERVAL (a day by
+default), doing as little of the /analyze pipeline as the page allows:
+
+- not_modified: the page was requested with the ETag / Last-Modified of the
+  previous check, and the retailer answered 304. Nothing else runs.
+- unchanged: the page was extracted, but the fields the analysis reads hash
+  to the same values as before. The previous verdict stands.
+- reclassified: only the description, reviews, rating or image count
+  changed. The stored reference, similarities, price deviation and seller
+  check are seeded into the stage graph, so only the content features and
+  classification run again.
+- analyzed: the title, price, seller or images changed (or it's the first
+  check). The full pipeline runs, seeded with the extracted product.
+
+The state of every URL (validators, field hashes, stored stage results, last
+verdict, next check) is kept in SQLite at WATCHLIST_DB. Checks are spread over
+the interval: a URL's first check falls at an offset derived from its hash, and
+each check schedules the next one an interval later. The runner starts the due
+checks oldest first, at most WATCHLIST_DOMAIN_LIMIT at once per retailer
+domain, and at least WATCHLIST_DOMAIN_DELAY seconds apart on one domain. It
+looks at the oldest due URLs of each domain, so a backlog on one retailer
+doesn't hold up the others.
+
+    python -m pipeline.watchlist add urls.txt
+    python -m pipeline.watchlist run            # keeps running, checking URLs as they fall due
+    python -m pipeline.watchlist run --once     # checks what's due now, then exits (for cron)
+    python -m pipeline.watchlist stats          # outcomes, and the share of work skipped
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from config import Config
+from pipeline.analysis import ExtractionError, analyze_url
+from scraping.extract_product import extract_product_details
+from scraping.http_client import NotModified
+from serving.scheduler import domain_of
+
+logger = logging.getLogger(__name__)
+
+NOT_MODIFIED = 'not_modified'
+UNCHANGED = 'unchanged'
+RECLASSIFIED = 'reclassified'
+ANALYZED = 'analyzed'
+FAILED = 'failed'
+OUTCOMES = (NOT_MODIFIED, UNCHANGED, RECLASSIFIED, ANALYZED, FAILED)
+
+# Fields that the reference search, similarities, price deviation and seller check depend on
+IDENTITY_FIELDS = ('title', 'price', 'seller', 'images')
+# Fields that only the content features (and so the classification) depend on
+CONTENT_FIELDS = ('description', 'num_reviews', 'avg_rating', 'image_count')
+# Stage results kept to seed a reclassification
+SEED_STAGES = ('ref', 'text_sim', 'image_sim', 'price_dev', 'known_seller')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    url TEXT PRIMARY KEY,
+    domain TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    next_check REAL NOT NULL,
+    last_checked REAL,
+    last_changed REAL,
+    last_outcome TEXT,
+    validators TEXT,
+    identity_hash TEXT,
+    content_hash TEXT,
+    seed TEXT,
+    verdict TEXT,
+    score INTEGER,
+    checks INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS watchlist_next_check ON watchlist (next_check);
+CREATE TABLE IF NOT EXISTS watchlist_outcomes (
+    outcome TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def fields_hash(product, fields):
+    """Hash of some fields of an extracted product."""
+    values = {field: product.get(field) for field in fields}
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def first_check_offset(url, interval):
+    """Where in the interval a new URL is first checked: spread evenly by its hash."""
+    digest = hashlib.sha256(url.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 * interval
+
+
+class Watchlist:
+    """Watched URLs and their last check, in SQLite."""
+
+    def __init__(self, path=None, interval=None):
+        """
+        Args:
+            path (str): SQLite database, defaults to Config.WATCHLIST_DB.
+            interval (float): Seconds between checks of a URL, defaults to Config.WATCHLIST_INTERVAL.
+        """
+        self.path = path or Config.WATCHLIST_DB
+        self.interval = interval or Config.WATCHLIST_INTERVAL
+        # One connection shared by the check threads, serialised by the lock
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def add(self, urls, now=None):
+        """Adds URLs (already watched ones are left as they are). Returns how many were new."""
+        now = time.time() if now is None else now
+        rows = [(url, domain_of(url), now, now + first_check_offset(url, self.interval)) for url in urls]
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany('INSERT OR IGNORE INTO watchlist (url, domain, added_at, next_check) '
+                                 'VALUES (?, ?, ?, ?)', rows)
+            return self._db.total_changes - before
+
+    def remove(self, urls):
+        with self._lock, self._db:
+            self._db.executemany('DELETE FROM watchlist WHERE url = ?', [(url,) for url in urls])
+
+    def due(self, now=None, limit=1000, per_domain=None):
+        """
+        Rows due for a check, oldest first.
+
+        Args:
+            now (float): Time the rows are due by, defaults to now.
+            limit (int): Most rows returned.
+            per_domain (int): Most rows returned per domain (the oldest), so that a
+                              backlog on one domain doesn't hide the others.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if per_domain is None:
+                return self._db.execute('SELECT * FROM watchlist WHERE next_check <= ? ORDER BY next_check LIMIT ?',
+                                        (now, limit)).fetchall()
+            return self._db.execute('SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY domain '
+                                    'ORDER BY next_check) AS domain_rank FROM watchlist WHERE next_check <= ?) '
+                                    'WHERE domain_rank <= ? ORDER BY next_check LIMIT ?',
+                                    (now, per_domain, limit)).fetchall()
+
+    def next_due(self):
+        """Time of the next scheduled check, or None if the watchlist is empty."""
+        with self._lock:
+            return self._db.execute('SELECT MIN(next_check) FROM watchlist').fetchone()[0]
+
+    def get(self, url):
+        with self._lock:
+            return self._db.execute('SELECT * FROM watchlist WHERE url = ?', (url,)).fetchone()
+
+    def record(self, url, outcome, seconds, checked_at, **fields):
+        """Stores the outcome of a check and schedules the next one."""
+        fields.update(last_checked=checked_at, last_outcome=outcome, next_check=checked_at + self.interval)
+        if outcome in (RECLASSIFIED, ANALYZED):
+            fields['last_changed'] = checked_at
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        failed = int(outcome == FAILED)
+        with self._lock, self._db:
+            self._db.execute(f'UPDATE watchlist SET {assignments}, checks = checks + 1, failures = failures + ? '
+                             f'WHERE url = ?', (*fields.values(), failed, url))
+            self._db.execute('INSERT INTO watchlist_outcomes (outcome, count, seconds) VALUES (?, 1, ?) '
+                             'ON CONFLICT (outcome) DO UPDATE SET count = count + 1, seconds = seconds + ?',
+                             (outcome, seconds, seconds))
+
+    def stats(self):
+        """
+        Outcome counts and time spent, and the share of checks that skipped work.
+
+        Returns:
+            dict: `urls`, `due`, `outcomes` ({outcome: {count, mean_s}}),
+                  `skipped` (share of checks that ran no analysis),
+                  `reclassified` (share that ran classification only) and
+                  `verdicts` (URLs per last verdict).
+        """
+        with self._lock:
+            outcomes = {row['outcome']: {'count': row['count'], 'mean_s': round(row['seconds'] / row['count'], 3)}
+                        for row in self._db.execute('SELECT * FROM watchlist_outcomes') if row['count']}
+            urls = self._db.execute('SELECT COUNT(*) FROM watchlist').fetchone()[0]
+            due = self._db.execute('SELECT COUNT(*) FROM watchlist WHERE next_check <= ?', (time.time(),)).fetchone()[0]
+            verdicts = dict(self._db.execute('SELECT verdict, COUNT(*) FROM watchlist WHERE verdict IS NOT NULL '
+                                             'GROUP BY verdict').fetchall())
+        checks = sum(outcome['count'] for outcome in outcomes.values())
+        count = lambda *names: sum(outcomes.get(name, {}).get('count', 0) for name in names)  # noqa: E731
+        return {
+            'urls': urls,
+            'due': due,
+            'checks': checks,
+            'outcomes': outcomes,
+            'skipped': round(count(NOT_MODIFIED, UNCHANGED) / checks, 3) if checks else None,
+            'reclassified': round(count(RECLASSIFIED) / checks, 3) if checks else None,
+            'verdicts': verdicts,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def check(watchlist, row, time_budget=None):
+    """
+    Re-checks one watched URL, running only the stages its changes require.
+
+    Args:
+        watchlist (Watchlist): Where the result is stored.
+        row (sqlite3.Row): The URL's watchlist row.
+        time_budget (float): Seconds for an analysis (see analyze_url).
+
+    Returns:
+        str: The outcome (one of OUTCOMES).
+    """
+    url = row['url']
+    checked_at = time.time()
+    start = time.perf_counter()
+    validators = json.loads(row['validators']) if row['validators'] else None
+    try:
+        product = extract_product_details(url, validators=validators)
+    except NotModified:
+        return _record(watchlist, url, NOT_MODIFIED, start, checked_at)
+    except Exception as e:
+        logger.warning(f'Watchlist extraction failed for {url}: {e}')
+        return _record(watchlist, url, FAILED, start, checked_at)
+    if product.get('scraping_error'):
+        return _record(watchlist, url, FAILED, start, checked_at)
+
+    identity_hash = fields_hash(product, IDENTITY_FIELDS)
+    content_hash = fields_hash(product, CONTENT_FIELDS)
+    fields = {'validators': json.dumps(product.get('validators') or {}),
+              'identity_hash': identity_hash, 'content_hash': content_hash}
+    if row['verdict'] is not None and identity_hash == row['identity_hash']:
+        if content_hash == row['content_hash']:
+            return _record(watchlist, url, UNCHANGED, start, checked_at, **fields)
+        outcome, seed = RECLASSIFIED, dict(json.loads(row['seed'] or '{}'), product=product)
+    else:
+        outcome, seed = ANALYZED, {'product': product}
+
+    kept = {}
+
+    def keep_stage_results(run):
+        for name in SEED_STAGES:
+            # Stages that defaulted (timed out) are computed again next time
+            if run.submitted(name) and name not in run.defaulted:
+                try:
+                    kept[name] = json.loads(json.dumps(run.result(name)))
+                except (TypeError, ValueError):
+                    pass  # not storable; the stage runs again on reclassification
+
+    try:
+        result = analyze_url(url, seed=seed, time_budget=time_budget, on_run=keep_stage_results)
+    except ExtractionError as e:
+        logger.warning(f'Watchlist analysis failed for {url}: {e}')
+        return _record(watchlist, url, FAILED, start, checked_at)
+    if result['partial'] or result['details'].get('reference_source') == 'Analysis Failed':
+        # Don't reuse a half-computed or failed analysis: without validators the
+        # next check can't end in a 304, and without the hash it analyses again
+        fields.update(validators=None, identity_hash=None)
+    return _record(watchlist, url, outcome, start, checked_at, seed=json.dumps(kept),
+                   verdict=result['verdict'], score=result['score'], **fields)
+
+
+def _record(watchlist, url, outcome, start, checked_at, **fields):
+    seconds = time.perf_counter() - start
+    watchlist.record(url, outcome, seconds, checked_at, **fields)
+    metrics.incr(f'watchlist.{outcome}')
+    metrics.observe(f'watchlist.{outcome}', seconds)
+    return outcome
+
+
+class Runner:
+    """Starts due checks, oldest first, within per-domain politeness limits."""
+
+    def __init__(self, watchlist, workers=None, domain_limit=None, domain_delay=None, time_budget=None):
+        """
+        Args:
+            watchlist (Watchlist): The URLs to check.
+            workers (int): Checks running at once, defaults to Config.WATCHLIST_WORKERS.
+            domain_limit (int): Checks running at once on one domain, defaults to Config.WATCHLIST_DOMAIN_LIMIT.
+            domain_delay (float): Seconds between starting two checks on one domain,
+                                  defaults to Config.WATCHLIST_DOMAIN_DELAY.
+            time_budget (float): Seconds per analysis (see analyze_url).
+        """
+        self.watchlist = watchlist
+        self.workers = workers or Config.WATCHLIST_WORKERS
+        self.domain_limit = domain_limit or Config.WATCHLIST_DOMAIN_LIMIT
+        self.domain_delay = Config.WATCHLIST_DOMAIN_DELAY if domain_delay is None else domain_delay
+        self.time_budget = time_budget
+        self._cond = threading.Condition()
+        self._running = {}
+        self._in_flight = set()
+        self._next_start = {}
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+
+    def _done(self, url, domain, outcome):
+        with self._cond:
+            self._running[domain] -= 1
+            self._in_flight.discard(url)
+            self.outcomes[outcome] += 1
+            self._cond.notify_all()
+
+    def _run_check(self, row):
+        outcome = FAILED
+        try:
+            outcome = check(self.watchlist, row, self.time_budget)
+        except Exception as e:
+            logger.error(f"Watchlist check of {row['url']} failed: {e}")
+        finally:
+            self._done(row['url'], row['domain'], outcome)
+
+    def _startable(self, rows, now):
+        """Due rows that may start now, and when the next blocked one could."""
+        start, wake = [], None
+        free = self.workers - sum(self._running.values())
+        for row in rows:
+            if free <= 0:
+                break
+            url, domain = row['url'], row['domain']
+            if url in self._in_flight or self._running.get(domain, 0) >= self.domain_limit:
+                continue
+            ready_at = self._next_start.get(domain, 0.0)
+            if ready_at > now:
+                wake = ready_at if wake is None else min(wake, ready_at)
+                continue
+            start.append(row)
+            free -= 1
+            self._running[domain] = self._running.get(domain, 0) + 1
+            self._in_flight.add(url)
+            self._next_start[domain] = now + self.domain_delay
+        return start, wake
+
+    def run(self, once=False, poll_interval=60.0):
+        """
+        Checks URLs as they fall due.
+
+        Args:
+            once (bool): Return when nothing is due any more, instead of waiting for the next check.
+            poll_interval (float): Longest sleep between looks at the watchlist.
+
+        Returns:
+            dict: Checks run per outcome.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='watchlist') as pool:
+            while True:
+                now = time.time()
+                # Read, pick and wait under one hold of the lock: a check finishing
+                # in between would otherwise be missed (or its row started again)
+                with self._cond:
+                    # The oldest domain_limit rows per domain: rows still running
+                    # plus one per free slot, so a busy domain can't hide the rest
+                    rows = self.watchlist.due(now, limit=self.workers * 50, per_domain=self.domain_limit)
+                    start, wake = self._startable(rows, time.monotonic())
+                    if not start:
+                        if not rows and not self._in_flight:
+                            if once:
+                                break
+                            next_due = self.watchlist.next_due()
+                            sleep = poll_interval if next_due is None else max(0.0, next_due - now)
+                        else:
+                            # Wait for a check to finish or a domain's delay to pass
+                            sleep = poll_interval if wake is None else max(0.0, wake - time.monotonic())
+                        self._cond.wait(min(sleep, poll_interval))
+                        continue
+                for row in start:
+                    pool.submit(self._run_check, row)
+        return self.outcomes
+
+
+def _read_urls(path):
+    f = sys.stdin if path == '-' else open(path)
+    with f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monitor a watchlist of listings, re-analysing only what changed.')
+    parser.add_argument('--db', default=Config.WATCHLIST_DB)
+    sub = parser.add_subparsers(dest='command', required=True)
+    add = sub.add_parser('add', help='watch the URLs in a file (one per line)')
+    add.add_argument('urls')
+    remove = sub.add_parser('remove', help='stop watching the URLs in a file')
+    remove.add_argument('urls')
+    run = sub.add_parser('run', help='check URLs as they fall due')
+    run.add_argument('--once', action='store_true', help='exit when nothing is due')
+    run.add_argument('--workers', type=int, default=Config.WATCHLIST_WORKERS)
+    run.add_argument('--budget', type=float, help='time budget per analysis in seconds')
+    sub.add_parser('stats', help='outcome counts and the share of work skipped')
+    args = parser.parse_args()
+
+    watchlist = Watchlist(args.db)
+    if args.command == 'add':
+        added = watchlist.add(_read_urls(args.urls))
+        print(f'Watching {added} new URLs')
+    elif args.command == 'remove':
+        watchlist.remove(_read_urls(args.urls))
+    elif args.command == 'run':
+        outcomes = Runner(watchlist, workers=args.workers, time_budget=args.budget).run(once=args.once)
+        print(json.dumps(outcomes))
+    else:
+        print(json.dumps(watchlist.stats(), indent=2))
+    watchlist.close()
+
+
+if __name__ == '__main__':
+    main()
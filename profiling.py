@@ -0,0 +1,228 @@
+"""
+On-demand sampling profiler for single requests.
+
+A profiled request runs inside `profile(name)`. A sampler thread then reads
+the stacks of the threads working on that request (`sys._current_frames`)
+every PROFILE_INTERVAL_MS. These are the request thread itself, plus every
+pipeline stage, because the stage graph wraps each stage in `stage_scope`, and
+the request's context variables reach the executor threads. The result is
+written to PROFILE_DIR in speedscope's format (https://www.speedscope.app),
+with one profile per stage. `folded` converts it to collapsed stacks for
+flamegraph.pl.
+
+    with profiling.profile(url) as session:
+        analyze_url(url)
+    session.path  # profiles/<id>.speedscope.json
+
+Requests that aren't profiled only pay for one context-variable lookup per
+stage.
+"""
+import contextvars
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_session = contextvars.ContextVar('profile_session', default=None)
+_NO_SCOPE = nullcontext()
+_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+
+class ProfileSession:
+    """Stack samples of the threads working on one request."""
+
+    def __init__(self, name, interval):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.interval = interval
+        self.path = None
+        self.duration = 0.0
+        # thread id -> label of what it is doing for this request
+        self._threads = {}
+        # (label, stack) -> seconds, stack as a root-first tuple of (name, file, line)
+        self._weights = defaultdict(float)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, label):
+        """Starts sampling the calling thread under `label`; returns the previous label."""
+        ident = threading.get_ident()
+        with self._lock:
+            previous = self._threads.get(ident)
+            self._threads[ident] = label
+        return previous
+
+    def detach(self, previous=None):
+        """Stops sampling the calling thread, or goes back to its previous label."""
+        ident = threading.get_ident()
+        with self._lock:
+            if previous is None:
+                self._threads.pop(ident, None)
+            else:
+                self._threads[ident] = previous
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name=f'profiler-{self.id[:8]}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample(self):
+        start = last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads.items())
+            for ident, label in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((getattr(code, 'co_qualname', code.co_name), code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if stack:
+                    self._weights[label, tuple(reversed(stack))] += elapsed
+        self.duration = time.perf_counter() - start
+
+    def speedscope(self):
+        """The samples as a speedscope document, one sampled profile per label."""
+        frames, index = [], {}
+        profiles = defaultdict(lambda: {'samples': [], 'weights': []})
+        for (label, stack), seconds in sorted(self._weights.items(), key=lambda item: item[0][0]):
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(index[frame])
+            profiles[label]['samples'].append(sample)
+            profiles[label]['weights'].append(round(seconds * 1000, 3))
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': self.name,
+            'exporter': 'profiling.py',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': label,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': round(sum(profile['weights']), 3),
+                'samples': profile['samples'],
+                'weights': profile['weights'],
+            } for label, profile in profiles.items()],
+        }
+
+
+def authorized(token):
+    """Whether `token` matches Config.PROFILE_TOKEN (profiling is off without one)."""
+    return bool(Config.PROFILE_TOKEN) and hmac.compare_digest(token.encode(), Config.PROFILE_TOKEN.encode())
+
+
+@contextmanager
+def profile(name, label='request'):
+    """
+    Profiles everything the calling thread, and the stages it starts, do inside the block.
+
+    Args:
+        name (str): Profile name, e.g. the analyzed URL.
+        label (str): Label of the calling thread's samples.
+
+    Yields:
+        ProfileSession: Its `path` is set once the block has exited.
+    """
+    session = ProfileSession(name, Config.PROFILE_INTERVAL_MS / 1000)
+    token = _session.set(session)
+    session.attach(label)
+    session.start()
+    try:
+        yield session
+    finally:
+        session.stop()
+        session.detach()
+        _session.reset(token)
+        try:
+            session.path = save(session)
+        except OSError as e:
+            logger.error(f'Could not write profile {session.id}: {e}')
+
+
+def stage_scope(name):
+    """Context manager labelling the calling thread's samples with a stage, if the request is profiled."""
+    session = _session.get()
+    if session is None:
+        return _NO_SCOPE
+    return _StageScope(session, f'stage {name}')
+
+
+class _StageScope:
+    def __init__(self, session, label):
+        self.session = session
+        self.label = label
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.session.attach(self.label)
+
+    def __exit__(self, *exc):
+        self.session.detach(self.previous)
+
+
+def save(session):
+    """Writes a session to PROFILE_DIR, keeping the newest PROFILE_KEEP files. Returns the path."""
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(Config.PROFILE_DIR, f'{session.id}.speedscope.json')
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(session.speedscope(), f)
+    os.replace(tmp, path)
+    saved = sorted((entry for entry in os.scandir(Config.PROFILE_DIR) if entry.name.endswith('.speedscope.json')),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in saved[:-Config.PROFILE_KEEP]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    logger.info('Saved request profile', extra={'profile_id': session.id, 'duration_s': round(session.duration, 3)})
+    return path
+
+
+def profile_path(profile_id):
+    """Path of a saved profile, or None if the id is malformed or unknown."""
+    if not _ID_PATTERN.fullmatch(profile_id or ''):
+        return None
+    path = os.path.join(Config.PROFILE_DIR, f'{profile_id}.speedscope.json')
+    return path if os.path.exists(path) else None
+
+
+def folded(document):
+    """
+    Converts a speedscope document to collapsed stacks ('label;a;b;c <ms>' per line),
+    the input format of flamegraph.pl and similar tools.
+    """
+    frames = document['shared']['frames']
+    lines = []
+    for profile in document['profiles']:
+        for sample, weight in zip(profile['samples'], profile['weights']):
+            names = [profile['name']] + [frames[i]['name'] for i in sample]
+            lines.append(f"{';'.join(name.replace(';', ':') for name in names)} {max(1, round(weight))}")
+    return '\n'.join(lines) + '\n'
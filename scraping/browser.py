@@ -0,0 +1,325 @@
+"""
+Chrome sessions for the Selenium scrapers.
+
+The scrapers only read a few DOM nodes and image `src` attributes, so the lean
+profile (BROWSER_LEAN=1, the default) keeps Chrome from doing anything else:
+
+- headless, with no GPU, extensions or background networking;
+- `pageLoadStrategy` 'eager': `driver.get` returns at DOMContentLoaded instead
+  of waiting for every subresource;
+- images, media and fonts, plus known ad and analytics hosts, are blocked at the
+  network level with the DevTools `Network.setBlockedURLs` command. Image
+  elements stay in the DOM, so their `src` can still be read.
+
+Because `get` returns early, scrapers wait for their own selectors with
+`wait_for_selectors` rather than for the page load.
+
+When the transport records (`scraping.transport`), the driver is wrapped in a
+`RecordingDriver` that saves the rendered DOM and every element the scraper
+looked up. When it replays, `new_driver` returns a `SnapshotDriver` that
+answers the same lookups from the archive, without Chrome.
+
+    with browser_session() as driver:
+        driver.get(url)
+        wait_for_selectors(driver, [(By.ID, 'productTitle')])
+"""
+import logging
+import os
+import sys
+from contextlib import contextmanager
+
+from bs4 import BeautifulSoup
+
+import budget
+from config import Config
+from scraping import transport
+
+try:
+    from selenium import webdriver
+    from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# URL patterns blocked in the lean profile ('*' is a wildcard)
+BLOCKED_RESOURCES = [
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.mp4', '*.webm', '*.m3u8', '*.mp3',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+]
+# Third-party ad, analytics and tag-manager hosts. DevTools blocks by URL
+# pattern, so third-party scripts are matched by host.
+BLOCKED_HOSTS = [
+    '*google-analytics.com*', '*googletagmanager.com*', '*googlesyndication.com*', '*doubleclick.net*',
+    '*googleadservices.com*', '*facebook.net*', '*connect.facebook.com*', '*amazon-adsystem.com*',
+    '*criteo.com*', '*criteo.net*', '*taboola.com*', '*outbrain.com*', '*hotjar.com*', '*clarity.ms*',
+    '*newrelic.com*', '*nr-data.net*', '*branch.io*', '*appsflyer.com*', '*moengage.com*',
+    '*webengage.com*', '*clevertap-prod.com*', '*scorecardresearch.com*', '*quantserve.com*',
+]
+
+
+def get_chromedriver_path():
+    """
+    Determines the path to the ChromeDriver executable.
+    """
+    base_dir = os.path.dirname(__file__)
+    # Windows: chromedriver.exe in project root or chromedriver_mac64
+    if sys.platform.startswith('win'):
+        exe_name = 'chromedriver.exe'
+    else:
+        exe_name = 'chromedriver'
+    # Check project root
+    root_path = os.path.join(os.path.dirname(base_dir), exe_name)
+    if os.path.exists(root_path):
+        return root_path
+    # Check chromedriver_mac64 directory
+    mac_path = os.path.join(os.path.dirname(base_dir), 'chromedriver_mac64', exe_name)
+    if os.path.exists(mac_path):
+        return mac_path
+    # Fallback: just the name (if in PATH)
+    return exe_name
+
+
+def chrome_options(lean=True, headless=True):
+    """
+    Builds the Chrome options.
+
+    Args:
+        lean (bool): Use the lean profile (eager page load, no images).
+        headless (bool): Run without a window.
+    """
+    options = Options()
+    if headless:
+        options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    if lean:
+        options.page_load_strategy = 'eager'
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--disable-background-networking')
+        options.add_argument('--disable-default-apps')
+        options.add_argument('--disable-sync')
+        options.add_argument('--mute-audio')
+        options.add_argument('--window-size=1280,1024')
+        # Don't decode images even if one slips past the URL patterns
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    return options
+
+
+def new_driver(lean=None, headless=None):
+    """
+    Starts Chrome.
+
+    Args:
+        lean (bool): Use the lean profile, defaults to Config.BROWSER_LEAN.
+        headless (bool): Run without a window, defaults to Config.BROWSER_HEADLESS.
+
+    Returns:
+        selenium.webdriver.Chrome: The driver; the caller must quit it.
+    """
+    current = transport.mode()
+    if current == transport.REPLAY:
+        return SnapshotDriver(transport.archive())
+    lean = Config.BROWSER_LEAN if lean is None else lean
+    headless = Config.BROWSER_HEADLESS if headless is None else headless
+    service = Service(executable_path=get_chromedriver_path())
+    driver = webdriver.Chrome(service=service, options=chrome_options(lean, headless))
+    if lean:
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_RESOURCES + BLOCKED_HOSTS})
+        except Exception as e:
+            logger.warning(f'Could not block resources via DevTools: {e}')
+    left = budget.remaining()
+    if left is not None:
+        # Page loads end with the request's time budget
+        driver.set_page_load_timeout(max(left, 1))
+    if current == transport.RECORD:
+        return RecordingDriver(driver, transport.archive())
+    return driver
+
+
+@contextmanager
+def browser_session(lean=None, headless=None):
+    """Context manager around `new_driver` that always quits Chrome."""
+    driver = new_driver(lean, headless)
+    try:
+        yield driver
+    finally:
+        driver.quit()
+
+
+def wait_for_selectors(driver, required, optional=(), timeout=10, optional_timeout=None):
+    """
+    Waits until the scraper's elements are in the DOM.
+
+    Args:
+        driver: The Selenium driver.
+        required (list): (By, value) locators that must appear; raises
+                         TimeoutException if they don't within `timeout`.
+        optional (list): Locators waited for at most `optional_timeout`
+                         seconds more (e.g. price or description, which some
+                         pages don't have).
+        timeout (float): Seconds to wait for the required elements.
+        optional_timeout (float): Defaults to Config.BROWSER_OPTIONAL_WAIT.
+
+    Both waits end at the request's time budget (see budget.py).
+    """
+    if isinstance(driver, SnapshotDriver):
+        # Nothing to wait for in a snapshot
+        for locator in required:
+            try:
+                driver.find_element(*locator)
+            except NoSuchElementException:
+                raise TimeoutException(f'{locator} is not in the DOM snapshot')
+        return
+    try:
+        timeout = budget.cap(timeout)
+    except budget.BudgetExhausted as e:
+        raise TimeoutException(str(e))
+    WebDriverWait(driver, timeout).until(EC.all_of(*(EC.presence_of_element_located(loc) for loc in required)))
+    if optional:
+        if optional_timeout is None:
+            optional_timeout = Config.BROWSER_OPTIONAL_WAIT
+        try:
+            WebDriverWait(driver, budget.cap(optional_timeout)).until(
+                EC.all_of(*(EC.presence_of_element_located(loc) for loc in optional)))
+        except (TimeoutException, budget.BudgetExhausted):
+            pass
+
+
+def _locator_key(by, value):
+    return f'{by}={value}'
+
+
+class RecordingElement:
+    """A WebElement whose text and attributes are saved as they are read."""
+
+    def __init__(self, element, entry):
+        self._element = element
+        self._entry = entry
+
+    @property
+    def text(self):
+        self._entry['text'] = self._element.text
+        return self._entry['text']
+
+    def get_attribute(self, name):
+        value = self._element.get_attribute(name)
+        self._entry['attrs'][name] = value
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self._element, name)
+
+
+class RecordingDriver:
+    """Wraps a Chrome driver; each page's DOM and element lookups go to the archive on the next `get` or `quit`."""
+
+    def __init__(self, driver, archive):
+        self._driver = driver
+        self._archive = archive
+        self._url = None
+        self._elements = {}
+
+    def get(self, url):
+        self._snapshot()
+        self._url = url
+        self._elements = {}
+        self._driver.get(url)
+
+    def find_element(self, by, value):
+        key = _locator_key(by, value)
+        try:
+            element = self._driver.find_element(by, value)
+        except NoSuchElementException:
+            self._elements.setdefault(key, None)
+            raise
+        entry = self._elements.get(key)
+        if entry is None:
+            entry = self._elements[key] = {'text': None, 'attrs': {}}
+        return RecordingElement(element, entry)
+
+    def quit(self):
+        self._snapshot()
+        self._driver.quit()
+
+    def _snapshot(self):
+        if self._url is None:
+            return
+        try:
+            self._archive.add_snapshot(self._url, self._driver.page_source, self._elements)
+        except WebDriverException as e:
+            logger.warning(f'Could not snapshot {self._url}: {e}')
+        self._url = None
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+class SnapshotElement:
+    """An element of a DOM snapshot, with the WebElement methods the scrapers use."""
+
+    def __init__(self, text, attrs):
+        self.text = text
+        self._attrs = attrs
+
+    def get_attribute(self, name):
+        return self._attrs.get(name)
+
+
+class SnapshotDriver:
+    """
+    Replays recorded Selenium pages.
+
+    Lookups the scraper made while recording return exactly what Chrome
+    returned; other lookups (e.g. from a newer scraper) are answered from the
+    recorded DOM with BeautifulSoup.
+    """
+
+    def __init__(self, archive):
+        self._archive = archive
+        self.page_source = ''
+        self._elements = {}
+        self._soup = None
+
+    def get(self, url):
+        snapshot = self._archive.snapshot(url)
+        if snapshot is None:
+            raise WebDriverException(f'No DOM snapshot for {url}')
+        self.page_source, self._elements = snapshot
+        self._soup = None
+
+    def find_element(self, by, value):
+        key = _locator_key(by, value)
+        if key in self._elements:
+            entry = self._elements[key]
+            if entry is None:
+                raise NoSuchElementException(f'{key} was not found when recorded')
+            return SnapshotElement(entry['text'] or '', entry['attrs'])
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.page_source, 'html.parser')
+        if by == 'id':
+            element = self._soup.find(id=value)
+        elif by == 'class name':
+            element = self._soup.find(class_=value)
+        elif by == 'tag name':
+            element = self._soup.find(value)
+        elif by == 'css selector':
+            element = self._soup.select_one(value)
+        else:
+            element = None
+        if element is None:
+            raise NoSuchElementException(f'{key} is not in the DOM snapshot')
+        attrs = {name: ' '.join(v) if isinstance(v, list) else v for name, v in element.attrs.items()}
+        return SnapshotElement(element.get_text('\n', strip=True), attrs)
+
+    def quit(self):
+        pass
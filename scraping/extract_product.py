@@ -2,9 +2,16 @@ import requests
 from bs4 import BeautifulSoup
 import re
 import logging
-import os
-import time
-import sys
+
+from urllib.parse import urlparse
+
+import metrics
+from scraping.browser import new_driver, wait_for_selectors
+from scraping import transport
+from scraping.http_client import NotModified, conditional_headers, fetch_html
+from scraping.transport import upstream_url
+from scraping.structured_data import StructuredDataScanner
+from analysis.keywords import keywords
 
 """
 This module contains functions for extracting product details from various e-commerce websites.
@@ -14,70 +21,235 @@ It supports both requests-based scraping and Selenium-based scraping for dynamic
 # Attempt to import Selenium libraries for handling dynamic content
 # Try to import Selenium
 try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
     from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.webdriver.chrome.service import Service
     SELENIUM_AVAILABLE = True
 except ImportError:
     SELENIUM_AVAILABLE = False
     logging.warning('Selenium not available, falling back to requests for scraping.')
 
-def get_chromedriver_path():
+HEADERS = {
+    # Using a more generic User-Agent to appear more like a regular browser
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+BRAND_DOMAINS = ['adidas.co.in', 'nike.com', 'puma.com', 'reebok.in', 'ajio.com']
+# Domains with a scraper of their own, counted by name in the extract.<domain>.<path>
+# metrics (any other domain is `other`, so callers can't add counters at will)
+RETAILER_DOMAINS = ['amazon.in', 'flipkart.com', 'snapdeal.com', 'myntra.com', 'nykaa.com'] + BRAND_DOMAINS
+
+# Elements each requests-based scraper reads, as (tag, attrs) for soup.find.
+# Pages are only downloaded until all of them have been seen (the fallback
+# selectors, e.g. Amazon's priceblock_ourprice, are only needed when these are
+# missing, in which case the page is read in full anyway).
+AMAZON_FIELDS = [
+    (None, {'id': 'productTitle'}),
+    ('div', {'id': 'feature-bullets'}),
+    ('span', {'class': 'a-price-whole'}),
+    ('img', {'id': 'landingImage'}),
+    ('a', {'id': 'bylineInfo'}),
+    ('span', {'id': 'acrCustomerReviewText'}),
+    ('span', {'class': 'a-icon-alt'}),
+]
+FLIPKART_FIELDS = [
+    ('span', {'class': 'B_NuCI'}),
+    ('div', {'class': 'X3BRps'}),
+    ('div', {'class': '_30jeq3 _16Jk6d'}),
+    ('img', {'class': 'q6DClP'}),
+    ('div', {'id': 'sellerName'}),
+    ('span', {'class': '_2_R_DZ'}),
+    ('div', {'class': '_3LWZlK'}),
+]
+SNAPDEAL_FIELDS = [
+    ('h1', {'class': 'pdp-e-i-head'}),
+    ('div', {'class': 'pdp-product-description-content'}),
+    ('span', {'class': 'payBlkBig'}),
+    ('img', {'class': 'cloudzoom'}),
+    ('span', {'class': 'pdp-seller-name'}),
+]
+TATA_CLIQ_FIELDS = [
+    ('h1', {'class': 'ProductDetailsMainCard__productName'}),
+    ('div', {'class': 'ProductDescription__descriptionContent'}),
+    ('div', {'class': 'ProductDetailsMainCard__price'}),
+    ('img', {'class': 'ProductImages__img'}),
+    ('div', {'class': 'ProductSellerInfo__sellerName'}),
+]
+RELIANCE_DIGITAL_FIELDS = [
+    ('h1', {'class': 'pdp__title'}),
+    ('div', {'class': 'pdp__description-content'}),
+    ('span', {'class': 'pdp__offerPrice'}),
+    ('img', {'class': 'pdp__img'}),
+]
+MYNTRA_FIELDS = [
+    ('h1', {}),
+    ('div', {'class': 'pdp-product-description-content'}),
+    ('span', {'class': 'pdp-price'}),
+    ('img', {'class': 'image-grid-image'}),
+]
+NYKAA_FIELDS = [
+    ('h1', {}),
+    ('div', {'class': 'css-1m3b9l'}),
+    ('span', {'class': 'css-1jczs19'}),
+    ('img', {'class': 'css-11gn9r6'}),
+]
+BRAND_FIELDS = [('h1', {}), ('div', {}), ('span', {}), ('img', {})]
+
+# Elements each Selenium scraper waits for: required ones must appear, optional
+# ones (absent on some pages) are waited for briefly
+if SELENIUM_AVAILABLE:
+    AMAZON_LOCATORS = [(By.ID, 'productTitle')]
+    AMAZON_OPTIONAL_LOCATORS = [(By.ID, 'feature-bullets'), (By.CLASS_NAME, 'a-price-whole'),
+                                (By.ID, 'landingImage'), (By.ID, 'bylineInfo')]
+    MYNTRA_LOCATORS = [(By.TAG_NAME, 'h1')]
+    MYNTRA_OPTIONAL_LOCATORS = [(By.CLASS_NAME, 'pdp-product-description-content'), (By.CLASS_NAME, 'pdp-price'),
+                                (By.CLASS_NAME, 'image-grid-image')]
+    NYKAA_LOCATORS = [(By.TAG_NAME, 'h1')]
+    NYKAA_OPTIONAL_LOCATORS = [(By.CLASS_NAME, 'css-1m3b9l'), (By.CLASS_NAME, 'css-1jczs19'),
+                               (By.CLASS_NAME, 'css-11gn9r6')]
+    BRAND_LOCATORS = [(By.TAG_NAME, 'h1')]
+    BRAND_OPTIONAL_LOCATORS = [(By.TAG_NAME, 'img')]
+
+
+def extract_product_details(url, validators=None):
     """
-    Determines the path to the ChromeDriver executable.
+    Extracts product details from a given URL.
+
+    The page is first scanned for structured data (JSON-LD Product blocks and
+    OpenGraph meta tags). Only if that lacks the title, price or image do the
+    per-retailer DOM and Selenium scrapers run, reusing the downloaded page,
+    and the structured fields fill in whatever they miss. Counters
+    `extract.<path>` and `extract.<domain>.<path>` record which path resolved
+    each page (`<domain>` is `other` for sites without a scraper of their own).
+
+    Args:
+        url (str): The URL of the product page.
+        validators (dict): `validators` of an earlier extraction of the page;
+                           the page is then requested conditionally.
+
+    Returns:
+        dict: A dictionary containing the extracted product details, including
+              title, description, price, images, seller, reviews, rating,
+              image count, description length, keyword flags, and any scraping error information.
+              `validators` holds the page's ETag and Last-Modified, if it sent any.
+
+    Raises:
+        NotModified: If `validators` were given and the page hasn't changed.
     """
+    domain = _metric_domain(urlparse(url).hostname or '')
+    dom_fields = _dom_fields(url)
+    scanner = StructuredDataScanner()
+    page = None
+    headers = dict(HEADERS, **conditional_headers(validators)) if validators else HEADERS
+    try:
+        page = fetch_html(url, headers=headers, timeout=10, required=dom_fields or (), scanner=scanner)
+    except NotModified:
+        raise
+    except Exception as e:
+        logging.warning(f'Page fetch failed for {url}: {e}')
+    structured = scanner.fields()
 
-def get_chromedriver_path():
-    base_dir = os.path.dirname(__file__)
-    # Windows: chromedriver.exe in project root or chromedriver_mac64
-    if sys.platform.startswith('win'):
-        exe_name = 'chromedriver.exe'
+    if scanner.done or (structured.get('title') and dom_fields is None):
+        # Complete structured data, or partial data on a site without a DOM scraper
+        product = product_from_structured(structured)
+        path = 'structured'
     else:
-        exe_name = 'chromedriver'
-    # Check project root
-    root_path = os.path.join(os.path.dirname(base_dir), exe_name)
-    if os.path.exists(root_path):
-        return root_path
-    # Check chromedriver_mac64 directory
-    mac_path = os.path.join(os.path.dirname(base_dir), 'chromedriver_mac64', exe_name)
-    if os.path.exists(mac_path):
-        return mac_path
-    # Fallback: just the name (if in PATH)
-    return exe_name
+        product = _extract_from_dom(url, page)
+        path = product.pop('extraction_path', 'dom' if dom_fields else 'fallback')
+        if not product.get('scraping_error') and fill_from_structured(product, structured):
+            path += '+structured'
+        elif product.get('scraping_error'):
+            path = 'failed'
+    if page is not None and page.validators:
+        product['validators'] = page.validators
+    metrics.incr(f'extract.{path}')
+    metrics.incr(f'extract.{domain}.{path}')
+    return product
+
+
+def _metric_domain(hostname):
+    """The retailer domain a hostname belongs to, or 'other'."""
+    return next((domain for domain in RETAILER_DOMAINS
+                 if hostname == domain or hostname.endswith('.' + domain)), 'other')
 
-def extract_product_details(url):
+
+def _dom_fields(url):
+    """The requests-based scraper's selectors for a URL, or None for sites without one."""
+    if 'amazon.in' in url:
+        return AMAZON_FIELDS
+    if 'flipkart.com' in url:
+        return FLIPKART_FIELDS
+    if 'snapdeal.com' in url:
+        return SNAPDEAL_FIELDS
+    if 'myntra.com' in url:
+        return MYNTRA_FIELDS
+    if 'nykaa.com' in url:
+        return NYKAA_FIELDS
+    if any(brand in url for brand in BRAND_DOMAINS):
+        return BRAND_FIELDS
+    return None
+
+
+def product_from_structured(fields):
+    """Builds the product dict from structured-data fields."""
+    desc = fields.get('description', '')
+    images = fields.get('images', [])
+    return {
+        'title': fields.get('title', ''),
+        'description': desc,
+        'price': fields.get('price', ''),
+        'images': images,
+        'seller': fields.get('seller') or fields.get('brand') or 'Unknown',
+        'num_reviews': fields.get('num_reviews') or 0,
+        'avg_rating': fields.get('avg_rating') or 0.0,
+        'image_count': len(images),
+        'desc_length': len(desc),
+        'keyword_flags': keywords.flags(desc),
+        'scraping_error': False
+    }
+
+
+def fill_from_structured(product, fields):
     """
-    Extracts product details from a given URL.
+    Fills fields the DOM scraper couldn't find from structured data.
+
+    Returns:
+        bool: Whether anything was filled in.
+    """
+    structured = product_from_structured(fields)
+    filled = False
+    for key in ['title', 'description', 'price', 'images', 'seller', 'num_reviews', 'avg_rating']:
+        if product.get(key) in ('', [], 0, 0.0, None, 'Unknown') and structured[key] not in ('', [], 0, 0.0, 'Unknown'):
+            product[key] = structured[key]
+            filled = True
+    if filled:
+        desc = product.get('description', '')
+        product['image_count'] = len(product['images'])
+        product['desc_length'] = len(desc)
+        product['keyword_flags'] = keywords.flags(desc)
+    return filled
+
+
+def _extract_from_dom(url, page=None):
+    """
+    Extracts product details with the per-retailer DOM (and Selenium) scrapers.
 
     Args:
         url (str): The URL of the product page.
+        page (FetchResult): The already-downloaded page, if any.
 
     Returns:
         dict: A dictionary containing the extracted product details, including
               title, description, price, images, seller, reviews, rating,
               image count, description length, keyword flags, and any scraping error information.
     """
-    headers = {
-        # Using a more generic User-Agent to appear more like a regular browser
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+    headers = HEADERS
     
     if 'amazon.in' in url:
         # Try Selenium first
         if SELENIUM_AVAILABLE:
+            driver = None
             try:
-                chrome_options = Options()
-                # chrome_options.add_argument('--headless')  # Commented for debugging
-                chrome_options.add_argument('--no-sandbox')
-                chrome_options.add_argument('--disable-dev-shm-usage')
-                chromedriver_path = get_chromedriver_path() # Get the path to chromedriver
-                service = Service(executable_path=chromedriver_path)
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-                time.sleep(2) # Add delay before initial GET
-                driver.get(url)
-                WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, 'productTitle')))
+                driver = new_driver()
+                driver.get(upstream_url(url))
+                # The lean profile returns at DOMContentLoaded; wait for the elements read below
+                wait_for_selectors(driver, AMAZON_LOCATORS, AMAZON_OPTIONAL_LOCATORS)
                 title = driver.find_element(By.ID, 'productTitle').text.strip()
                 try:
                     desc = driver.find_element(By.ID, 'feature-bullets').text.strip()
@@ -116,10 +288,7 @@ def extract_product_details(url):
                     avg_rating = 0.0
                 image_count = len(images)
                 desc_length = len(desc)
-                keywords = ['original', 'replica', '100% genuine']
-                # Ensure keyword matching is robust (case-insensitive)
-                # Check for presence of specified keywords in the description
-                keyword_flags = {k: (k in desc.lower()) for k in keywords}
+                keyword_flags = keywords.flags(desc)
                 driver.quit()
                 return {
                     'title': title,
@@ -132,10 +301,13 @@ def extract_product_details(url):
                     'image_count': image_count,
                     'desc_length': desc_length,
                     'keyword_flags': keyword_flags,
-                    'scraping_error': False
+                    'scraping_error': False,
+                    'extraction_path': 'selenium'
                 }
             except Exception as e:
                 logging.error(f'Selenium scraping failed: {e}')
+                if driver is not None:
+                    driver.quit()
                 return {
                     'title': '',
                     'description': '',
@@ -152,8 +324,8 @@ def extract_product_details(url):
                 }
         # Fallback to requests if Selenium fails or not available
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            time.sleep(1) # Add delay between requests
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=AMAZON_FIELDS)
+            transport.pause(1) # Add delay between requests
             soup = BeautifulSoup(resp.text, 'html.parser')
             if 'Robot Check' in resp.text or 'captcha' in resp.text.lower():
                 # Detect if Amazon is blocking scraping
@@ -205,8 +377,7 @@ def extract_product_details(url):
             avg_rating = float(rating.get_text(strip=True).split()[0]) if rating else 0.0
             image_count = len(images)
             desc_length = len(desc)
-            # Ensure keyword matching is robust (case-insensitive)
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
+            keyword_flags = keywords.flags(desc)
             return {
                 'title': title,
                 'description': desc,
@@ -240,8 +411,8 @@ def extract_product_details(url):
     # Flipkart scraping logic
     if 'flipkart.com' in url:
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            time.sleep(1) # Add delay between requests
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=FLIPKART_FIELDS)
+            transport.pause(1) # Add delay between requests
             soup = BeautifulSoup(resp.text, 'html.parser')
             # Extract title
             title = soup.find('span', {'class': 'B_NuCI'})
@@ -278,8 +449,7 @@ def extract_product_details(url):
             avg_rating = float(rating.get_text(strip=True)) if rating else 0.0
             image_count = len(images)
             desc_length = len(desc)
-            keywords = ['original', 'replica', '100% genuine']
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
+            keyword_flags = keywords.flags(desc)
             return {
                 'title': title,
                 'description': desc,
@@ -294,7 +464,7 @@ def extract_product_details(url):
                 'scraping_error': False
             }
         except Exception as e:
-            print(f'Flipkart scraping error: {e}')
+            logging.error(f'Flipkart scraping error: {e}')
             return {
                 'title': '',
                 'description': '',
@@ -312,8 +482,8 @@ def extract_product_details(url):
     if 'snapdeal.com' in url:
         # Snapdeal scraping logic
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            time.sleep(1) # Add delay between requests
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=SNAPDEAL_FIELDS)
+            transport.pause(1) # Add delay between requests
             soup = BeautifulSoup(resp.text, 'html.parser')
             title = soup.find('h1', {'class': 'pdp-e-i-head'})
             title = title.get_text(strip=True) if title else ''
@@ -335,8 +505,7 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = len(images)
             desc_length = len(desc)
-            keywords = ['original', 'replica', '100% genuine']
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
+            keyword_flags = keywords.flags(desc)
             return { # type: ignore
                 'title': title,
                 'description': desc,
@@ -352,7 +521,7 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = 0
             desc_length = 0
-            print(f'Snapdeal scraping error: {e}')
+            logging.error(f'Snapdeal scraping error: {e}')
             return {
                 'title': '',
                 'description': '',
@@ -365,7 +534,7 @@ def extract_product_details(url):
                 'scraping_error_message': f'Snapdeal scraping error: {e}'
             }
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=TATA_CLIQ_FIELDS)
             soup = BeautifulSoup(resp.text, 'html.parser')
             title = soup.find('h1', {'class': 'ProductDetailsMainCard__productName'})
             title = title.get_text(strip=True) if title else ''
@@ -387,8 +556,7 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = len(images)
             desc_length = len(desc)
-            keywords = ['original', 'replica', '100% genuine']
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
+            keyword_flags = keywords.flags(desc)
             return { # type: ignore
                 'title': title,
                 'description': desc,
@@ -404,7 +572,7 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = 0
             desc_length = 0
-            print(f'Tata Cliq scraping error: {e}')
+            logging.error(f'Tata Cliq scraping error: {e}')
             return {
                 'title': '',
                 'description': '',
@@ -417,7 +585,7 @@ def extract_product_details(url):
                 'scraping_error_message': f'Tata Cliq scraping error: {e}'
             }
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=RELIANCE_DIGITAL_FIELDS)
             soup = BeautifulSoup(resp.text, 'html.parser')
             title = soup.find('h1', {'class': 'pdp__title'})
             title = title.get_text(strip=True) if title else ''
@@ -436,8 +604,7 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = len(images)
             desc_length = len(desc)
-            keywords = ['original', 'replica', '100% genuine']
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
+            keyword_flags = keywords.flags(desc)
             return { # type: ignore
                 'title': title,
                 'description': desc,
@@ -453,7 +620,7 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = 0
             desc_length = 0
-            print(f'Reliance Digital scraping error: {e}')
+            logging.error(f'Reliance Digital scraping error: {e}')
             return {
                 'title': '',
                 'description': '',
@@ -467,16 +634,12 @@ def extract_product_details(url):
             }
     if 'myntra.com' in url:
         if SELENIUM_AVAILABLE:
+            driver = None
             try:
-                chrome_options = Options()
-                # chrome_options.add_argument('--headless')
-                chrome_options.add_argument('--no-sandbox')
-                chrome_options.add_argument('--disable-dev-shm-usage')
-                chromedriver_path = get_chromedriver_path()
-                service = Service(executable_path=chromedriver_path)
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-                time.sleep(2) # Add delay before initial GET
-                driver.get(url)
+                driver = new_driver()
+                driver.get(upstream_url(url))
+                # The lean profile returns at DOMContentLoaded; wait for the elements read below
+                wait_for_selectors(driver, MYNTRA_LOCATORS, MYNTRA_OPTIONAL_LOCATORS)
                 title = driver.find_element(By.TAG_NAME, 'h1').text.strip()
                 # Extract description using Selenium
                 try:
@@ -500,12 +663,9 @@ def extract_product_details(url):
                 avg_rating = 0.0
                 image_count = len(images)
                 desc_length = len(desc)
-                keywords = ['original', 'replica', '100% genuine']
-                # Ensure keyword matching is robust (case-insensitive)
-                # Check for presence of specified keywords in the description
-                keyword_flags = {k: (k in desc.lower()) for k in keywords}
+                keyword_flags = keywords.flags(desc)
                 driver.quit()
-                print('DEBUG MYNTRA SELENIUM:', {'title': title, 'desc': desc, 'price': price, 'images': images, 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
+                logging.debug('Myntra selenium extraction', extra={'title': title, 'price': price, 'num_images': len(images), 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
                 return {
                     'title': title,
                     'description': desc,
@@ -517,14 +677,17 @@ def extract_product_details(url):
                     'image_count': image_count,
                     'desc_length': desc_length,
                     'keyword_flags': keyword_flags,
-                    'scraping_error': False
+                    'scraping_error': False,
+                    'extraction_path': 'selenium'
                 }
             except Exception as e:
                 logging.error(f'Myntra Selenium scraping error: {e}')
+                if driver is not None:
+                    driver.quit()
         # Fallback to requests if Selenium fails or not available
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            time.sleep(1) # Add delay between requests
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=MYNTRA_FIELDS)
+            transport.pause(1) # Add delay between requests
             soup = BeautifulSoup(resp.text, 'html.parser')
             # Extract title using BeautifulSoup
             title = soup.find('h1')
@@ -545,11 +708,9 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = len(images)
             desc_length = len(desc)
-            keywords = ['original', 'replica', '100% genuine']
-            # Ensure keyword matching is robust (case-insensitive)
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
+            keyword_flags = keywords.flags(desc)
             # Debug print for requests fallback
-            print('DEBUG MYNTRA REQUESTS:', {'title': title, 'desc': desc, 'price': price, 'images': images, 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
+            logging.debug('Myntra requests extraction', extra={'title': title, 'price': price, 'num_images': len(images), 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
             return {
                 'title': title,
                 'description': desc,
@@ -570,16 +731,12 @@ def extract_product_details(url):
     # Nykaa Selenium + fallback
     if 'nykaa.com' in url:
         if SELENIUM_AVAILABLE:
+            driver = None
             try:
-                chrome_options = Options()
-                # chrome_options.add_argument('--headless')
-                chrome_options.add_argument('--no-sandbox')
-                chrome_options.add_argument('--disable-dev-shm-usage')
-                chromedriver_path = get_chromedriver_path()
-                service = Service(executable_path=chromedriver_path)
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-                time.sleep(2) # Add delay before initial GET
-                driver.get(url)
+                driver = new_driver()
+                driver.get(upstream_url(url))
+                # The lean profile returns at DOMContentLoaded; wait for the elements read below
+                wait_for_selectors(driver, NYKAA_LOCATORS, NYKAA_OPTIONAL_LOCATORS)
                 title = driver.find_element(By.TAG_NAME, 'h1').text.strip()
                 # Extract description using Selenium
                 try:
@@ -603,12 +760,9 @@ def extract_product_details(url):
                 avg_rating = 0.0
                 image_count = len(images)
                 desc_length = len(desc)
-                keywords = ['original', 'replica', '100% genuine']
-                # Ensure keyword matching is robust (case-insensitive)
-                # Check for presence of specified keywords in the description
-                keyword_flags = {k: (k in desc.lower()) for k in keywords}
+                keyword_flags = keywords.flags(desc)
                 driver.quit()
-                print('DEBUG NYKAA SELENIUM:', {'title': title, 'desc': desc, 'price': price, 'images': images, 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
+                logging.debug('Nykaa selenium extraction', extra={'title': title, 'price': price, 'num_images': len(images), 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
                 return {
                     'title': title,
                     'description': desc,
@@ -620,14 +774,17 @@ def extract_product_details(url):
                     'image_count': image_count,
                     'desc_length': desc_length,
                     'keyword_flags': keyword_flags,
-                    'scraping_error': False
+                    'scraping_error': False,
+                    'extraction_path': 'selenium'
                 }
             except Exception as e:
                 logging.error(f'Nykaa Selenium scraping error: {e}')
+                if driver is not None:
+                    driver.quit()
         # Fallback to requests if Selenium fails or not available
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            time.sleep(1) # Add delay between requests
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=NYKAA_FIELDS)
+            transport.pause(1) # Add delay between requests
             soup = BeautifulSoup(resp.text, 'html.parser')
             # Extract title using BeautifulSoup
             title = soup.find('h1')
@@ -648,11 +805,9 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = len(images)
             desc_length = len(desc)
-            keywords = ['original', 'replica', '100% genuine']
-            # Ensure keyword matching is robust (case-insensitive)
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
+            keyword_flags = keywords.flags(desc)
             # Debug print for requests fallback
-            print('DEBUG NYKAA REQUESTS:', {'title': title, 'desc': desc, 'price': price, 'images': images, 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
+            logging.debug('Nykaa requests extraction', extra={'title': title, 'price': price, 'num_images': len(images), 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
             return {
                 'title': title,
                 'description': desc,
@@ -671,18 +826,14 @@ def extract_product_details(url):
             logging.error(f'Nykaa scraping error: {e}')
             return {'title': '', 'description': '', 'price': '', 'images': [], 'seller': 'Nykaa', 'num_reviews': 0, 'avg_rating': 0.0, 'image_count': 0, 'desc_length': 0, 'keyword_flags': {}, 'scraping_error': True, 'scraping_error_message': f'Nykaa scraping error: {e}'}
     # Adidas, Nike, Puma, Reebok, Ajio Selenium + fallback
-    if 'adidas.co.in' in url or 'nike.com' in url or 'puma.com' in url or 'reebok.in' in url or 'ajio.com' in url:
+    if any(brand in url for brand in BRAND_DOMAINS):
         if SELENIUM_AVAILABLE:
+            driver = None
             try:
-                chrome_options = Options()
-                # chrome_options.add_argument('--headless')
-                chrome_options.add_argument('--no-sandbox')
-                chrome_options.add_argument('--disable-dev-shm-usage')
-                chromedriver_path = get_chromedriver_path()
-                service = Service(executable_path=chromedriver_path)
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-                time.sleep(2) # Add delay before initial GET
-                driver.get(url)
+                driver = new_driver()
+                driver.get(upstream_url(url))
+                # The lean profile returns at DOMContentLoaded; wait for the elements read below
+                wait_for_selectors(driver, BRAND_LOCATORS, BRAND_OPTIONAL_LOCATORS)
                 title = driver.find_element(By.TAG_NAME, 'h1').text.strip()
                 # Extract description using Selenium
                 try:
@@ -706,12 +857,9 @@ def extract_product_details(url):
                 avg_rating = 0.0
                 image_count = len(images)
                 desc_length = len(desc)
-                keywords = ['original', 'replica', '100% genuine']
-                # Ensure keyword matching is robust (case-insensitive)
-                # Check for presence of specified keywords in the description
-                keyword_flags = {k: (k in desc.lower()) for k in keywords}
+                keyword_flags = keywords.flags(desc)
                 driver.quit()
-                print('DEBUG BRAND SELENIUM:', {'title': title, 'desc': desc, 'price': price, 'images': images, 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
+                logging.debug('Brand selenium extraction', extra={'title': title, 'price': price, 'num_images': len(images), 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
                 return {
                     'title': title,
                     'description': desc,
@@ -723,14 +871,17 @@ def extract_product_details(url):
                     'image_count': image_count,
                     'desc_length': desc_length,
                     'keyword_flags': keyword_flags,
-                    'scraping_error': False
+                    'scraping_error': False,
+                    'extraction_path': 'selenium'
                 }
             except Exception as e:
                 logging.error(f'Brand Selenium scraping error: {e}')
+                if driver is not None:
+                    driver.quit()
         # Fallback to requests if Selenium fails or not available
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            time.sleep(1) # Add delay between requests
+            resp = page or fetch_html(url, headers=headers, timeout=10, required=BRAND_FIELDS)
+            transport.pause(1) # Add delay between requests
             soup = BeautifulSoup(resp.text, 'html.parser')
             # Extract title using BeautifulSoup
             title = soup.find('h1')
@@ -750,11 +901,9 @@ def extract_product_details(url):
             avg_rating = 0.0
             image_count = len(images)
             desc_length = len(desc)
-            keywords = ['original', 'replica', '100% genuine']
 
-            # Ensure keyword matching is robust (case-insensitive)
-            keyword_flags = {k: (k in desc.lower()) for k in keywords}
-            print('DEBUG BRAND REQUESTS:', {'title': title, 'desc': desc, 'price': price, 'images': images, 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
+            keyword_flags = keywords.flags(desc)
+            logging.debug('Brand requests extraction', extra={'title': title, 'price': price, 'num_images': len(images), 'num_reviews': num_reviews, 'avg_rating': avg_rating, 'desc_length': desc_length})
             return {
                 'title': title,
                 'description': desc,
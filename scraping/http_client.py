@@ -0,0 +1,204 @@
+"""
+Streaming HTML fetch for the scrapers.
+
+`fetch_html` downloads a page in chunks, up to a byte cap, and feeds every
+chunk to an incremental parser that watches for the elements the scraper is
+going to read. As soon as the first match of each watched element has been
+closed the download is abandoned, so inline scripts and below-the-fold markup
+are never transferred and BeautifulSoup only parses the start of the page
+(a `scanner`, such as the structured-data scanner, can end the download too):
+
+    page = fetch_html(url, headers=headers, required=[(None, {'id': 'productTitle'})])
+    soup = BeautifulSoup(page.text, 'html.parser')
+
+Selectors are (tag, attrs) pairs, as passed to BeautifulSoup's `find`. Because
+`find` returns the first match, the truncated page yields the same result as
+the full one for every watched selector.
+
+Requests go through `scraping.transport`, so pages can be recorded and
+replayed, and redirected to a local server with UPSTREAM_OVERRIDE.
+"""
+import codecs
+import logging
+import re
+import time
+from html.parser import HTMLParser
+
+import metrics
+from config import Config
+from scraping import transport
+from scraping.transport import upstream_url
+
+logger = logging.getLogger(__name__)
+
+# Elements without an end tag
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+class NotModified(Exception):
+    """A conditional request was answered with 304 Not Modified."""
+
+
+def conditional_headers(validators):
+    """If-None-Match / If-Modified-Since headers for the validators of an earlier response."""
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+class FetchResult:
+    """A downloaded page, possibly cut short. Has the `text`/`status_code`/`url` of a requests.Response."""
+
+    def __init__(self, url, status_code, text, bytes_read, complete, truncated, validators=None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        # Decoded body bytes read (after content decoding)
+        self.bytes_read = bytes_read
+        # False if the download stopped early or hit the byte cap
+        self.complete = complete
+        self.truncated = truncated
+        # The response's ETag and Last-Modified, for conditional re-fetches
+        self.validators = validators or {}
+
+
+def _matches(selector, tag, attrs):
+    name, wanted = selector
+    if name and name != tag:
+        return False
+    for key, value in wanted.items():
+        actual = attrs.get(key)
+        if actual is None:
+            return False
+        # Like BeautifulSoup, a single class matches any of the element's classes
+        if key == 'class' and ' ' not in value:
+            if value not in actual.split():
+                return False
+        elif actual != value:
+            return False
+    return True
+
+
+class ElementWatcher(HTMLParser):
+    """Incremental parser that tells when the first match of every selector has been closed."""
+
+    def __init__(self, selectors):
+        super().__init__(convert_charrefs=False)
+        self.pending = list(selectors)
+        # [tag, nesting depth] of matched elements that are still open
+        self.open = []
+
+    @property
+    def done(self):
+        return not self.pending and not self.open
+
+    def handle_starttag(self, tag, attrs):
+        for entry in self.open:
+            if entry[0] == tag:
+                entry[1] += 1
+        attrs = dict(attrs)
+        for selector in list(self.pending):
+            if _matches(selector, tag, attrs):
+                self.pending.remove(selector)
+                if tag not in VOID_ELEMENTS:
+                    self.open.append([tag, 1])
+
+    def handle_endtag(self, tag):
+        for entry in list(self.open):
+            if entry[0] == tag:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self.open.remove(entry)
+
+
+def _encoding(resp, head):
+    """Charset from the Content-Type header, else from a <meta> tag, else UTF-8."""
+    if 'charset' in resp.headers.get('content-type', '').lower() and resp.encoding:
+        return resp.encoding
+    match = _META_CHARSET.search(head)
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+def fetch_html(url, headers=None, timeout=10, required=(), max_bytes=None, scanner=None):
+    """
+    Downloads an HTML page, stopping once the required elements are complete.
+
+    Args:
+        url (str): Page URL.
+        headers (dict): Request headers.
+        timeout (float): Connect/read timeout in seconds, as for requests.get.
+        required (iterable): (tag, attrs) selectors of the elements the caller
+                             will read. Without selectors the page is read up
+                             to the byte cap.
+        max_bytes (int): Byte cap, defaults to Config.FETCH_MAX_BYTES.
+        scanner: Another incremental parser fed with the page (an HTMLParser
+                 with a `done` property, e.g. StructuredDataScanner); the
+                 download also stops once it is done.
+
+    Returns:
+        FetchResult: The page text read so far.
+
+    Raises:
+        requests.RequestException: If the request fails.
+        NotModified: If `headers` made the request conditional (see
+                     conditional_headers) and the page hasn't changed.
+    """
+    if max_bytes is None:
+        max_bytes = Config.FETCH_MAX_BYTES
+    start = time.perf_counter()
+    watcher = ElementWatcher(required) if required else None
+    parts = []
+    bytes_read = 0
+    complete = True
+    truncated = False
+    decoder = None
+    target = upstream_url(url)
+    with transport.get(url, headers=headers, timeout=timeout, stream=True) as resp:
+        if resp.status_code == 304:
+            metrics.incr('fetch.not_modified')
+            raise NotModified(url)
+        validators = {key: resp.headers[header] for key, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified'))
+                      if resp.headers.get(header)}
+        for chunk in resp.iter_content(chunk_size=Config.FETCH_CHUNK_SIZE):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(_encoding(resp, chunk))(errors='replace')
+            if bytes_read + len(chunk) > max_bytes:
+                chunk = chunk[:max_bytes - bytes_read]
+                truncated = True
+            bytes_read += len(chunk)
+            text = decoder.decode(chunk)
+            parts.append(text)
+            stop = False
+            for parser in (watcher, scanner):
+                if parser is not None:
+                    parser.feed(text)
+                    stop = stop or parser.done
+            if stop:
+                complete = False
+                metrics.incr('fetch.stopped_early')
+                break
+            if truncated:
+                complete = False
+                metrics.incr('fetch.truncated')
+                logger.warning(f'Stopped reading {url} at the {max_bytes} byte cap')
+                break
+        # Leaving the block closes the connection, abandoning the rest of the body
+        # Report the retailer URL, not the override's
+        status_code, final_url = resp.status_code, resp.url if target == url else url
+    if decoder is not None and complete:
+        parts.append(decoder.decode(b'', final=True))
+
+    metrics.incr('fetch.requests')
+    metrics.incr('fetch.bytes', bytes_read)
+    metrics.observe('fetch', time.perf_counter() - start)
+    return FetchResult(final_url, status_code, ''.join(parts), bytes_read, complete, truncated, validators)
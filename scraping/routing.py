@@ -0,0 +1,301 @@
+"""
+Routes trusted-source searches to the retailers likely to carry the product.
+
+A query is put in product categories by the lexicons in CATEGORY_LEXICON_DIR
+(data/categories/, matched like the keyword lexicons, see analysis/keywords.py):
+
+    router.categories('Nike Air Zoom Pegasus 39 Running Shoes')   # {'footwear': 1.0}
+
+Each category has, per source, a hit rate: the share of searches where the
+source returned a listing matching the query. The hit rate starts from the
+priors below and is updated from every search. The counts are shared by all
+processes through SQLite (ROUTING_DB), synced every ROUTING_SYNC_INTERVAL
+seconds. A query in several categories is scored with the rates mixed by its
+share of matches in each.
+
+Sources are queried in order of hit rate until the chance that at least one
+of them matches reaches ROUTING_TARGET, and at least ROUTING_MIN_SOURCES are
+queried. A footwear query goes to Tata Cliq, Amazon and Flipkart, not Reliance
+Digital. A query matching no category, or matching several so that no few
+sources are likely enough, queries more or all. If the routed sources find no
+match, the search widens to the rest (see search_trusted_sources).
+
+A ROUTING_EXPLORE share of searches query every source. This keeps the hit
+rates of sources that routing leaves out up to date. It also measures what
+routing costs: whether the routed search (widened if it found nothing) would
+have picked the same match as searching everything.
+
+    python -m scraping.routing 'Philips Air Fryer HD9252'   # categories and route
+    python -m scraping.routing --table                      # learned hit rates
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import metrics
+from analysis.keywords import KeywordMatcher
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Hit rates assumed before anything is learned. Reliance Digital only sells
+# electronics and appliances; Tata Cliq is strongest in fashion.
+PRIOR_HIT_RATES = {
+    'electronics': {'Amazon India': 0.8, 'Flipkart': 0.7, 'Reliance Digital': 0.6, 'Tata Cliq': 0.3, 'Snapdeal': 0.2},
+    'appliances': {'Amazon India': 0.7, 'Reliance Digital': 0.7, 'Flipkart': 0.6, 'Tata Cliq': 0.3, 'Snapdeal': 0.2},
+    'fashion': {'Amazon India': 0.6, 'Tata Cliq': 0.6, 'Flipkart': 0.6, 'Snapdeal': 0.4, 'Reliance Digital': 0.02},
+    'footwear': {'Tata Cliq': 0.6, 'Amazon India': 0.6, 'Flipkart': 0.5, 'Snapdeal': 0.4, 'Reliance Digital': 0.02},
+    'accessories': {'Amazon India': 0.6, 'Tata Cliq': 0.6, 'Flipkart': 0.5, 'Snapdeal': 0.4, 'Reliance Digital': 0.05},
+    'beauty': {'Amazon India': 0.7, 'Flipkart': 0.5, 'Tata Cliq': 0.4, 'Snapdeal': 0.3, 'Reliance Digital': 0.02},
+    'home': {'Amazon India': 0.6, 'Flipkart': 0.5, 'Snapdeal': 0.4, 'Tata Cliq': 0.3, 'Reliance Digital': 0.1},
+}
+# Prior of a source or category missing above
+DEFAULT_PRIOR = 0.3
+# The prior counts as this many searches
+PRIOR_WEIGHT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_hits (
+    category TEXT NOT NULL,
+    source TEXT NOT NULL,
+    searches INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (category, source)
+);
+"""
+
+
+class Route:
+    """The sources to query for a search, and the ones held back."""
+
+    def __init__(self, query, categories, sources, rest, coverage, explore=False):
+        self.query = query
+        self.categories = categories
+        self.sources = sources
+        self.rest = rest
+        self.coverage = coverage
+        self.explore = explore
+
+    def as_dict(self):
+        return {'query': self.query, 'categories': self.categories, 'sources': self.sources, 'rest': self.rest,
+                'coverage': None if self.coverage is None else round(self.coverage, 3),
+                'explore': self.explore}
+
+
+class SourceRouter:
+    """Picks the trusted sources to query for a product, learning which ones match per category."""
+
+    def __init__(self, sources, classifier=None, db_path=None, target=None, min_sources=None, explore=None,
+                 sync_interval=None, rng=None):
+        """
+        Args:
+            sources (list): Names of all sources, in their default order.
+            classifier (KeywordMatcher): Category lexicons, defaults to those in Config.CATEGORY_LEXICON_DIR.
+            db_path (str): SQLite file shared by processes, defaults to Config.ROUTING_DB ('' keeps counts in memory).
+            target (float): Chance of a match to reach, defaults to Config.ROUTING_TARGET.
+            min_sources (int): Fewest sources to query, defaults to Config.ROUTING_MIN_SOURCES.
+            explore (float): Share of searches that query every source, defaults to Config.ROUTING_EXPLORE.
+            sync_interval (float): Seconds between syncs with the database, defaults to Config.ROUTING_SYNC_INTERVAL.
+            rng (random.Random): Picks the explored searches.
+        """
+        self.sources = list(sources)
+        self.classifier = classifier or KeywordMatcher.from_dir(Config.CATEGORY_LEXICON_DIR)
+        self.db_path = Config.ROUTING_DB if db_path is None else db_path
+        self.target = Config.ROUTING_TARGET if target is None else target
+        self.min_sources = min_sources or Config.ROUTING_MIN_SOURCES
+        self.explore = Config.ROUTING_EXPLORE if explore is None else explore
+        self.sync_interval = Config.ROUTING_SYNC_INTERVAL if sync_interval is None else sync_interval
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        # (category, source) -> [searches, hits]: as of the last sync, and recorded since
+        self._counts = {}
+        self._pending = {}
+        self._synced_at = None
+
+    def categories(self, query):
+        """
+        The categories of a query.
+
+        Returns:
+            dict: Category -> share of the query's lexicon matches (empty if none matched).
+        """
+        counts = {category: n for category, n in self.classifier.counts(query).items() if n}
+        total = sum(counts.values())
+        return {category: n / total for category, n in counts.items()}
+
+    def hit_rate(self, category, source):
+        """Learned share of searches in a category where the source returned a match."""
+        prior = PRIOR_HIT_RATES.get(category, {}).get(source, DEFAULT_PRIOR)
+        key = (category, source)
+        with self._lock:
+            searches, hits = self._counts.get(key, (0, 0))
+            pending = self._pending.get(key, (0, 0))
+        return (hits + pending[1] + prior * PRIOR_WEIGHT) / (searches + pending[0] + PRIOR_WEIGHT)
+
+    def route(self, query):
+        """
+        The sources to query first for a product query.
+
+        Returns:
+            Route: `sources` to query, `rest` to widen to, and `coverage`, the
+                   estimated chance that one of `sources` matches (None for a
+                   query in no category, which queries everything).
+        """
+        self._maybe_sync()
+        categories = self.categories(query)
+        explore = self._rng.random() < self.explore
+        if not categories:
+            return Route(query, categories, list(self.sources), [], None, explore)
+        rates = {source: sum(share * self.hit_rate(category, source) for category, share in categories.items())
+                 for source in self.sources}
+        ordered = sorted(self.sources, key=lambda source: -rates[source])
+        miss = 1.0
+        for n, source in enumerate(ordered, 1):
+            miss *= 1 - rates[source]
+            if n >= self.min_sources and 1 - miss >= self.target:
+                break
+        return Route(query, categories, ordered[:n], ordered[n:], 1 - miss, explore)
+
+    def record(self, route, scores, queried, widened=False, match_threshold=0.4):
+        """
+        Learns from a search and counts the requests it made.
+
+        Args:
+            route (Route): The search's route.
+            scores (dict): Source -> best fuzzy score of its listings (None if the request failed).
+            queried (int): Sources queried.
+            widened (bool): Whether the search widened to `route.rest`.
+            match_threshold (float): Score of a match.
+        """
+        metrics.incr('routing.searches')
+        metrics.incr('routing.requests', queried)
+        metrics.incr('routing.requests_saved', len(self.sources) - queried)
+        if widened:
+            metrics.incr('routing.widened')
+        if not route.categories:
+            metrics.incr('routing.unclassified')
+            return
+        with self._lock:
+            for source, score in scores.items():
+                if score is None:
+                    continue  # a failed request says nothing about the category
+                for category, share in route.categories.items():
+                    if share < 0.5 and len(route.categories) > 1:
+                        continue  # only learn from the query's main category
+                    counts = self._pending.setdefault((category, source), [0, 0])
+                    counts[0] += 1
+                    counts[1] += int(score >= match_threshold)
+
+    def record_exploration(self, full_match, routed_match):
+        """
+        Compares, for an explored search, the match found by all sources with
+        the one the route would have found.
+
+        Args:
+            full_match (tuple): (product, score) over all sources.
+            routed_match (tuple): (product, score) of the route's policy: its
+                                  sources, or all of them if those found nothing.
+        """
+        metrics.incr('routing.explored')
+        same = (full_match[0] or {}).get('url') == (routed_match[0] or {}).get('url') \
+            and (full_match[0] or {}).get('title') == (routed_match[0] or {}).get('title')
+        metrics.incr('routing.explored.same_match' if same else 'routing.explored.different_match')
+        metrics.incr('routing.explored.score_loss', max(0.0, full_match[1] - routed_match[1]))
+
+    def table(self):
+        """Category -> source -> learned hit rate and searches behind it."""
+        categories = sorted(set(PRIOR_HIT_RATES) | set(self.classifier.categories))
+        with self._lock:
+            searches = {key: value[0] + self._pending.get(key, (0, 0))[0] for key, value in self._counts.items()}
+            for key, value in self._pending.items():
+                searches.setdefault(key, value[0])
+        return {category: {source: {'hit_rate': round(self.hit_rate(category, source), 3),
+                                    'searches': searches.get((category, source), 0)}
+                           for source in self.sources}
+                for category in categories}
+
+    def stats(self):
+        """Requests made and saved, widening, and the match quality measured on explored searches (this process)."""
+        searches = metrics.counter('routing.searches')
+        analyses = metrics.counter('analysis.count')
+        explored = metrics.counter('routing.explored')
+        saved = metrics.counter('routing.requests_saved')
+        return {
+            'searches': searches,
+            'requests_per_search': round(metrics.counter('routing.requests') / searches, 2) if searches else None,
+            'requests_saved_per_search': round(saved / searches, 2) if searches else None,
+            'requests_saved_per_analysis': round(saved / analyses, 2) if analyses else None,
+            'widened': round(metrics.counter('routing.widened') / searches, 3) if searches else None,
+            'unclassified': round(metrics.counter('routing.unclassified') / searches, 3) if searches else None,
+            'explored': explored,
+            'explored_same_match': round(metrics.counter('routing.explored.same_match') / explored, 3)
+            if explored else None,
+            'explored_mean_score_loss': round(metrics.counter('routing.explored.score_loss') / explored, 4)
+            if explored else None,
+        }
+
+    def _maybe_sync(self):
+        if not self.db_path:
+            return
+        if self._synced_at is not None and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        # One thread syncs; the others carry on with the counts they have
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self.sync()
+        finally:
+            self._sync_lock.release()
+
+    def sync(self):
+        """Adds the counts recorded since the last sync to the database, and reads everyone's."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        try:
+            db = sqlite3.connect(self.db_path, timeout=10)
+            try:
+                with db:
+                    db.executescript(SCHEMA)
+                    db.executemany('INSERT INTO source_hits (category, source, searches, hits) VALUES (?, ?, ?, ?) '
+                                   'ON CONFLICT (category, source) DO UPDATE '
+                                   'SET searches = searches + excluded.searches, hits = hits + excluded.hits',
+                                   [(*key, *value) for key, value in pending.items()])
+                    rows = db.execute('SELECT category, source, searches, hits FROM source_hits').fetchall()
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            logger.warning(f'Routing table sync with {self.db_path} failed: {e}')
+            with self._lock:
+                for key, value in pending.items():
+                    counts = self._pending.setdefault(key, [0, 0])
+                    counts[0] += value[0]
+                    counts[1] += value[1]
+        else:
+            with self._lock:
+                self._counts = {(category, source): (searches, hits) for category, source, searches, hits in rows}
+        self._synced_at = time.monotonic()
+
+
+def main():
+    from scraping.trusted_sources import router
+
+    parser = argparse.ArgumentParser(description='Show how trusted-source searches are routed.')
+    parser.add_argument('queries', nargs='*')
+    parser.add_argument('--table', action='store_true', help='print the learned hit rates')
+    args = parser.parse_args()
+    if router.db_path and os.path.exists(router.db_path):
+        router.sync()
+    for query in args.queries:
+        print(json.dumps(router.route(query).as_dict(), ensure_ascii=False))
+    if args.table:
+        print(json.dumps(router.table(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
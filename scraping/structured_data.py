@@ -0,0 +1,226 @@
+"""
+Product details from structured data embedded in the page.
+
+Most retailer and brand pages describe the product in an
+`<script type="application/ld+json">` block (schema.org Product with offers,
+brand and aggregateRating) and/or OpenGraph `og:` / `product:` meta tags.
+`StructuredDataScanner` is an incremental parser that only looks at those two
+things, so it can run on a page while it is being downloaded (see
+`scraping.http_client.fetch_html`) and reports `done` as soon as the title,
+price and image are known.
+
+    scanner = StructuredDataScanner()
+    scanner.feed(html)
+    scanner.fields()  # {'title': ..., 'price': '24990', 'images': [...], ...}
+"""
+import json
+import logging
+import re
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+# Fields that make the structured data enough on its own
+REQUIRED_FIELDS = ['title', 'price', 'images']
+
+# Meta tags read, by property/name
+META_FIELDS = {
+    'og:title': 'title',
+    'og:description': 'description',
+    'description': 'description',
+    'og:image': 'images',
+    'og:image:secure_url': 'images',
+    'product:price:amount': 'price',
+    'og:price:amount': 'price',
+    'product:price:currency': 'currency',
+    'og:price:currency': 'currency',
+    'product:brand': 'brand',
+    'og:brand': 'brand',
+}
+
+
+def _types(node):
+    types = node.get('@type')
+    if isinstance(types, str):
+        return {types}
+    return {t for t in types if isinstance(t, str)} if isinstance(types, list) else set()
+
+
+def _find_products(node):
+    """Yields schema.org Product objects anywhere in a JSON-LD document."""
+    if isinstance(node, list):
+        for item in node:
+            yield from _find_products(item)
+    elif isinstance(node, dict):
+        if _types(node) & {'Product', 'ProductGroup', 'IndividualProduct'}:
+            yield node
+        for key in ('@graph', 'mainEntity', 'itemListElement', 'item'):
+            if key in node:
+                yield from _find_products(node[key])
+
+
+def _name(value):
+    if isinstance(value, dict):
+        return _name(value.get('name'))
+    if isinstance(value, list):
+        return _name(value[0]) if value else ''
+    return str(value) if value else ''
+
+
+def _images(value):
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        url = value.get('url') or value.get('contentUrl')
+        return [url] if isinstance(url, str) and url else []
+    if isinstance(value, list):
+        return [url for item in value for url in _images(item)]
+    return []
+
+
+def _price(value):
+    """
+    Normalises a price to the scrapers' format: digits and an optional decimal part.
+
+    Reads the first number in the value, with either separator as the decimal
+    point: 'Rs. 2,499', '1,24,999.00' (Indian grouping) and '1.299,00' all
+    work. A lone separator is a decimal point if one or two digits follow it.
+    """
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        match = re.search(r'\d[\d.,]*', str(value or ''))
+        if not match:
+            return ''
+        number = match.group().rstrip('.,')
+        if ',' in number and '.' in number:
+            # The last separator is the decimal point
+            thousands = ',' if number.rfind('.') > number.rfind(',') else '.'
+            number = number.replace(thousands, '').replace(',', '.')
+        elif ',' in number:
+            whole, _, fraction = number.rpartition(',')
+            decimal = number.count(',') == 1 and len(fraction) <= 2
+            number = f'{whole}.{fraction}' if decimal else number.replace(',', '')
+        elif number.count('.') > 1:
+            number = number.replace('.', '')
+        value = float(number)
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+def _number(value, cast):
+    try:
+        return cast(float(str(value).replace(',', '')))
+    except (TypeError, ValueError):
+        return None
+
+
+def product_fields(product):
+    """Maps a schema.org Product object to the scraper's field names."""
+    fields = {
+        'title': _name(product.get('name')).strip(),
+        'description': _name(product.get('description')).strip(),
+        'images': _images(product.get('image')),
+        'brand': _name(product.get('brand')).strip(),
+    }
+    offers = product.get('offers') or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    if isinstance(offers, dict):
+        specification = offers.get('priceSpecification')
+        if isinstance(specification, list):
+            specification = specification[0] if specification else None
+        fields['price'] = _price(offers.get('price') or offers.get('lowPrice')
+                                 or (specification.get('price') if isinstance(specification, dict) else None))
+        fields['currency'] = _name(offers.get('priceCurrency')).strip()
+        fields['seller'] = _name(offers.get('seller')).strip()
+    rating = product.get('aggregateRating') or {}
+    if isinstance(rating, dict):
+        fields['avg_rating'] = _number(rating.get('ratingValue'), float)
+        fields['num_reviews'] = _number(rating.get('reviewCount') or rating.get('ratingCount'), int)
+    return {key: value for key, value in fields.items() if value not in ('', [], None)}
+
+
+class StructuredDataScanner(HTMLParser):
+    """Incremental parser collecting JSON-LD Product blocks and OpenGraph/product meta tags."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.products = []
+        self.meta = {}
+        self._json_ld = None
+        self._fields = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'script':
+            if (dict(attrs).get('type') or '').strip().lower() == 'application/ld+json':
+                self._json_ld = []
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            key = (attrs.get('property') or attrs.get('name') or '').strip().lower()
+            content = (attrs.get('content') or '').strip()
+            if key in META_FIELDS and content and key not in self.meta:
+                self.meta[key] = content
+                self._fields = None
+
+    def handle_data(self, data):
+        if self._json_ld is not None:
+            self._json_ld.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self._json_ld is not None:
+            text = ''.join(self._json_ld).strip()
+            self._json_ld = None
+            try:
+                # strict=False allows raw newlines/tabs inside strings, which pages often contain
+                products = list(_find_products(json.loads(text, strict=False)))
+            except (ValueError, TypeError, AttributeError, RecursionError) as e:
+                logger.debug(f'Skipping unparseable JSON-LD block: {e}')
+                return
+            self.products.extend(products)
+            self._fields = None
+
+    def fields(self):
+        """
+        Returns the product fields found so far.
+
+        JSON-LD values take precedence; meta tags fill in what it lacks.
+        """
+        if self._fields is None:
+            fields = {}
+            for product in self.products:
+                try:
+                    product_data = product_fields(product)
+                except Exception as e:
+                    # Malformed structured data counts as none
+                    logger.debug(f'Skipping malformed JSON-LD product: {e}')
+                    continue
+                for key, value in product_data.items():
+                    fields.setdefault(key, value)
+            for key, content in self.meta.items():
+                name = META_FIELDS[key]
+                value = _price(content) if name == 'price' else [content] if name == 'images' else content
+                if value:
+                    fields.setdefault(name, value)
+            self._fields = fields
+        return self._fields
+
+    @property
+    def done(self):
+        """Whether all REQUIRED_FIELDS are known."""
+        fields = self.fields()
+        return all(fields.get(name) for name in REQUIRED_FIELDS)
+
+
+def extract_structured(html):
+    """
+    Scans a whole page for structured product data.
+
+    Args:
+        html (str): Page HTML.
+
+    Returns:
+        dict: Fields found (title, description, price, currency, images,
+              brand, seller, avg_rating, num_reviews); missing ones are absent.
+    """
+    scanner = StructuredDataScanner()
+    scanner.feed(html)
+    scanner.close()
+    return scanner.fields()
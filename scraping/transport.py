@@ -0,0 +1,313 @@
+"""
+Outbound HTTP for the scrapers, with record and replay modes.
+
+Every page, search and image request goes through `get`. With TRANSPORT_MODE
+set to 'record', each exchange (full body, status and headers, or the error
+raised) is kept and written to TRANSPORT_ARCHIVE when the process exits or
+`save` is called. Selenium sessions are recorded too (see
+`scraping.browser`), as the rendered DOM plus the elements the scraper read.
+With 'replay', the same requests are answered from the archive without
+network access or Chrome, so two versions of the scrapers and pipeline can be
+compared on identical inputs:
+
+    transport.use('record', 'corpus.zip')
+    analyze_url(url)
+    transport.save()
+
+    transport.use('replay', 'corpus.zip')
+    analyze_url(url)    # same pages, no network
+
+The archive is a zip file (LZMA-compressed). `index.json` maps each URL to its
+exchange, and the bodies are stored once per content hash under `bodies/`.
+Requests missing from the archive fail with `ReplayMiss`, a
+requests.ConnectionError, as an unreachable host would.
+
+With UPSTREAM_OVERRIDE set (e.g. to the load-test mock retailer,
+`loadtest/mock_retailer.py`), live requests go to `<override>/<host>/<path>`
+instead (`upstream_url`), so retailer traffic never leaves the machine.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import budget
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LIVE = 'live'
+RECORD = 'record'
+REPLAY = 'replay'
+
+ARCHIVE_VERSION = 1
+# Response headers kept in the archive
+KEPT_HEADERS = ('content-type', 'etag', 'last-modified')
+
+_lock = threading.Lock()
+_mode = None
+_archive = None
+
+
+def upstream_url(url):
+    """
+    Redirects a retailer URL to Config.UPSTREAM_OVERRIDE, if set.
+
+    'https://www.amazon.in/dp/B08MVGF24M?th=1' becomes
+    '<override>/www.amazon.in/dp/B08MVGF24M?th=1'. Without an override, or for
+    non-HTTP URLs, the URL is returned unchanged.
+    """
+    override = Config.UPSTREAM_OVERRIDE
+    if not override:
+        return url
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname or url.startswith(override):
+        return url
+    target = f'{override.rstrip("/")}/{parts.hostname}{parts.path or "/"}'
+    return f'{target}?{parts.query}' if parts.query else target
+
+
+class ReplayMiss(requests.ConnectionError):
+    """A replayed request that isn't in the archive."""
+
+
+class StoredResponse:
+    """A recorded response; has the parts of requests.Response the scrapers use."""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = get_encoding_from_headers(self.headers)
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Archive:
+    """Recorded HTTP exchanges and DOM snapshots, keyed by URL."""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = {'version': ARCHIVE_VERSION}
+        self.exchanges = {}
+        self.snapshots = {}
+        self._bodies = {}
+        self._lock = threading.Lock()
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        """Opens an archive; a missing file gives an empty one."""
+        archive = cls(path)
+        if not os.path.exists(path):
+            return archive
+        with zipfile.ZipFile(path) as zf:
+            index = json.loads(zf.read('index.json'))
+            if index.get('meta', {}).get('version') != ARCHIVE_VERSION:
+                raise ValueError(f'Unsupported archive version in {path}')
+            archive.meta = index['meta']
+            archive.exchanges = index['exchanges']
+            archive.snapshots = index['snapshots']
+            for name in zf.namelist():
+                if name.startswith('bodies/'):
+                    archive._bodies[name[len('bodies/'):]] = zf.read(name)
+        return archive
+
+    def _put_body(self, body):
+        digest = hashlib.sha256(body).hexdigest()
+        self._bodies.setdefault(digest, body)
+        return digest
+
+    def add_response(self, url, response, elapsed):
+        """Records a response (the first one per URL is kept)."""
+        with self._lock:
+            if url in self.exchanges:
+                return
+            self.exchanges[url] = {
+                'status': response.status_code,
+                'url': response.url,
+                'headers': {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+                'body': self._put_body(response.content),
+                'elapsed': round(elapsed, 3),
+            }
+            self.dirty = True
+
+    def add_error(self, url, error, elapsed):
+        """Records a failed request, replayed by raising the same exception type."""
+        with self._lock:
+            if url in self.exchanges:
+                return
+            self.exchanges[url] = {'error': type(error).__name__, 'message': str(error), 'elapsed': round(elapsed, 3)}
+            self.dirty = True
+
+    def add_snapshot(self, url, page_source, elements):
+        """
+        Records a Selenium page.
+
+        Args:
+            url (str): URL passed to driver.get.
+            page_source (str): The rendered DOM.
+            elements (dict): '<by>=<value>' -> {'text': ..., 'attrs': {...}}
+                             for every element the scraper looked up, or None
+                             if it wasn't found.
+        """
+        with self._lock:
+            self.snapshots[url] = {'dom': self._put_body(page_source.encode('utf-8')), 'elements': elements}
+            self.dirty = True
+
+    def response(self, url):
+        """
+        Replays the exchange recorded for `url`.
+
+        Raises:
+            ReplayMiss: If the URL wasn't recorded.
+            requests.RequestException: The error recorded for it.
+        """
+        entry = self.exchanges.get(url)
+        if entry is None:
+            raise ReplayMiss(f'Not in the archive: {url}')
+        if 'error' in entry:
+            error_type = getattr(requests.exceptions, entry['error'], requests.ConnectionError)
+            raise error_type(entry['message'])
+        return StoredResponse(entry['url'], entry['status'], entry['headers'], self._bodies[entry['body']])
+
+    def snapshot(self, url):
+        """Returns (dom, elements) recorded for a Selenium page, or None."""
+        entry = self.snapshots.get(url)
+        if entry is None:
+            return None
+        return self._bodies[entry['dom']].decode('utf-8'), entry['elements']
+
+    def save(self):
+        """Writes the archive (atomically) if anything was recorded."""
+        with self._lock:
+            if not self.dirty:
+                return
+            index = {'meta': self.meta, 'exchanges': self.exchanges, 'snapshots': self.snapshots}
+            tmp = f'{self.path}.tmp'
+            with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_LZMA) as zf:
+                zf.writestr('index.json', json.dumps(index, indent=1, sort_keys=True))
+                for digest, body in sorted(self._bodies.items()):
+                    zf.writestr(f'bodies/{digest}', body)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        logger.info(f'Saved {len(self.exchanges)} exchanges and {len(self.snapshots)} DOM snapshots to {self.path}')
+
+
+def use(mode, path=None):
+    """
+    Switches the transport mode for the whole process.
+
+    Args:
+        mode (str): 'live', 'record' or 'replay'.
+        path (str): Archive path, defaults to Config.TRANSPORT_ARCHIVE.
+
+    Returns:
+        Archive: The archive in use (None when live). Recording into an
+                 existing archive adds to it.
+    """
+    global _mode, _archive
+    if mode not in (LIVE, RECORD, REPLAY):
+        raise ValueError(f'Unknown transport mode: {mode}')
+    path = path or Config.TRANSPORT_ARCHIVE
+    if mode == REPLAY and not os.path.exists(path):
+        raise FileNotFoundError(f'No archive to replay at {path}')
+    with _lock:
+        if _archive is not None and _mode == RECORD:
+            _archive.save()
+        _mode = mode
+        _archive = Archive.load(path) if mode != LIVE else None
+        return _archive
+
+
+def mode():
+    """The current mode, initialised from Config.TRANSPORT_MODE."""
+    if _mode is None:
+        use(Config.TRANSPORT_MODE or LIVE)
+    return _mode
+
+
+def archive():
+    """The archive being recorded or replayed (None when live)."""
+    mode()
+    return _archive
+
+
+def save():
+    """Writes the archive being recorded."""
+    if _mode == RECORD and _archive is not None:
+        _archive.save()
+
+
+def get(url, headers=None, timeout=10, stream=False):
+    """
+    GETs a URL through the current transport.
+
+    Args:
+        url (str): Retailer URL (redirected by UPSTREAM_OVERRIDE when live).
+        headers (dict): Request headers.
+        timeout (float): As for requests.get.
+        stream (bool): As for requests.get; recorded and replayed responses
+                       are always held in memory.
+
+    Returns:
+        requests.Response or StoredResponse
+
+    Raises:
+        requests.Timeout: Without sending anything, if the request's time
+                          budget (see budget.py) is used up.
+    """
+    try:
+        timeout = budget.cap(timeout)
+    except budget.BudgetExhausted as e:
+        raise requests.Timeout(f'{e} before GET {url}') from e
+    current = mode()
+    if current == REPLAY:
+        return _archive.response(url)
+    if current == LIVE:
+        return requests.get(upstream_url(url), headers=headers, timeout=timeout, stream=stream)
+    start = time.perf_counter()
+    try:
+        resp = requests.get(upstream_url(url), headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        _archive.add_error(url, e, time.perf_counter() - start)
+        raise
+    stored = StoredResponse(resp.url if upstream_url(url) == url else url, resp.status_code,
+                            dict(resp.headers), resp.content)
+    _archive.add_response(url, stored, time.perf_counter() - start)
+    return stored
+
+
+def pause(seconds):
+    """Politeness delay between requests to a retailer; skipped when replaying, cut short by the time budget."""
+    if mode() != REPLAY:
+        left = budget.remaining()
+        time.sleep(seconds if left is None else max(0.0, min(seconds, left)))
+
+
+atexit.register(save)
@@ -1,206 +1,259 @@
+import logging
+
 import requests
 from bs4 import BeautifulSoup
 import re
+from urllib.parse import unquote, urlparse
 from rapidfuzz import fuzz
 
+from config import Config
+from scraping.http_client import fetch_html
+from scraping.routing import SourceRouter
+
+logger = logging.getLogger(__name__)
+
+# Path segments that never describe the product
+SLUG_STOPWORDS = {'dp', 'p', 'gp', 'product', 'products', 'item', 'items', 'buy', 'shop', 'detail', 'details', 'pd'}
+
 
-def search_trusted_sources(query):
+def query_from_url(url):
     """
-    Searches trusted e-commerce sources for a given product query and returns
-    the best matching product based on fuzzy title matching.
+    Derives a search query from the product slug in a URL.
+
+    Picks the path segment with the most words, e.g.
+    '/Logitech-G304-Lightspeed-Lightweight-Programmable/dp/B07QXV6N1B' gives
+    'Logitech G304 Lightspeed Lightweight Programmable'.
 
     Args:
-        query (str): The product query string.
+        url (str): Product page URL.
 
     Returns:
-        list: A list containing a dictionary of the best matching product
-              information, or a list with a "No Match Found" entry if no
-              suitable product is found.
+        str: The query, or '' if no segment looks like a product name.
     """
-    # Collect all products from all sources
+    best = []
+    for segment in urlparse(url).path.split('/'):
+        segment = re.sub(r'\.(html?|php|aspx?)$', '', unquote(segment), flags=re.IGNORECASE)
+        if segment.lower() in SLUG_STOPWORDS or '=' in segment:
+            continue
+        words = [w for w in re.split(r'[-_+\s]+', segment) if w]
+        # Skip IDs such as ASINs or numeric SKUs
+        words = [w for w in words if not re.fullmatch(r'[A-Z0-9]{10}|\d{5,}|[a-z]+\d{5,}[a-z0-9]*', w)]
+        if len(words) >= 2 and len(words) > len(best):
+            best = words
+    return ' '.join(best)
+
+
+def _search_amazon(query):
+    """Searches Amazon India, returning every listing on the first results page."""
     products = []
+    # Construct the search URL for Amazon India
+    search_url = f'https://www.amazon.in/s?k={requests.utils.quote(query)}'
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+    resp = fetch_html(search_url, headers=headers, timeout=10)
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    for product in soup.find_all('div', {'data-component-type': 's-search-result'}):
+        # Extract product title
+        title = product.h2.get_text(strip=True) if product.h2 else ''
+        # Extract product link
+        link = product.h2.a['href'] if product.h2 and product.h2.a else ''
+        # Extract product price
+        price = product.find('span', {'class': 'a-price-whole'})
+        price = price.get_text(strip=True).replace(',', '') if price else ''
+        # Extract product image URL
+        img = product.find('img', {'class': 's-image'})
+        images = [img['src']] if img else []
+        seller = 'Amazon Seller'
 
-    # --- Amazon India Search ---
-    try:
-        # Construct the search URL for Amazon India
-        search_url = f'https://www.amazon.in/s?k={requests.utils.quote(query)}'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        resp = requests.get(search_url, headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        for product in soup.find_all('div', {'data-component-type': 's-search-result'}):
-            # Extract product title
-            title = product.h2.get_text(strip=True) if product.h2 else ''
-            # Extract product link
-            link = product.h2.a['href'] if product.h2 and product.h2.a else ''
-            # Extract product price
-            price = product.find('span', {'class': 'a-price-whole'})
-            price = price.get_text(strip=True).replace(',', '') if price else ''
-            # Extract product image URL
-            img = product.find('img', {'class': 's-image'})
-            images = [img['src']] if img else []
-            seller = 'Amazon Seller'
-
-            # Append the extracted product information to the products list
-            # Note: Description is not easily available on search results, so it's left empty.
-            products.append({
-                'source': 'Amazon India',
-                'title': title,
-                'description': '',
-                'price': price,
-                'images': images,
-                'seller': seller,
-                'url': f'https://www.amazon.in{link}' if link else ''
-            })
-    except Exception as e:
-        # Log any errors encountered during Amazon scraping
-        print(f'Amazon search error: {e}')
-
-    # --- Flipkart Search ---
-    try:
-        # Construct the search URL for Flipkart
-        search_url = f'https://www.flipkart.com/search?q={requests.utils.quote(query)}'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        resp = requests.get(search_url, headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        # Find the first product listing
-        product = soup.find('div', {'class': '_1AtVbE'})
-        if product:
-            # Extract product title
-            title = product.find('div', {'class': '_4rR01T'})
-            title = title.get_text(strip=True) if title else ''
-            # Extract product link
-            link = product.find('a', {'class': '_1fQZEK'})
-            link = link['href'] if link else ''
-            # Extract product price
-            price = product.find('div', {'class': '_30jeq3 _1_WHN1'})
-            price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
-            img = product.find('img', {'class': '_396cs4'})
-            images = [img['src']] if img else []
-            seller = 'Flipkart Seller'
-            products.append({
-                'source': 'Flipkart',
-                'title': title,
-                'description': '',
-                'price': price,
-                'images': images,
-                'seller': seller,
-                'url': f'https://www.flipkart.com{link}' if link else ''
-            })
-    except Exception as e:
-        # Log any errors encountered during Flipkart scraping
-        print(f'Flipkart search error: {e}')
-
-    # --- Snapdeal Search ---
-    try:
-        # Construct the search URL for Snapdeal
-        search_url = f'https://www.snapdeal.com/search?keyword={requests.utils.quote(query)}'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        resp = requests.get(search_url, headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        # Find the first product listing
-        product = soup.find('div', {'class': 'product-tuple-listing'})
-        if product:
-            # Extract product title
-            title = product.find('p', {'class': 'product-title'})
-            title = title.get_text(strip=True) if title else ''
-            # Extract product link
-            link = product.find('a', {'class': 'dp-widget-link'})
-            link = link['href'] if link else ''
-            # Extract product price
-            price = product.find('span', {'class': 'lfloat product-price'})
-            price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
-            img = product.find('img', {'class': 'product-image'})
-            images = [img['src']] if img else []
-            seller = 'Snapdeal Seller'
-            products.append({
-                'source': 'Snapdeal',
-                'title': title,
-                'description': '',
-                'price': price,
-                'images': images,
-                'seller': seller,
-                'url': link
-            })
-    except Exception as e:
-        # Log any errors encountered during Snapdeal scraping
-        print(f'Snapdeal search error: {e}')
-
-    # --- Tata Cliq Search ---
-    try:
-        # Construct the search URL for Tata Cliq
-        search_url = f'https://www.tatacliq.com/search/?searchCategory=all&text={requests.utils.quote(query)}'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        resp = requests.get(search_url, headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        # Find the first product listing
-        product = soup.find('div', {'class': 'ProductModule__productModule'})
-        if product:
-            # Extract product title
-            title = product.find('h2', {'class': 'ProductModule__productName'})
-            title = title.get_text(strip=True) if title else ''
-            # Extract product link
-            link = product.find('a', {'class': 'ProductModule__productLink'})
-            link = 'https://www.tatacliq.com' + link['href'] if link and link.has_attr('href') else ''
-            # Extract product price
-            price = product.find('div', {'class': 'ProductModule__price'})
-            price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
-            img = product.find('img', {'class': 'ProductModule__img'})
-            images = [img['src']] if img else []
-            seller = 'Tata Cliq Seller'
-            products.append({
-                'source': 'Tata Cliq',
-                'title': title,
-                'description': '',
-                'price': price,
-                'images': images,
-                'seller': seller,
-                'url': link
-            })
-    except Exception as e:
-        # Log any errors encountered during Tata Cliq scraping
-        print(f'Tata Cliq search error: {e}')
-
-    # --- Reliance Digital Search ---
-    try:
-        # Construct the search URL for Reliance Digital
-        search_url = f'https://www.reliancedigital.in/search?q={requests.utils.quote(query)}:relevance'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        resp = requests.get(search_url, headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        # Find the first product listing
-        product = soup.find('div', {'class': 'sp grid'})
-        if product:
-            # Extract product title
-            title = product.find('p', {'class': 'sp__name'})
-            title = title.get_text(strip=True) if title else ''
-            # Extract product link
-            link = product.find('a', {'class': 'sp__product-link'})
-            link = 'https://www.reliancedigital.in' + link['href'] if link and link.has_attr('href') else ''
-            # Extract product price
-            price = product.find('span', {'class': 'sp__finalPrice'})
-            price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
-            img = product.find('img', {'class': 'sp__product-img'})
-            images = [img['src']] if img else []
-            seller = 'Reliance Digital'
-            products.append({
-                'source': 'Reliance Digital',
-                'title': title,
-                'description': '',
-                'price': price,
-                'images': images,
-                'seller': seller,
-                'url': link
-            })
-    except Exception as e:
-        # Log any errors encountered during Reliance Digital scraping
-        print(f'Reliance Digital search error: {e}')
-
-    # Fuzzy match to select best product
+        # Append the extracted product information to the products list
+        # Note: Description is not easily available on search results, so it's left empty.
+        products.append({
+            'source': 'Amazon India',
+            'title': title,
+            'description': '',
+            'price': price,
+            'images': images,
+            'seller': seller,
+            'url': f'https://www.amazon.in{link}' if link else ''
+        })
+    return products
+
+
+def _search_flipkart(query):
+    """Searches Flipkart, returning its first listing."""
+    # Construct the search URL for Flipkart
+    search_url = f'https://www.flipkart.com/search?q={requests.utils.quote(query)}'
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+    resp = fetch_html(search_url, headers=headers, timeout=10, required=[('div', {'class': '_1AtVbE'})])
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    # Find the first product listing
+    product = soup.find('div', {'class': '_1AtVbE'})
+    if product:
+        # Extract product title
+        title = product.find('div', {'class': '_4rR01T'})
+        title = title.get_text(strip=True) if title else ''
+        # Extract product link
+        link = product.find('a', {'class': '_1fQZEK'})
+        link = link['href'] if link else ''
+        # Extract product price
+        price = product.find('div', {'class': '_30jeq3 _1_WHN1'})
+        price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
+        img = product.find('img', {'class': '_396cs4'})
+        images = [img['src']] if img else []
+        seller = 'Flipkart Seller'
+        return [{
+            'source': 'Flipkart',
+            'title': title,
+            'description': '',
+            'price': price,
+            'images': images,
+            'seller': seller,
+            'url': f'https://www.flipkart.com{link}' if link else ''
+        }]
+    return []
+
+
+def _search_snapdeal(query):
+    """Searches Snapdeal, returning its first listing."""
+    # Construct the search URL for Snapdeal
+    search_url = f'https://www.snapdeal.com/search?keyword={requests.utils.quote(query)}'
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+    resp = fetch_html(search_url, headers=headers, timeout=10, required=[('div', {'class': 'product-tuple-listing'})])
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    # Find the first product listing
+    product = soup.find('div', {'class': 'product-tuple-listing'})
+    if product:
+        # Extract product title
+        title = product.find('p', {'class': 'product-title'})
+        title = title.get_text(strip=True) if title else ''
+        # Extract product link
+        link = product.find('a', {'class': 'dp-widget-link'})
+        link = link['href'] if link else ''
+        # Extract product price
+        price = product.find('span', {'class': 'lfloat product-price'})
+        price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
+        img = product.find('img', {'class': 'product-image'})
+        images = [img['src']] if img else []
+        seller = 'Snapdeal Seller'
+        return [{
+            'source': 'Snapdeal',
+            'title': title,
+            'description': '',
+            'price': price,
+            'images': images,
+            'seller': seller,
+            'url': link
+        }]
+    return []
+
+
+def _search_tata_cliq(query):
+    """Searches Tata Cliq, returning its first listing."""
+    # Construct the search URL for Tata Cliq
+    search_url = f'https://www.tatacliq.com/search/?searchCategory=all&text={requests.utils.quote(query)}'
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+    resp = fetch_html(search_url, headers=headers, timeout=10, required=[('div', {'class': 'ProductModule__productModule'})])
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    # Find the first product listing
+    product = soup.find('div', {'class': 'ProductModule__productModule'})
+    if product:
+        # Extract product title
+        title = product.find('h2', {'class': 'ProductModule__productName'})
+        title = title.get_text(strip=True) if title else ''
+        # Extract product link
+        link = product.find('a', {'class': 'ProductModule__productLink'})
+        link = 'https://www.tatacliq.com' + link['href'] if link and link.has_attr('href') else ''
+        # Extract product price
+        price = product.find('div', {'class': 'ProductModule__price'})
+        price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
+        img = product.find('img', {'class': 'ProductModule__img'})
+        images = [img['src']] if img else []
+        seller = 'Tata Cliq Seller'
+        return [{
+            'source': 'Tata Cliq',
+            'title': title,
+            'description': '',
+            'price': price,
+            'images': images,
+            'seller': seller,
+            'url': link
+        }]
+    return []
+
+
+def _search_reliance_digital(query):
+    """Searches Reliance Digital, returning its first listing."""
+    # Construct the search URL for Reliance Digital
+    search_url = f'https://www.reliancedigital.in/search?q={requests.utils.quote(query)}:relevance'
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+    resp = fetch_html(search_url, headers=headers, timeout=10, required=[('div', {'class': 'sp grid'})])
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    # Find the first product listing
+    product = soup.find('div', {'class': 'sp grid'})
+    if product:
+        # Extract product title
+        title = product.find('p', {'class': 'sp__name'})
+        title = title.get_text(strip=True) if title else ''
+        # Extract product link
+        link = product.find('a', {'class': 'sp__product-link'})
+        link = 'https://www.reliancedigital.in' + link['href'] if link and link.has_attr('href') else ''
+        # Extract product price
+        price = product.find('span', {'class': 'sp__finalPrice'})
+        price = price.get_text(strip=True).replace('₹', '').replace(',', '') if price else ''
+        img = product.find('img', {'class': 'sp__product-img'})
+        images = [img['src']] if img else []
+        seller = 'Reliance Digital'
+        return [{
+            'source': 'Reliance Digital',
+            'title': title,
+            'description': '',
+            'price': price,
+            'images': images,
+            'seller': seller,
+            'url': link
+        }]
+    return []
+
+
+# Search functions by source name; each returns the listings found (possibly none)
+SOURCES = {
+    'Amazon India': _search_amazon,
+    'Flipkart': _search_flipkart,
+    'Snapdeal': _search_snapdeal,
+    'Tata Cliq': _search_tata_cliq,
+    'Reliance Digital': _search_reliance_digital,
+}
+
+# Fuzzy title score of a matching listing
+MATCH_THRESHOLD = 0.4
+
+router = SourceRouter(list(SOURCES))
+
+
+def _search_sources(query, sources):
+    """
+    Queries some sources, one after another.
+
+    Returns:
+        dict: Source -> listings found, or None if the request failed.
+    """
+    results = {}
+    for source in sources:
+        try:
+            results[source] = SOURCES[source](query)
+        except Exception as e:
+            # Log any errors encountered during scraping
+            logger.warning(f'{source} search error: {e}')
+            results[source] = None
+    return results
+
+
+def best_match(query, products):
+    """The product whose title best matches the query, and its fuzzy score (None, 0 if there are none)."""
     best_score = 0
     best_product = None
     for p in products:
@@ -210,12 +263,60 @@ def search_trusted_sources(query):
         if score > best_score:
             best_score = score
             best_product = p
-    if best_product and best_score >= 0.4:
+    return best_product, best_score
+
+
+def _listings(results, sources=None):
+    return [p for source, products in results.items() if sources is None or source in sources for p in products or ()]
+
+
+def search_trusted_sources(query, routed=None):
+    """
+    Searches trusted e-commerce sources for a given product query and returns
+    the best matching product based on fuzzy title matching.
+
+    The query is routed to the sources likely to sell the product (see
+    scraping/routing.py), and widened to the others if none of them has a
+    match.
+
+    Args:
+        query (str): The product query string.
+        routed (bool): Route the search, defaults to Config.ROUTING_ENABLED;
+                       False queries every source.
+
+    Returns:
+        list: A list containing a dictionary of the best matching product
+              information, or a list with a "No Match Found" entry if no
+              suitable product is found.
+    """
+    routed = Config.ROUTING_ENABLED if routed is None else routed
+    route = router.route(query) if routed else None
+    if route is None or route.explore:
+        results = _search_sources(query, SOURCES)
+    else:
+        results = _search_sources(query, route.sources)
+    best_product, best_score = best_match(query, _listings(results))
+
+    if route is not None:
+        widened = False
+        if route.explore:
+            # What the route would have found: its sources, or all of them if those had no match
+            routed_match = best_match(query, _listings(results, route.sources))
+            router.record_exploration((best_product, best_score),
+                                      routed_match if routed_match[1] >= MATCH_THRESHOLD else (best_product, best_score))
+        elif best_score < MATCH_THRESHOLD and route.rest:
+            widened = True
+            results.update(_search_sources(query, route.rest))
+            best_product, best_score = best_match(query, _listings(results))
+        scores = {source: None if products is None else best_match(query, products)[1]
+                  for source, products in results.items()}
+        router.record(route, scores, len(results), widened, MATCH_THRESHOLD)
+
+    if best_product and best_score >= MATCH_THRESHOLD:
         best_product['fuzzy_score'] = best_score
         return [best_product]
     # If no match found, but the query is from a trusted domain, return a self-match
     trusted_domains = ['amazon.in', 'flipkart.com', 'tatacliq.com', 'reliancedigital.in', 'snapdeal.com', 'myntra.com', 'nykaa.com', 'adidas.co.in', 'nike.com', 'puma.com', 'reebok.in', 'ajio.com']
-    import re
     # If the query looks like a product title from a trusted domain, return a self-match
     for domain in trusted_domains:
         if domain in query.lower():
@@ -0,0 +1,190 @@
+"""
+Non-blocking logging for the web app.
+
+`configure_logging` installs a `QueueHandler` on the root logger. Request
+threads only snapshot the message and put the record on an in-memory queue.
+A `QueueListener` thread formats the records (as one JSON object per line by
+default) and writes them to a size-rotated file. DEBUG records are sampled,
+so enabling DEBUG in production keeps a representative fraction rather than
+every page dump.
+
+The listener thread doesn't survive a fork, so with gunicorn's preload mode
+each worker starts its own listener after forking (`os.register_at_fork`).
+A forked worker also writes to its own file, `app.<pid>.log` next to
+`app.log`: `RotatingFileHandler` can't rotate one file shared by processes
+(each rotates on its own view of the size, renaming the file under the
+others and overwriting their backups). The master keeps `app.log`. Merge the
+files by the `ts` field, or collect them with `app.*.log`.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import metrics
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_handler = None
+_settings = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object, including `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Lets through a fraction of DEBUG records and every record above DEBUG."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that does the minimum on the calling thread.
+
+    The message is rendered (its arguments may change after the call) but not
+    formatted; a full queue drops the record instead of blocking.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr('logging.dropped')
+
+
+def _process_log_file(log_file):
+    """The log file of this process: app.log becomes app.<pid>.log."""
+    root, ext = os.path.splitext(log_file)
+    return f'{root}.{os.getpid()}{ext}'
+
+
+def _file_handler(settings):
+    log_file = _process_log_file(settings['log_file']) if settings['per_process'] else settings['log_file']
+    handler = RotatingFileHandler(log_file, maxBytes=settings['max_bytes'],
+                                  backupCount=settings['backup_count'], encoding='utf-8', delay=True)
+    if settings['json']:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+    return handler
+
+
+def _start_listener():
+    global _listener
+    log_queue = queue.Queue(maxsize=_settings['queue_size'])
+    _handler.queue = log_queue
+    _listener = QueueListener(log_queue, _file_handler(_settings), respect_handler_level=True)
+    _listener.start()
+
+
+def _after_fork():
+    # The child writes to its own file. The parent's listener thread doesn't
+    # exist in the child; start a new one with a new queue (the old one may
+    # have been locked during the fork)
+    global _handler, _settings
+    if _handler is None:
+        return
+    _settings = dict(_settings, per_process=True)
+    if _settings['async']:
+        _start_listener()
+    else:
+        # Leave the parent's file handler (and its stream) to the parent
+        root = logging.getLogger()
+        root.removeHandler(_handler)
+        handler = _file_handler(_settings)
+        for log_filter in _handler.filters:
+            handler.addFilter(log_filter)
+        _handler = handler
+        root.addHandler(_handler)
+
+
+def configure_logging(log_file, level='INFO', json_format=True, async_mode=True, max_bytes=10 * 1024 * 1024,
+                      backup_count=5, debug_sample_rate=0.01, queue_size=10000):
+    """
+    Routes all loggers to a rotating log file, by default through a background thread.
+
+    Processes forked afterwards write to their own file (see the module docstring).
+
+    Args:
+        log_file (str): Log file path.
+        level (str): Root log level.
+        json_format (bool): Write one JSON object per line instead of plain text.
+        async_mode (bool): Write from a background thread; False writes in the
+                           calling thread (the old behaviour).
+        max_bytes (int): File size at which the log is rotated.
+        backup_count (int): Rotated files kept.
+        debug_sample_rate (float): Fraction of DEBUG records kept.
+        queue_size (int): Records buffered before new ones are dropped.
+    """
+    global _handler, _settings
+    with _lock:
+        stop_logging()
+        _settings = {'log_file': log_file, 'max_bytes': max_bytes, 'backup_count': backup_count,
+                     'json': json_format, 'async': async_mode, 'queue_size': queue_size, 'per_process': False}
+        if async_mode:
+            _handler = NonBlockingQueueHandler(queue.Queue())
+            _start_listener()
+        else:
+            _handler = _file_handler(_settings)
+        _handler.addFilter(DebugSampler(debug_sample_rate))
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level)
+
+
+def stop_logging():
+    """Flushes queued records, stops the listener and removes the handler."""
+    global _listener, _handler
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler.close()
+        _handler = None
+
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
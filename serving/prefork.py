@@ -0,0 +1,129 @@
+"""
+Helpers for the preloaded, pre-fork production launch mode (see gunicorn.conf.py).
+
+The models are loaded once in the gunicorn master. Forked workers then share
+their memory pages copy-on-write instead of each loading a private copy.
+Each worker's torch/BLAS thread pools are sized so that all workers together
+use the machine's cores without oversubscribing them.
+
+Per-worker memory report of a running server:
+
+    python -m serving.prefork <master pid>
+"""
+import gc
+import logging
+import os
+import sys
+from typing import Dict
+
+# Environment variables read by the native thread pools when they initialise.
+# They have to be set before numpy/torch are imported in the master.
+THREAD_ENV_VARS = [
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+]
+
+logger = logging.getLogger(__name__)
+
+
+def threads_per_worker(workers: int, cores: int = 0) -> int:
+    """Returns how many compute threads each worker may use without oversubscription."""
+    if not cores:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    return max(1, cores // max(1, workers))
+
+
+def limit_thread_env(threads: int) -> None:
+    """Caps the native thread pools via environment variables (call before importing numpy/torch)."""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    # Tokenizer threads would be forked in an unusable state
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+
+
+def freeze_heap() -> None:
+    """
+    Moves every object allocated so far into the GC's permanent generation.
+
+    Collections in the workers then never touch the GC headers of the preloaded
+    models, so those pages stay shared instead of being copied on first GC.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def configure_worker(threads: int) -> None:
+    """Sizes the thread pools of a freshly forked worker."""
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+    # onnxruntime sessions are not fork-safe, so the worker re-creates its own
+    text_similarity = sys.modules.get('analysis.text_similarity')
+    if text_similarity is not None and text_similarity.onnx_encoder is not None:
+        text_similarity.onnx_encoder.reset_session(num_threads=threads)
+
+
+def memory_report(pid: int = 0) -> Dict[str, float]:
+    """
+    Reads the memory breakdown of a process from /proc/<pid>/smaps_rollup.
+
+    Args:
+        pid (int): Process id, 0 for the current process.
+
+    Returns:
+        dict: Rss, Pss and shared/private clean/dirty sizes in MB. Pss divides
+              shared pages between the processes sharing them, so summing Pss over
+              all workers gives the real memory footprint.
+    """
+    path = f'/proc/{pid or "self"}/smaps_rollup'
+    fields = ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty']
+    report = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    report[key.lower() + '_mb'] = round(int(value.split()[0]) / 1024, 1)
+    except OSError as e:
+        logger.warning(f'Memory report unavailable for {path}: {e}')
+    return report
+
+
+def worker_pids(master_pid: int):
+    """Returns the pids of the direct children of the gunicorn master."""
+    pids = []
+    task_dir = f'/proc/{master_pid}/task'
+    for tid in os.listdir(task_dir):
+        try:
+            with open(os.path.join(task_dir, tid, 'children')) as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python -m serving.prefork <master pid>')
+        sys.exit(1)
+    master = int(sys.argv[1])
+    rows = [('master', master, memory_report(master))]
+    rows += [('worker', pid, memory_report(pid)) for pid in worker_pids(master)]
+    print(f'{"role":<8}{"pid":>8}{"rss MB":>10}{"pss MB":>10}{"shared MB":>11}{"private MB":>12}')
+    total_pss = 0.0
+    for role, pid, r in rows:
+        shared = r.get('shared_clean_mb', 0) + r.get('shared_dirty_mb', 0)
+        private = r.get('private_clean_mb', 0) + r.get('private_dirty_mb', 0)
+        total_pss += r.get('pss_mb', 0)
+        print(f'{role:<8}{pid:>8}{r.get("rss_mb", 0):>10}{r.get("pss_mb", 0):>10}{shared:>11.1f}{private:>12.1f}')
+    print(f'Total PSS: {total_pss:.1f} MB')
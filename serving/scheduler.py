@@ -0,0 +1,229 @@
+"""
+Admission scheduler for analysis work.
+
+Every /analyze request takes a slot before its pipeline runs:
+
+    with scheduler.slot(url, priority='bulk', client='rescan-job'):
+        result = analyze_url(url)
+
+At most SCHED_CONCURRENCY analyses run at once per worker, and at most
+SCHED_DOMAIN_LIMIT of them on one retailer domain. Waiting requests are
+admitted in two priority classes:
+
+- interactive (the web UI, the default) is always admitted first;
+- bulk (`X-Priority: bulk`) gets the remaining capacity, but always leaves
+  SCHED_INTERACTIVE_RESERVE slots free, both in total and per domain, so an
+  interactive request never waits for a long bulk analysis to finish.
+
+Within a class, clients share capacity by weighted fair queuing. Each waiting
+request gets a virtual finish time of `max(virtual clock, client's previous
+finish) + 1 / weight`, and the earliest one whose domain has room is admitted
+next. A client submitting a thousand URLs therefore doesn't starve one that
+submits ten. Weights come from SCHED_CLIENT_WEIGHTS; unknown clients get 1.
+Finish times are only kept while they can still matter (see `_prune`), so
+the free-form client ids don't accumulate.
+
+Limits are per worker process. With gunicorn, the total per domain is
+WEB_CONCURRENCY * SCHED_DOMAIN_LIMIT.
+
+Per class, `/stats` shows queue depth and running count (`stats()`). Wait times
+are recorded as the `scheduler.<class>.wait` timing, and the
+`scheduler.<class>.admitted`, `.rejected` and `.timed_out` counters track
+outcomes.
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class SchedulerBusy(Exception):
+    """The request wasn't admitted (queue full or wait timed out)."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def domain_of(url):
+    """The retailer domain a URL's work counts against ('www.' stripped)."""
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class _Ticket:
+    __slots__ = ('priority', 'client', 'domain', 'finish', 'seq', 'queued', 'admitted')
+
+    def __init__(self, priority, client, domain, finish, seq):
+        self.priority = priority
+        self.client = client
+        self.domain = domain
+        self.finish = finish
+        self.seq = seq
+        self.queued = time.perf_counter()
+        self.admitted = False
+
+
+class Scheduler:
+    """Admits analyses by priority class, client fairness and per-domain limits."""
+
+    def __init__(self, concurrency, domain_limit, interactive_reserve=1, client_weights=None,
+                 bulk_queue=64, wait_timeout=60):
+        """
+        Args:
+            concurrency (int): Analyses running at once.
+            domain_limit (int): Analyses running at once on one domain.
+            interactive_reserve (int): Slots bulk work leaves free, in total and per domain.
+            client_weights (dict): Client id -> share of capacity (default 1).
+            bulk_queue (int): Bulk requests allowed to wait; more are rejected.
+            wait_timeout (float): Seconds a request waits for a slot.
+        """
+        self.concurrency = concurrency
+        self.domain_limit = domain_limit
+        self.interactive_reserve = interactive_reserve
+        self.client_weights = client_weights or {}
+        self.bulk_queue = bulk_queue
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._domains = {}
+        # Per class: virtual clock and each client's last virtual finish time
+        self._clock = {priority: 0.0 for priority in PRIORITIES}
+        self._last_finish = {priority: {} for priority in PRIORITIES}
+        self._seq = itertools.count()
+
+    def _limits(self, priority):
+        if priority == INTERACTIVE:
+            return self.concurrency, self.domain_limit
+        return (max(1, self.concurrency - self.interactive_reserve),
+                max(1, self.domain_limit - self.interactive_reserve))
+
+    def _can_run(self, ticket):
+        total_limit, domain_limit = self._limits(ticket.priority)
+        running = sum(self._running.values())
+        return running < total_limit and self._domains.get(ticket.domain, 0) < domain_limit
+
+    def _dispatch(self):
+        """Admits waiting tickets in (class, virtual finish) order while capacity allows."""
+        admitted = False
+        for ticket in sorted(self._waiting, key=lambda t: (PRIORITIES.index(t.priority), t.finish, t.seq)):
+            if not self._can_run(ticket):
+                continue
+            ticket.admitted = True
+            self._waiting.remove(ticket)
+            self._running[ticket.priority] += 1
+            self._domains[ticket.domain] = self._domains.get(ticket.domain, 0) + 1
+            self._clock[ticket.priority] = max(self._clock[ticket.priority], ticket.finish - self._cost(ticket))
+            admitted = True
+        for priority in PRIORITIES:
+            self._prune(priority)
+        if admitted:
+            self._cond.notify_all()
+
+    def _prune(self, priority):
+        """
+        Forgets the finish times of clients with nothing waiting in a class.
+
+        A client whose last finish is at or below the virtual clock would start
+        at the clock anyway. When nothing waits, the clock moves up to the
+        latest finish, so a client that was busy before an idle spell isn't
+        queued behind new ones afterwards, and every client is forgotten.
+        """
+        last_finish = self._last_finish[priority]
+        waiting = {t.client for t in self._waiting if t.priority == priority}
+        if not waiting:
+            if last_finish:
+                self._clock[priority] = max(self._clock[priority], *last_finish.values())
+                last_finish.clear()
+            return
+        clock = self._clock[priority]
+        for client in [c for c, finish in last_finish.items() if finish <= clock and c not in waiting]:
+            del last_finish[client]
+
+    def _cost(self, ticket):
+        return 1.0 / self.client_weights.get(ticket.client, 1.0)
+
+    def _enqueue(self, priority, client, domain):
+        with self._cond:
+            if priority == BULK and sum(t.priority == BULK for t in self._waiting) >= self.bulk_queue:
+                metrics.incr(f'scheduler.{priority}.rejected')
+                raise SchedulerBusy('Too many bulk analyses queued', retry_after=max(1, int(self.wait_timeout / 4)))
+            start = max(self._clock[priority], self._last_finish[priority].get(client, 0.0))
+            finish = start + 1.0 / self.client_weights.get(client, 1.0)
+            self._last_finish[priority][client] = finish
+            ticket = _Ticket(priority, client, domain, finish, next(self._seq))
+            self._waiting.append(ticket)
+            self._dispatch()
+            deadline = time.monotonic() + self.wait_timeout
+            while not ticket.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    metrics.incr(f'scheduler.{priority}.timed_out')
+                    raise SchedulerBusy(f'No analysis slot within {self.wait_timeout:g}s', retry_after=5)
+                self._cond.wait(remaining)
+        metrics.observe(f'scheduler.{priority}.wait', time.perf_counter() - ticket.queued)
+        metrics.incr(f'scheduler.{priority}.admitted')
+        return ticket
+
+    def _release(self, ticket):
+        with self._cond:
+            self._running[ticket.priority] -= 1
+            self._domains[ticket.domain] -= 1
+            if not self._domains[ticket.domain]:
+                del self._domains[ticket.domain]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, url, priority=INTERACTIVE, client='anonymous'):
+        """
+        Waits for a slot to analyze `url` and holds it for the block.
+
+        Args:
+            url (str): The product URL (its domain is rate limited).
+            priority (str): 'interactive' or 'bulk'.
+            client (str): API client id, for fair queuing within the class.
+
+        Raises:
+            SchedulerBusy: If the bulk queue is full or no slot frees up in time.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+        ticket = self._enqueue(priority, client, domain_of(url))
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def stats(self):
+        """Queue depth and running analyses per class, and running analyses per domain."""
+        with self._cond:
+            return {
+                'classes': {priority: {
+                    'queued': sum(t.priority == priority for t in self._waiting),
+                    'running': self._running[priority],
+                } for priority in PRIORITIES},
+                'domains': dict(self._domains),
+            }
+
+
+scheduler = Scheduler(
+    concurrency=Config.SCHED_CONCURRENCY,
+    domain_limit=Config.SCHED_DOMAIN_LIMIT,
+    interactive_reserve=Config.SCHED_INTERACTIVE_RESERVE,
+    client_weights=Config.SCHED_CLIENT_WEIGHTS,
+    bulk_queue=Config.SCHED_BULK_QUEUE,
+    wait_timeout=Config.SCHED_WAIT_TIMEOUT,
+)